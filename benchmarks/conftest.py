@@ -0,0 +1,29 @@
+import os
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+# Synthetic cruise size. Increase to size hardware for real cruise volumes.
+# filter_evt_files distributes one hour windows of files to workers, so the
+# default of four hours of files gives each of up to 4 workers some work.
+file_count = int(os.environ.get("SEAFLOWPY_BENCH_FILES", "80"))
+events = int(os.environ.get("SEAFLOWPY_BENCH_EVENTS", "40000"))
+
+
+@pytest.fixture(scope="session")
+def cruise(tmp_path_factory):
+    outdir = str(tmp_path_factory.mktemp("cruise"))
+    return sfp.synthetic.cruise(outdir, file_count=file_count, events=events)
+
+
+@pytest.fixture(scope="session")
+def params():
+    params = sfp.synthetic.filter_params.copy()
+    params["id"] = "synthetic"
+    return params
+
+
+@pytest.fixture()
+def evt_df():
+    return sfp.synthetic.evt(events, seed=0)
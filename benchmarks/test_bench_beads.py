@@ -0,0 +1,12 @@
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.mark.benchmark(group="beads")
+def test_find_beads(benchmark):
+    # About one hour of EVT data at default event limit
+    evt_df = sfp.synthetic.evt(100000, seed=0)
+    results = benchmark.pedantic(sfp.beads.find_beads, args=(evt_df,), rounds=3)
+    assert results["message"] == ""
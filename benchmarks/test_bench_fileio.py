@@ -0,0 +1,49 @@
+import os
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.mark.benchmark(group="fileio-read")
+def test_read_evt_labview(cruise, benchmark):
+    path = [p for p in cruise["evt_files"] if not p.endswith(".gz")][0]
+    df = benchmark(sfp.fileio.read_evt_labview, path)
+    assert len(df.index) > 0
+
+
+@pytest.mark.benchmark(group="fileio-read")
+def test_read_evt_labview_gz(cruise, benchmark):
+    path = [p for p in cruise["evt_files"] if p.endswith(".gz")][0]
+    df = benchmark(sfp.fileio.read_evt_labview, path)
+    assert len(df.index) > 0
+
+
+@pytest.mark.benchmark(group="fileio-read")
+def test_read_opp_labview_gz(cruise, benchmark):
+    path = sfp.seaflowfile.find_evt_files(cruise["opp_dir"], opp=True)[0]
+    df = benchmark(sfp.fileio.read_opp_labview, path)
+    assert len(df.index) > 0
+
+
+@pytest.mark.benchmark(group="fileio-write")
+def test_write_opp_parquet(cruise, params, tmp_path, benchmark):
+    # One hour of OPP data, as written by filter_evt_files
+    opp_dfs = []
+    for i, path in enumerate(cruise["evt_files"][:20]):
+        evt_df = sfp.fileio.read_evt_labview(path)
+        opp_df = sfp.particleops.select_focused(sfp.particleops.mark_focused(evt_df, params))
+        opp_df["date"] = sfp.time.parse_date("2014-07-04T00:00:00+00:00")
+        opp_df["file_id"] = sfp.seaflowfile.parse(path).file_id
+        opp_df["filter_id"] = params["id"][0]
+        opp_dfs.append(opp_df)
+    date = opp_dfs[0]["date"].iloc[0]
+    rounds = iter(range(1000))
+
+    def setup():
+        # Write to a new directory each round, otherwise the file is merged
+        # with the previous round's output
+        return (opp_dfs, date, "1H", str(tmp_path / str(next(rounds)))), {}
+
+    benchmark.pedantic(sfp.fileio.write_opp_parquet, setup=setup, rounds=5)
+    assert os.listdir(str(tmp_path / "0"))
@@ -0,0 +1,25 @@
+import shutil
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.mark.benchmark(group="filterevt")
+@pytest.mark.parametrize("worker_count", [1, 2, 4])
+def test_filter_evt_files(cruise, worker_count, tmp_path, benchmark):
+    files_df = sfp.seaflowfile.date_evt_files(
+        cruise["evt_files"],
+        sfp.db.get_sfl_table(cruise["db"])
+    )
+    rounds = iter(range(1000))
+
+    def setup():
+        # Fresh database and output directory for each round
+        i = next(rounds)
+        dbpath = str(tmp_path / f"{i}.db")
+        shutil.copyfile(cruise["db"], dbpath)
+        return (files_df, dbpath, str(tmp_path / f"{i}_opp")), {"worker_count": worker_count}
+
+    benchmark.pedantic(sfp.filterevt.filter_evt_files, setup=setup, rounds=3)
+    assert len(sfp.db.get_opp_table(str(tmp_path / "0.db"))) == len(files_df) * 3
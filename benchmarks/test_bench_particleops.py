@@ -0,0 +1,23 @@
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.mark.benchmark(group="particleops")
+def test_mark_focused(evt_df, params, benchmark):
+    df = benchmark(sfp.particleops.mark_focused, evt_df, params)
+    assert df["q50"].any()
+
+
+@pytest.mark.benchmark(group="particleops")
+def test_select_focused(evt_df, params, benchmark):
+    marked = sfp.particleops.mark_focused(evt_df, params)
+    df = benchmark(sfp.particleops.select_focused, marked)
+    assert len(df.index) > 0
+
+
+@pytest.mark.benchmark(group="particleops")
+def test_roughfilter(evt_df, benchmark):
+    df = benchmark(sfp.particleops.roughfilter, evt_df)
+    assert len(df.index) > 0
@@ -0,0 +1,14 @@
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.mark.benchmark(group="sample")
+def test_sample(cruise, tmp_path, benchmark):
+    outpath = str(tmp_path / "sample.parquet")
+    results, errs = benchmark(
+        sfp.sample.sample, cruise["evt_files"], 10000, outpath, seed=1
+    )
+    assert not errs
+    assert sum(r["events_postsampling"] for r in results) > 0
@@ -0,0 +1,29 @@
+import datetime
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture(scope="module")
+def sfl_df(tmp_path_factory):
+    # About one month of 3 minute files
+    n = 15000
+    start = datetime.datetime(2014, 7, 4, 0, 0, 2, tzinfo=datetime.timezone.utc)
+    dates = [start + datetime.timedelta(minutes=3 * i) for i in range(n)]
+    file_ids = [
+        "{}/{}".format(
+            sfp.seaflowfile.create_dayofyear_directory(d),
+            d.strftime("%Y-%m-%dT%H-%M-%S+00-00")
+        )
+        for d in dates
+    ]
+    path = str(tmp_path_factory.mktemp("sfl") / "month.sfl")
+    sfp.sfl.save_to_file(sfp.synthetic.sfl_df(file_ids, dates, [40000] * n, seed=0), path)
+    return sfp.sfl.read_file(path)
+
+
+@pytest.mark.benchmark(group="sfl")
+def test_sfl_check(sfl_df, benchmark):
+    errors = benchmark(sfp.sfl.check, sfl_df)
+    assert len(errors) == 0
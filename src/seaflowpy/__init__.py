@@ -1,17 +1,43 @@
-from . import beads
-from . import clouds
-from . import conf
-from . import db
-from . import errors
-from . import fileio
-from . import filterevt
-from . import geo
-from . import particleops
-from . import sample
-from . import sfl
-from . import time
-from . import util
+import importlib
 
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+# Submodules are imported on first attribute access rather than here. Some of
+# them pull in slow dependencies (e.g. hdbscan and matplotlib for beads, boto3
+# for clouds) which most CLI commands and worker processes never use.
+_submodules = {
+    "beads",
+    "bench",
+    "classify",
+    "clouds",
+    "conf",
+    "cytogram",
+    "db",
+    "errors",
+    "fileio",
+    "filterevt",
+    "geo",
+    "particleops",
+    "psd",
+    "sample",
+    "seaflowfile",
+    "service",
+    "service_client",
+    "sfl",
+    "sketch",
+    "synthetic",
+    "time",
+    "util",
+}
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+    if name == "__version__":
+        from ._version import get_versions
+        globals()["__version__"] = get_versions()["version"]
+        return globals()["__version__"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | _submodules | {"__version__"})
@@ -1,14 +1,20 @@
+import hashlib
+import json
 import logging
 import os
 import pathlib
+import tempfile
+import zipfile
 import hdbscan
 import matplotlib as mpl
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
 from kern_smooth import densCols
 from matplotlib.collections import LineCollection
+from scipy.ndimage import gaussian_filter
 from scipy.spatial import ConvexHull  # pylint: disable=no-name-in-module
 from seaflowpy import errors
 from seaflowpy import fileio
@@ -16,7 +22,11 @@ from seaflowpy import particleops
 from seaflowpy import seaflowfile
 
 
-def cluster(df, columns, min_cluster_frac, min_points=50):
+# EVT columns needed for bead finding and cytogram plots
+bead_columns = ["date", "fsc_small", "pe", "D1", "D2", "chl_small"]
+
+
+def cluster(df, columns, min_cluster_frac, min_points=50, grid_bins=None, grid_points=5000):
     """
     Find a 2d cluster of points in df[columns] with HDBSCAN. Clustering has been
     tuned to work well for SeaFlow bead clusters.
@@ -32,6 +42,14 @@ def cluster(df, columns, min_cluster_frac, min_points=50):
         HDBSCAN's clusterer as min_cluster_size.
     min_points: int
         Raise errors.ClustererError if input dataframe has fewer than this many rows.
+    grid_bins: int, optional
+        If set, bin df[columns] on a grid_bins x grid_bins grid spanning the
+        range of the data and cluster bin centers instead of raw points. See
+        grid_aggregate(). Cluster membership is mapped back to the original
+        rows of df by bin index.
+    grid_points: int, default 5000
+        Approximate maximum number of weighted bin center points to cluster
+        when grid_bins is set.
 
     Returns
     -------
@@ -44,23 +62,46 @@ def cluster(df, columns, min_cluster_frac, min_points=50):
     """
     if len(df) < min_points:
         raise errors.ClusterError(f"< {min_points} to cluster on {columns}")
-    min_cluster_size = int(len(df) * min_cluster_frac)
+    values = df[columns].values
+    if grid_bins:
+        bin_idx, centers, weights = grid_aggregate(values, grid_bins, grid_points)
+        fit_values = np.repeat(centers, weights, axis=0)
+        # Keep the cluster size cutoff as a fraction of the original input,
+        # scaled to the weighted bin center point count.
+        scale = min(1.0, grid_points / len(df))
+        min_cluster_size = max(int(len(df) * scale * min_cluster_frac), 2)
+        if len(fit_values) < min_cluster_size:
+            raise errors.ClusterError(f"< {min_cluster_size} binned points to cluster on {columns}")
+    else:
+        fit_values = values
+        min_cluster_size = int(len(df) * min_cluster_frac)
     clusterer = hdbscan.HDBSCAN(
         min_cluster_size=min_cluster_size,
         allow_single_cluster=True,
         cluster_selection_method="eom",
-    ).fit(df[columns].values)
+    ).fit(fit_values)
     nclust = len(set(clusterer.labels_))
     if nclust > 2:
         raise errors.ClusterError(f"too many {columns} clusters found: {nclust}")
     if nclust == 0:
         raise errors.ClusterError(f"no {columns} clusters found")
 
+    if grid_bins:
+        # Label of each bin is the label of its first repeated center point.
+        # Bins with no weight were not clustered and count as noise.
+        bin_labels = np.full(len(weights), -1)
+        has_weight = weights > 0
+        starts = np.cumsum(weights) - weights
+        bin_labels[has_weight] = clusterer.labels_[starts[has_weight]]
+        labels = bin_labels[bin_idx]
+    else:
+        labels = clusterer.labels_
+
     # Get all points inside expanded cluster boundaries
-    idx = [i for i, x in enumerate(clusterer.labels_) if x >= 0]
+    idx = np.flatnonzero(labels >= 0)
     if len(idx) < 3:
         raise errors.ClusterError(f"{columns} cluster too small to find convex hull")
-    points = df.iloc[idx][columns].values
+    points = values[idx, :]
     try:
         hull = ConvexHull(points)
     except Exception as e:
@@ -81,6 +122,50 @@ def cluster(df, columns, min_cluster_frac, min_points=50):
     }
 
 
+def grid_aggregate(values, bins, max_points):
+    """
+    Aggregate 2d points into weighted bin centers.
+
+    The grid has bins x bins cells and spans the range of each column of
+    values, so grid resolution adapts to the spread of the data. Each occupied
+    cell is represented by its center point with a weight proportional to the
+    number of points in the cell, scaled so that the sum of weights is at most
+    about max_points. Cells whose scaled weight rounds to 0 are sparse enough
+    that HDBSCAN would label them as noise and get a weight of 0.
+
+    Parameters
+    ----------
+    values: 2d numpy array
+        Points to aggregate, one row per point and two columns.
+    bins: int
+        Number of grid cells along each axis.
+    max_points: int
+        Approximate maximum sum of weights.
+
+    Returns
+    -------
+    tuple of (bin_idx, centers, weights)
+        bin_idx is the index into centers and weights for each row of values.
+        centers is a 2d array of occupied cell centers. weights is an integer
+        array of center point weights.
+    """
+    lo = values.min(axis=0)
+    hi = values.max(axis=0)
+    width = (hi - lo) / bins
+    width[width == 0] = 1  # all points in the same cell along this axis
+    cell = np.floor((values - lo) / width).astype(np.int64)
+    cell = np.clip(cell, 0, bins - 1)
+    flat = cell[:, 0] * bins + cell[:, 1]
+    uniq, bin_idx, counts = np.unique(flat, return_inverse=True, return_counts=True)
+    centers = np.column_stack([
+        lo[0] + ((uniq // bins) + 0.5) * width[0],
+        lo[1] + ((uniq % bins) + 0.5) * width[1],
+    ])
+    scale = min(1.0, max_points / len(values))
+    weights = np.rint(counts * scale).astype(np.int64)
+    return bin_idx, centers, weights
+
+
 def quantiles(a, q_levels):
     """Return tuple of quantiles q_levels for a."""
     qs = [np.quantile(a, q) for q in q_levels]
@@ -189,7 +274,8 @@ def round_(x, prec=0):
     return float("{1:.{0}f}".format(prec, x))
 
 
-def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000):
+def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000,
+               grid_bins=None, grid_points=5000):
     """
     Find bead coordinates with DBSCAN clustering.
 
@@ -205,6 +291,12 @@ def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000):
     min_pe: int, default 45000
         PE minimum cutoff to use when identifying beads clusters. This number
         should be large enough to eliminate other common large clusters.
+    grid_bins: int, optional
+        If set, pre-aggregate points on a grid_bins x grid_bins grid before
+        clustering. See cluster().
+    grid_points: int, default 5000
+        Approximate maximum number of weighted points to cluster when
+        grid_bins is set. See cluster().
 
     Returns
     -------
@@ -241,7 +333,10 @@ def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000):
     pe_q = np.full(len(q_levels), np.nan)
     pe_center = None
     try:
-        clust_fsc_pe = cluster(initial_source, columns, min_cluster_frac=min_cluster_frac)
+        clust_fsc_pe = cluster(
+            initial_source, columns, min_cluster_frac=min_cluster_frac,
+            grid_bins=grid_bins, grid_points=grid_points
+        )
         # Get all points inside cluster boundaries
         idx = points_in_polygon(clust_fsc_pe["hull_points"], final_source[columns].values)
         if len(idx) == 0:
@@ -266,7 +361,10 @@ def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000):
         intial_source = pe_df  # data for clusterer
         final_source = pe_df  # source of final cluster points
         try:
-            clust_fsc_d1 = cluster(intial_source, columns, min_cluster_frac=min_cluster_frac)
+            clust_fsc_d1 = cluster(
+                intial_source, columns, min_cluster_frac=min_cluster_frac,
+                grid_bins=grid_bins, grid_points=grid_points
+            )
             # Get all points inside cluster boundaries
             idx = points_in_polygon(clust_fsc_d1["hull_points"], final_source[columns].values)
             if len(idx) == 0:
@@ -290,7 +388,10 @@ def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000):
         intial_source = pe_df  # data for clusterer
         final_source = pe_df  # source of final cluster points
         try:
-            clust_fsc_d2 = cluster(intial_source, columns, min_cluster_frac=min_cluster_frac)
+            clust_fsc_d2 = cluster(
+                intial_source, columns, min_cluster_frac=min_cluster_frac,
+                grid_bins=grid_bins, grid_points=grid_points
+            )
             # Get all points inside cluster boundaries
             idx = points_in_polygon(clust_fsc_d2["hull_points"], final_source[columns].values)
             if len(idx) == 0:
@@ -352,7 +453,144 @@ def find_beads(evt_df, min_cluster_frac=0.33, min_fsc=40000, min_pe=45000):
     }
 
 
-def plot(b, plot_file, file_id=None, otherip=None):
+class BeadCache:
+    """
+    Content-addressed on-disk cache of find_beads results.
+
+    Entries are keyed by cache_key() and hold bead coordinates, convex hull
+    points for each bead cluster, and any clustering error message. Each entry
+    is one .npz file in cache_dir. When the total size of entries exceeds
+    max_bytes the least recently used entries are removed.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Cache directory. Will be created if necessary.
+    max_bytes: int, default 256 MiB
+        Maximum total size of cache entries.
+    """
+
+    suffix = ".beads.npz"
+
+    def __init__(self, cache_dir, max_bytes=256 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        pathlib.Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key):
+        """
+        Return cached results for key or None if not cached.
+
+        Returns
+        -------
+        dict
+            Subset of find_beads results with "bead_coordinates", "hull_points"
+            and "message" entries. "hull_points" is a dict of hull point arrays
+            (or None) by cluster name, e.g. "fsc_pe".
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                coords_df = pd.DataFrame(
+                    [data["coord_values"]], columns=data["coord_columns"].tolist()
+                )
+                hull_points = {}
+                for name in ["fsc_pe", "fsc_D1", "fsc_D2"]:
+                    points = data[f"hull_{name}"]
+                    hull_points[name] = points if len(points) else None
+                msg = str(data["message"])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, OSError, EOFError, zipfile.BadZipFile):
+            # Corrupt entry, e.g. empty or truncated by a full disk
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        os.utime(path)  # mark as recently used
+        return {
+            "bead_coordinates": coords_df,
+            "hull_points": hull_points,
+            "message": msg,
+        }
+
+    def put(self, key, results):
+        """Save find_beads results for key and evict old entries if needed."""
+        coords_df = results["bead_coordinates"]
+        arrays = {
+            "coord_columns": np.array(coords_df.columns, dtype=str),
+            "coord_values": coords_df.iloc[0].values.astype(np.float64),
+            "message": np.array(results["message"]),
+        }
+        for name in ["fsc_pe", "fsc_D1", "fsc_D2"]:
+            if "hull_points" in results:
+                points = results["hull_points"][name]
+            else:
+                res = results["cluster_results"][name]
+                points = res["hull_points"] if res is not None else None
+            if points is None:
+                points = np.empty((0, 2))
+            arrays[f"hull_{name}"] = points
+        # Write to a temp file and rename to make sure readers never see a
+        # partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                np.savez(fh, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum([e[1] for e in entries])
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def cache_key(evt_df, params):
+    """
+    Create a content hash for bead finding input data and parameters.
+
+    Parameters
+    ----------
+    evt_df: pandas.DataFrame
+        EVT particle data passed to find_beads.
+    params: dict
+        Bead finding parameters, e.g. min_cluster_frac, min_fsc, min_pe. Must
+        be JSON serializable.
+
+    Returns
+    -------
+    str
+        Hex digest.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for col in ["fsc_small", "pe", "D1", "D2"]:
+        h.update(np.ascontiguousarray(evt_df[col].values, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def plot(b, plot_file, file_id=None, otherip=None, density="hist"):
     """
     Create bead finding diagnostic plots.
 
@@ -366,7 +604,18 @@ def plot(b, plot_file, file_id=None, otherip=None):
         Plot file to write to. Any directory prefix will be created if necessary.
     otherip: pandas.DataFrame
          Other inflection point data to be compared against bead finding results.
+    density: str, default "hist"
+        Density coloring engine for scatter plots. "hist" uses a smoothed 2d
+        histogram (plot_densities_hist), "densCols" uses kern_smooth.densCols
+        (plot_densities_densCols), which is much slower.
     """
+    if density == "hist":
+        plot_densities = plot_densities_hist
+    elif density == "densCols":
+        plot_densities = plot_densities_densCols
+    else:
+        raise ValueError(f"unknown density engine {density}")
+
     plot_dir = os.path.dirname(plot_file)
     pathlib.Path(plot_dir).mkdir(parents=True, exist_ok=True)
 
@@ -406,7 +655,7 @@ def plot(b, plot_file, file_id=None, otherip=None):
     df = b["df"]["evt"]
     x, y = df["fsc_small"].head(npoints), df["pe"].head(npoints)
     center = b["centers"]["fsc_pe"]
-    plot_densities_densCols(thisax, x, y, nbin=nbin, **dens_opts)
+    plot_densities(thisax, x, y, nbin=nbin, **dens_opts)
     plot_cutoffs(b["fsc_min"], b["pe_min"], thisax)
     if coords["fsc_small_count"].sum():
         legend_handles = []
@@ -445,7 +694,7 @@ def plot(b, plot_file, file_id=None, otherip=None):
     thisax.set_ylabel("CHL")
     df = b["df"]["evt"]
     x, y = df["fsc_small"].head(npoints), df["chl_small"].head(npoints)
-    plot_densities_densCols(thisax, x, y, nbin=nbin, **dens_opts)
+    plot_densities(thisax, x, y, nbin=nbin, **dens_opts)
     plot_cutoffs(b["fsc_min"], None, thisax)
 
     if coords["fsc_small_count"].sum():
@@ -476,7 +725,7 @@ def plot(b, plot_file, file_id=None, otherip=None):
     df = b["df"]["rough_opp"]
     x, y = df["fsc_small"].head(npoints), df["pe"].head(npoints)
     center = b["centers"]["fsc_pe"]
-    plot_densities_densCols(thisax, x, y, nbin=nbin, **dens_opts)
+    plot_densities(thisax, x, y, nbin=nbin, **dens_opts)
     plot_cutoffs(b["fsc_min"], b["pe_min"], thisax)
     if coords["fsc_small_count"].sum():
         legend_handles = []
@@ -523,7 +772,7 @@ def plot(b, plot_file, file_id=None, otherip=None):
     plot_cutoffs(b["fsc_min"], b["pe_min"], thisax)
     df = b["df"]["opp_top"]  # particles for clustering
     x, y = df["fsc_small"].head(npoints), df["pe"].head(npoints)
-    plot_densities_densCols(thisax, x, y, nbin=nbin, **dens_opts)
+    plot_densities(thisax, x, y, nbin=nbin, **dens_opts)
     if res is not None:
         # Plot convex hull of cluster
         plot_cluster(thisax, res["hull_points"], center)
@@ -571,7 +820,7 @@ def plot(b, plot_file, file_id=None, otherip=None):
     df = b["df"]["fsc_pe"]  # particles for clustering
     if len(df) > 0:
         x, y = df["fsc_small"].head(npoints), df["D1"].head(npoints)
-        plot_densities_densCols(thisax, x, y, nbin=nbin, **dens_opts)
+        plot_densities(thisax, x, y, nbin=nbin, **dens_opts)
     if res is not None:
         # Plot convex hull of cluster
         plot_cluster(thisax, res["hull_points"], center)
@@ -619,7 +868,7 @@ def plot(b, plot_file, file_id=None, otherip=None):
     df = b["df"]["fsc_pe"]  # particles for clustering
     if len(df) > 0:
         x, y = df["fsc_small"].head(npoints), df["D2"].head(npoints)
-        plot_densities_densCols(thisax, x, y, nbin=nbin, **dens_opts)
+        plot_densities(thisax, x, y, nbin=nbin, **dens_opts)
     if res is not None:
         # Plot convex hull of cluster
         plot_cluster(thisax, res["hull_points"], center)
@@ -694,6 +943,90 @@ def plot_densities_densCols(ax, x, y, **kwargs):
     ax.scatter(x, y, c=colors, **kwargs)
 
 
+def plot_densities_hist(ax, x, y, **kwargs):
+    """
+    Draw points as scatter plot colored by density.
+
+    This is a faster alternative to plot_densities_densCols. Densities are
+    looked up for each point in a smoothed 2d histogram created by
+    hist_density().
+
+    Parameters
+    ----------
+    ax: matplotlib.axis.Axis
+        Axis to draw on.
+    x, y: Iterables of x and y positions of points to draw
+
+    Keyword Arguments
+    -----------------
+    nbin: int
+        nbin parameter passed to hist_density.
+
+    Other keyword arguments will be passed to matplotlib.axis.Axis.scatter.
+    """
+    if (len(x) < 2) or (len(y) < 2):
+        return
+    nbin = kwargs.pop("nbin")
+    colors = hist_density(np.asarray(x), np.asarray(y), nbin=nbin)
+    ax.scatter(x, y, c=colors, **kwargs)
+
+
+def hist_density(x, y, nbin=300, bandwidth=None):
+    """
+    Estimate point densities from a smoothed 2d histogram.
+
+    Points are binned on an nbin x nbin grid spanning the range of the data.
+    The histogram is smoothed with a separable Gaussian filter and the density
+    for each point is looked up by bin index. Values returned are log10
+    densities scaled to [0, 1], as in kern_smooth.densCols.
+
+    Parameters
+    ----------
+    x, y: 1d numpy arrays
+        Point coordinates.
+    nbin: int, default 300
+        Number of bins along each axis.
+    bandwidth: tuple of (float, float), optional
+        Gaussian smoothing standard deviation for x and y in data units. The
+        default is the same as densCols, 1/25 of the range between the 5th and
+        95th percentiles of each axis.
+
+    Returns
+    -------
+    numpy.ndarray
+        Density of each point scaled to [0, 1]. NaN for non-finite points.
+    """
+    dens = np.full(len(x), np.nan)
+    select = np.isfinite(x) & np.isfinite(y)
+    x, y = x[select], y[select]
+    if len(x) == 0:
+        return dens
+    lo = np.array([x.min(), y.min()])
+    hi = np.array([x.max(), y.max()])
+    width = (hi - lo) / nbin
+    width[width == 0] = 1
+    if bandwidth is None:
+        bandwidth = (
+            np.diff(np.quantile(x, [0.05, 0.95]))[0] / 25,
+            np.diff(np.quantile(y, [0.05, 0.95]))[0] / 25
+        )
+    sigma = np.asarray(bandwidth, dtype=np.float64) / width
+    xbin = np.clip(((x - lo[0]) / width[0]).astype(np.int64), 0, nbin - 1)
+    ybin = np.clip(((y - lo[1]) / width[1]).astype(np.int64), 0, nbin - 1)
+    counts = np.zeros((nbin, nbin))
+    np.add.at(counts, (xbin, ybin), 1)
+    if np.any(sigma > 0):
+        counts = gaussian_filter(counts, sigma=sigma, mode="constant")
+    # Every point's bin is occupied, so densities are > 0
+    logdens = np.log10(counts[xbin, ybin])
+    spread = logdens.max() - logdens.min()
+    if spread > 0:
+        dens[select] = (logdens - logdens.min()) / spread
+    else:
+        dens[select] = 0
+    return dens
+
+
 def plot_cluster(ax, points, center):
     """
     Draw a cluster of points.
@@ -867,7 +1200,7 @@ def aggregate_evt_files(files, dates=None):
     dfs = []
     for f in files:
         try:
-            sff = seaflowfile.SeaFlowFile(f)
+            sff = seaflowfile.parse(f)
             file_id = sff.file_id
         except errors.FileError:
             sff = None
@@ -901,6 +1234,100 @@ def aggregate_evt_files(files, dates=None):
     return out_df
 
 
+def iter_evt_windows(path, resolution, min_date=None, max_date=None, columns=None):
+    """
+    Iterate over time windows of a parquet EVT sample file.
+
+    Only rows between min_date and max_date and only the requested columns are
+    read. Date filters are pushed down to the parquet reader, so row groups
+    outside the date range are skipped. If dates are sorted and resolution is a
+    fixed frequency, record batches are read one at a time and each window is
+    yielded as soon as it's complete, otherwise all filtered rows are read
+    before resampling. Either way, windows and rows within each window are the
+    same as with DataFrame.resample(resolution) on the full dataframe.
+
+    Parameters
+    ----------
+    path: str
+        Parquet file or directory of parquet files with a "date" column.
+    resolution: str
+        Window size as a pandas offset alias.
+    min_date: pandas.Timestamp, optional
+        Minimum date, inclusive.
+    max_date: pandas.Timestamp, optional
+        Maximum date, inclusive.
+    columns: list of str, optional
+        Columns to read, defaults to bead_columns. Columns not present in the
+        file are skipped.
+
+    Returns
+    -------
+    Iterator of (pandas.Timestamp, pandas.DataFrame)
+        Window start time and non-empty dataframe of rows in the window, without
+        the date column.
+    """
+    if columns is None:
+        columns = bead_columns
+    dataset = ds.dataset(path, format="parquet")
+    if "date" not in dataset.schema.names:
+        raise errors.SeaFlowpyError("no date column in EVT dataframe")
+    columns = ["date"] + [c for c in columns if c != "date" and c in dataset.schema.names]
+    filt = None
+    if min_date is not None:
+        filt = ds.field("date") >= pd.Timestamp(min_date)
+    if max_date is not None:
+        max_filt = ds.field("date") <= pd.Timestamp(max_date)
+        filt = max_filt if filt is None else filt & max_filt
+
+    try:
+        freq = pd.tseries.frequencies.to_offset(resolution)
+    except ValueError as e:
+        raise errors.SeaFlowpyError(f"invalid resolution {resolution}") from e
+
+    return _iter_evt_windows(dataset, resolution, freq, columns, filt)
+
+
+def _iter_evt_windows(dataset, resolution, freq, columns, filt):
+    # Read only dates first to find out if batches can be streamed
+    dates = dataset.to_table(columns=["date"], filter=filt).column("date").to_pandas()
+    if len(dates) == 0:
+        return
+    if not isinstance(freq, pd.tseries.offsets.Tick) or not dates.is_monotonic_increasing:
+        df = dataset.to_table(columns=columns, filter=filt).to_pandas()
+        for name, group in df.set_index("date").resample(resolution):
+            if len(group):
+                yield name, group.reset_index(drop=True)
+        return
+
+    # Same bin edges as resample's default origin="start_day"
+    origin = dates.iloc[0].floor("D")
+    step = pd.Timedelta(freq)
+    del dates
+    pending = []
+    for batch in dataset.to_batches(columns=columns, filter=filt):
+        if batch.num_rows == 0:
+            continue
+        df = batch.to_pandas()
+        df["_window"] = (df["date"] - origin) // step
+        # Data is sorted so every window before the last one seen is complete
+        first = pending[0]["_window"].iat[0] if pending else df["_window"].iat[0]
+        last = df["_window"].iat[-1]
+        if first < last:
+            complete = df["_window"].values < last
+            pending.append(df[complete])
+            yield from _group_windows(pd.concat(pending, ignore_index=True), origin, step)
+            pending = [df[~complete]]
+        else:
+            pending.append(df)
+    if pending:
+        yield from _group_windows(pd.concat(pending, ignore_index=True), origin, step)
+
+
+def _group_windows(df, origin, step):
+    for window, group in df.groupby("_window", sort=True):
+        yield origin + window * step, group.drop(columns=["date", "_window"]).reset_index(drop=True)
+
+
 
 def plot_cruise(bead_df, outpath, filter_params_path="", cruise="", iqr=None):
     if filter_params_path:
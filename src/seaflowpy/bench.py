@@ -0,0 +1,338 @@
+"""
+Benchmarks of seaflowpy hot paths for performance regression checks.
+
+Benchmarks run against a synthetic cruise (see seaflowpy.synthetic) created in
+a temporary directory. Each benchmark is run once untimed under tracemalloc to
+record peak memory allocated by Python and numpy in this process, then timed
+several times. Results are summarized as median and interquartile range of run
+times, which are less sensitive to occasional slow runs than mean and standard
+deviation, and can be saved as JSON and compared against a baseline.
+
+The pytest-benchmark suite in benchmarks/ covers more cases, this module is a
+small fixed set meant to be run as a check before deployment with
+"seaflowpy bench compare".
+"""
+import datetime
+import json
+import os
+import platform
+import queue
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from . import db
+from . import fileio
+from . import filterevt
+from . import particleops
+from . import seaflowfile
+from . import synthetic
+
+
+# Default fractional slowdown of median run time, relative to the baseline
+# median, which counts as a regression
+default_threshold = 0.2
+
+# Minimum time in seconds of one timed run of a benchmark
+min_run_time = 0.05
+
+# Columns of the DataFrame returned by compare()
+compare_columns = [
+    "name", "baseline_median", "median", "change", "threshold", "baseline_iqr",
+    "iqr", "baseline_peak_memory", "peak_memory", "memory_change", "status"
+]
+
+
+def _evt_path(data, gz):
+    return [p for p in data["cruise"]["evt_files"] if p.endswith(".gz") == gz][0]
+
+
+def _read_evt_labview(data, outdir):
+    return fileio.read_evt_labview, (_evt_path(data, False),), {}
+
+
+def _read_evt_labview_gz(data, outdir):
+    return fileio.read_evt_labview, (_evt_path(data, True),), {}
+
+
+def _read_opp_labview_gz(data, outdir):
+    path = [p for p in data["opp_files"] if p.endswith(".gz")][0]
+    return fileio.read_opp_labview, (path,), {}
+
+
+def _write_opp_parquet(data, outdir):
+    return fileio.write_opp_parquet, (data["opp_dfs"], data["window_start_date"], "1H", outdir), {}
+
+
+def _mark_focused(data, outdir):
+    return particleops.mark_focused, (data["evt_df"], data["filter_params"]), {}
+
+
+def _select_focused(data, outdir):
+    return particleops.select_focused, (data["marked_df"],), {}
+
+
+def _roughfilter(data, outdir):
+    return particleops.roughfilter, (data["evt_df"],), {}
+
+
+def _do_filter(data, outdir):
+    # Filter one time window in this process with the same code filter worker
+    # processes run, so memory use is visible to tracemalloc
+    work = filterevt.window_work(data["files_df"], None, outdir, data["filter_params"], window_size="1H")[0]
+    work_q = queue.Queue()
+    work_q.put(work)
+    work_q.put(filterevt.stop)
+    return filterevt.do_filter, (work_q, queue.Queue()), {}
+
+
+def _filter_evt_files(data, outdir):
+    dbpath = os.path.join(outdir, "bench.db")
+    shutil.copyfile(data["cruise"]["db"], dbpath)
+    args = (data["files_df"], dbpath, os.path.join(outdir, "opp"))
+    return _quiet(filterevt.filter_evt_files), args, {"every": 100.0}
+
+
+def _quiet(func):
+    """Wrap func to send STDOUT of this and child processes to /dev/null."""
+    def wrapped(*args, **kwargs):
+        sys.stdout.flush()
+        saved = os.dup(1)
+        with open(os.devnull, "w") as devnull:
+            os.dup2(devnull.fileno(), 1)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+    return wrapped
+
+
+# Benchmark name -> (setup function, default regression threshold). Setup
+# functions take the dict returned by _prepare() and an empty output directory,
+# and return (function to time, args, kwargs). filter_evt_files starts
+# processes, so it's noisier than the others and its memory peak only covers
+# this process.
+benchmarks = {
+    "fileio.read_evt_labview": (_read_evt_labview, default_threshold),
+    "fileio.read_evt_labview_gz": (_read_evt_labview_gz, default_threshold),
+    "fileio.read_opp_labview_gz": (_read_opp_labview_gz, default_threshold),
+    "fileio.write_opp_parquet": (_write_opp_parquet, default_threshold),
+    "particleops.mark_focused": (_mark_focused, default_threshold),
+    "particleops.select_focused": (_select_focused, default_threshold),
+    "particleops.roughfilter": (_roughfilter, default_threshold),
+    "filterevt.do_filter": (_do_filter, default_threshold),
+    "filterevt.filter_evt_files": (_filter_evt_files, 0.3),
+}
+
+
+def _prepare(workdir, file_count, events):
+    """Create synthetic cruise and shared inputs for benchmarks."""
+    cruise = synthetic.cruise(workdir, file_count=file_count, events=events)
+    filter_params = db.get_latest_filter(cruise["db"])
+    files_df = seaflowfile.date_evt_files(cruise["evt_files"], db.get_sfl_table(cruise["db"]))
+    evt_df = fileio.read_evt_labview(cruise["evt_files"][0])
+    marked_df = particleops.mark_focused(evt_df, filter_params)
+    # First hour of files, the unit of work for filter worker processes
+    window_start_date = files_df["date"].iloc[0].floor("1H")
+    window_df = files_df[files_df["date"] < window_start_date + pd.Timedelta("1H")].set_index("date")
+    opp_dfs = []
+    for date, row in window_df.iterrows():
+        opp_df = particleops.select_focused(
+            particleops.mark_focused(fileio.read_evt_labview(row["path"]), filter_params)
+        )
+        opp_df["date"] = date
+        opp_df["file_id"] = row["file_id"]
+        opp_df["filter_id"] = filter_params["id"][0]
+        opp_dfs.append(opp_df)
+    return {
+        "cruise": cruise,
+        "opp_files": seaflowfile.find_evt_files(cruise["opp_dir"], opp=True),
+        "filter_params": filter_params,
+        "files_df": files_df,
+        "evt_df": evt_df,
+        "marked_df": marked_df,
+        "opp_dfs": opp_dfs,
+        "window_start_date": window_start_date
+    }
+
+
+def run(names=None, repeat=5, file_count=20, events=40000, progress=None):
+    """
+    Run benchmarks.
+
+    Parameters
+    ----------
+    names: list of str, optional
+        Benchmarks to run, default all benchmarks in order.
+    repeat: int, default 5
+        Number of timed runs for each benchmark.
+    file_count: int, default 20
+        Number of files in the synthetic cruise. Files are 3 minutes apart, so
+        the default is one hour of data.
+    events: int, default 40000
+        Events per file in the synthetic cruise.
+    progress: function, optional
+        Called with each benchmark name before it's run.
+
+    Raises
+    ------
+    ValueError if a benchmark name is unknown or repeat is < 1.
+
+    Returns
+    -------
+    dict
+        "meta" is a dict of benchmark parameters and environment information.
+        "benchmarks" is a dict of benchmark name to a dict of run "times" in
+        seconds per call, "median", "iqr", "loops" as calls per timed run,
+        "peak_memory" in bytes, and "threshold".
+    """
+    if names is None:
+        names = list(benchmarks)
+    unknown = [n for n in names if n not in benchmarks]
+    if unknown:
+        raise ValueError("unknown benchmarks: {}".format(", ".join(unknown)))
+    if repeat < 1:
+        raise ValueError("repeat must be > 0")
+
+    from . import __version__
+    results = {
+        "meta": {
+            "seaflowpy": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "repeat": repeat,
+            "file_count": file_count,
+            "events": events
+        },
+        "benchmarks": {}
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        data = _prepare(os.path.join(workdir, "data"), file_count, events)
+        runs = iter(range(sys.maxsize))
+        for name in names:
+            if progress:
+                progress(name)
+            setup, threshold = benchmarks[name]
+
+            # Untimed run under tracemalloc, which also warms caches
+            func, args, kwargs = setup(data, _outdir(workdir, runs))
+            tracemalloc.start()
+            try:
+                func(*args, **kwargs)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            # Fast functions are called several times per timed run so that
+            # timer resolution and scheduling noise don't dominate
+            loops = max(1, min(1000, int(min_run_time / _timed(setup, data, workdir, runs))))
+            times = []
+            for _ in range(repeat):
+                times.append(sum(_timed(setup, data, workdir, runs) for _ in range(loops)) / loops)
+            results["benchmarks"][name] = dict(
+                summarize(times),
+                loops=loops,
+                peak_memory=peak,
+                threshold=threshold
+            )
+    return results
+
+
+def _timed(setup, data, workdir, runs):
+    """Set up and time one call of a benchmark function, in seconds."""
+    func, args, kwargs = setup(data, _outdir(workdir, runs))
+    t0 = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+def _outdir(workdir, runs):
+    outdir = os.path.join(workdir, "run{}".format(next(runs)))
+    os.makedirs(outdir)
+    return outdir
+
+
+def summarize(times):
+    """Return dict of "times", "median" and "iqr" for a list of run times."""
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {"times": list(times), "median": float(median), "iqr": float(q3 - q1)}
+
+
+def compare(results, baseline, threshold=None):
+    """
+    Compare benchmark results to a baseline.
+
+    A benchmark regresses if its median run time is slower than the baseline
+    median by more than its threshold, as a fraction of the baseline median,
+    and by more than the sum of both interquartile ranges, so that noisy
+    benchmarks don't fail by chance.
+
+    Parameters
+    ----------
+    results: dict
+        Benchmark results from run().
+    baseline: dict
+        Baseline benchmark results from run(). The "threshold" of each baseline
+        benchmark, if present, sets its regression threshold.
+    threshold: float, optional
+        Regression threshold for benchmarks without a threshold in baseline,
+        default default_threshold.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per benchmark in results with columns from compare_columns.
+        "change" and "memory_change" are fractional changes from baseline.
+        "status" is "ok", "regression", or "new" for benchmarks which aren't in
+        baseline.
+    """
+    if threshold is None:
+        threshold = default_threshold
+    rows = []
+    for name, res in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        row = dict.fromkeys(compare_columns, np.nan)
+        row.update({
+            "name": name,
+            "median": res["median"],
+            "iqr": res["iqr"],
+            "peak_memory": res["peak_memory"],
+            "status": "new"
+        })
+        if base is not None:
+            limit = base.get("threshold", threshold)
+            slower = res["median"] - base["median"]
+            regressed = (
+                slower > limit * base["median"] and
+                slower > base["iqr"] + res["iqr"]
+            )
+            row.update({
+                "baseline_median": base["median"],
+                "change": slower / base["median"],
+                "threshold": limit,
+                "baseline_iqr": base["iqr"],
+                "baseline_peak_memory": base["peak_memory"],
+                "memory_change": (res["peak_memory"] - base["peak_memory"]) / base["peak_memory"],
+                "status": "regression" if regressed else "ok"
+            })
+        rows.append(row)
+    return pd.DataFrame(rows, columns=compare_columns)
+
+
+def save(results, path):
+    """Save benchmark results as JSON."""
+    with open(path, "w") as fh:
+        json.dump(results, fh, indent=2)
+        fh.write("\n")
+
+
+def load(path):
+    """Load benchmark results saved by save()."""
+    with open(path) as fh:
+        return json.load(fh)
@@ -0,0 +1,455 @@
+"""
+Classify focused particles into populations with polygon gates.
+
+Gating parameters are read from the gating and poly tables of a popcycle
+database. Each population is defined by a polygon in two channels, and
+populations are assigned in pop_order, so a particle inside the polygons of
+more than one population belongs to the first. Particles outside all polygons
+are "unknown". Polygon vertices are in the same units as the OPP parquet data
+they're applied to, i.e. linearized channel values.
+
+Each particle is also given diameter and carbon quota estimates by
+interpolating its forward scatter, normalized to calibration bead forward
+scatter for the filtering quantile, in a Mie theory lookup table.
+"""
+import glob
+import multiprocessing as mp
+import os
+import numpy as np
+import pandas as pd
+from . import db
+from . import errors
+from . import fileio
+from . import particleops
+
+
+# Channel columns which can hold polygon vertex coordinates
+poly_channels = ["fsc_small", "fsc_perp", "fsc_big", "pe", "chl_small", "chl_big"]
+
+# vct table statistic name prefix -> particle data column
+stat_columns = {
+    "chl": "chl_small",
+    "pe": "pe",
+    "fsc": "fsc_small",
+    "diam_lwr": "diam_lwr",
+    "diam_mid": "diam_mid",
+    "diam_upr": "diam_upr",
+    "Qc_lwr": "Qc_lwr",
+    "Qc_mid": "Qc_mid",
+    "Qc_upr": "Qc_upr"
+}
+
+unknown = "unknown"
+
+# VCT file formats which can be written during classification
+vct_formats = ["csv", "parquet"]
+
+
+def points_in_polygon(x, y, vertices):
+    """
+    Test which points are inside a polygon.
+
+    Uses the even-odd rule, casting a ray from each point in the +x direction
+    and counting polygon edge crossings. Each edge is tested against all
+    points at once.
+
+    Parameters
+    ----------
+    x, y: numpy.ndarray
+        Point coordinates.
+    vertices: numpy.ndarray
+        (n, 2) array of polygon vertices in order. The polygon is closed
+        automatically.
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array, True for points inside the polygon.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    inside = np.zeros(len(x), dtype=bool)
+    vx, vy = vertices[:, 0], vertices[:, 1]
+    # Only points in the polygon's bounding box need to be tested
+    idx = np.flatnonzero((x >= vx.min()) & (x <= vx.max()) & (y >= vy.min()) & (y <= vy.max()))
+    if len(idx) == 0:
+        return inside
+    px, py = x[idx], y[idx]
+    odd = np.zeros(len(idx), dtype=bool)
+    for i in range(len(vx)):
+        x1, y1, x2, y2 = vx[i - 1], vy[i - 1], vx[i], vy[i]
+        if y1 == y2:
+            continue  # horizontal edges are never crossed
+        crosses = (y1 > py) != (y2 > py)
+        odd ^= crosses & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+    inside[idx] = odd
+    return inside
+
+
+def get_gates(gating_df, poly_df):
+    """
+    Create population gates from gating parameters.
+
+    Parameters
+    ----------
+    gating_df: pandas.DataFrame
+        gating table rows for one gating ID, see db.get_gating_params().
+    poly_df: pandas.DataFrame
+        poly table rows for the same gating ID.
+
+    Raises
+    ------
+    seaflowpy.errors.SeaFlowpyError if a population doesn't use a "manual"
+    polygon gate or if its polygon is not defined by at least 3 points in
+    exactly 2 channels.
+
+    Returns
+    -------
+    list of dict
+        One dict per population in pop_order, with keys "pop", "channels" as
+        (x, y) channel names, and "vertices" as an (n, 2) numpy.ndarray.
+    """
+    gates = []
+    for row in gating_df.sort_values("pop_order", kind="mergesort").itertuples():
+        if row.method != "manual":
+            raise errors.SeaFlowpyError(
+                f"gating method '{row.method}' for population {row.pop} is not supported, only 'manual' polygons"
+            )
+        points = poly_df[poly_df["pop"] == row.pop].sort_values("point_order")
+        channels = [c for c in poly_channels if len(points) and points[c].notna().all()]
+        if len(channels) != 2 or len(points) < 3:
+            raise errors.SeaFlowpyError(
+                f"polygon for population {row.pop} must have at least 3 points in exactly 2 channels"
+            )
+        gates.append({
+            "pop": row.pop,
+            "channels": channels,
+            "vertices": points[channels].to_numpy(dtype=np.float64)
+        })
+    return gates
+
+
+def classify_df(df, gates):
+    """
+    Assign particles to populations.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        SeaFlow particle data with channel columns used by gates.
+    gates: list of dict
+        Population gates from get_gates().
+
+    Raises
+    ------
+    seaflowpy.errors.SeaFlowpyError if df is missing a gate channel.
+
+    Returns
+    -------
+    pandas.Categorical
+        Population for each particle, "unknown" for particles not in any gate.
+        Categories are gate populations in order followed by "unknown".
+    """
+    pop = np.full(len(df.index), len(gates), dtype=np.int64)  # code for unknown
+    unassigned = np.ones(len(df.index), dtype=bool)
+    for i, gate in enumerate(gates):
+        missing = [c for c in gate["channels"] if c not in df.columns]
+        if missing:
+            raise errors.SeaFlowpyError(f"particle data is missing channel {missing[0]} for population {gate['pop']}")
+        x, y = gate["channels"]
+        idx = np.flatnonzero(unassigned)
+        hits = idx[points_in_polygon(df[x].values[idx], df[y].values[idx], gate["vertices"])]
+        pop[hits] = i
+        unassigned[hits] = False
+    categories = [g["pop"] for g in gates] + [unknown]
+    return pd.Categorical.from_codes(pop, categories=categories)
+
+
+def size_carbon(fsc, beads_fsc, mie):
+    """
+    Estimate particle diameter and carbon quota from forward scatter.
+
+    Forward scatter normalized by calibration bead forward scatter is linearly
+    interpolated in a Mie theory lookup table. Values outside the table are
+    set to the table's first or last values.
+
+    Parameters
+    ----------
+    fsc: numpy.ndarray
+        Linear forward scatter values.
+    beads_fsc: float
+        Linear forward scatter of calibration beads.
+    mie: pandas.DataFrame
+        Mie theory lookup table sorted by scatter, see fileio.read_mie_csv().
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns from fileio.MIE_COLUMNS except scatter.
+    """
+    scatter = np.asarray(fsc, dtype=np.float64) / beads_fsc
+    xp = mie["scatter"].values
+    return pd.DataFrame({c: np.interp(scatter, xp, mie[c].values) for c in fileio.MIE_COLUMNS[1:]})
+
+
+def bead_scatter(filter_df):
+    """
+    Linear calibration bead forward scatter by filter ID and quantile.
+
+    Parameters
+    ----------
+    filter_df: pandas.DataFrame
+        filter table, see db.get_filter_table().
+
+    Returns
+    -------
+    dict of {(str, float): float}
+    """
+    linear = particleops.linearize_particles(filter_df, ["beads_fsc_small"])["beads_fsc_small"].values
+    return {(f, q): b for f, q, b in zip(filter_df["id"], filter_df["quantile"], linear)}
+
+
+def vct_stats(df, gating_id, filter_id=None):
+    """
+    Calculate vct table statistics for classified particles.
+
+    Statistics for all groups of file, population and quantile are calculated
+    together, so a whole cruise can be summarized in one call. Particle values
+    are sorted by group and value, after which each group is a contiguous
+    sorted segment and quartiles are read from segment offsets. Columns
+    already in order under an earlier column's sort, e.g. size estimates under
+    forward scatter, are not sorted again. Quartiles use linear interpolation
+    between closest ranks, the same as numpy.quantile() and R's default.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        Merged OPP and VCT particle data, e.g. concatenated
+        particleops.merge_opp_vct() results for many files and quantiles, with
+        "file_id", "pop", and "quantile" columns and columns in stat_columns
+        values.
+    gating_id: str
+        Gating ID used to classify particles.
+    filter_id: str, optional
+        Filter ID used to create OPP data. Required if df has no "filter_id"
+        column, otherwise the filter ID for each group is taken from df.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per file, population and quantile with columns from
+        db.vct_field_order, sorted by file, population and quantile.
+    """
+    if len(df.index) == 0:
+        return pd.DataFrame(columns=db.vct_field_order)
+    if filter_id is None and "filter_id" not in df.columns:
+        raise ValueError("filter_id must be provided if df has no filter_id column")
+
+    # Number groups in sorted key order without sorting particles. Each
+    # particle's key codes are combined into one integer, and integers for
+    # groups which are present are renumbered consecutively.
+    key_codes, key_uniques = [], []
+    for k in ["file_id", "pop", "quantile"]:
+        codes, uniques = pd.factorize(df[k], sort=True)
+        key_codes.append(codes)
+        key_uniques.append(np.asarray(uniques))
+    sizes = [len(u) for u in key_uniques]
+    key = np.ravel_multi_index(key_codes, sizes)
+    present = np.bincount(key, minlength=np.prod(sizes)) > 0
+    group_keys = np.flatnonzero(present)
+    renumber = np.cumsum(present) - 1
+    group = renumber[key].astype(np.uint16 if len(group_keys) <= 2**16 else np.int64)
+    counts = np.bincount(group, minlength=len(group_keys))
+    starts = np.cumsum(counts) - counts
+    group_codes = np.unravel_index(group_keys, sizes)
+
+    stats = {
+        "file": key_uniques[0][group_codes[0]],
+        "pop": key_uniques[1][group_codes[1]],
+        "count": counts
+    }
+    # Closest ranks and interpolation weights for each quartile in each group
+    ranks = {}
+    for suffix, p in [("_1q", 0.25), ("_med", 0.5), ("_3q", 0.75)]:
+        pos = starts + p * (counts - 1)
+        lo = np.floor(pos).astype(np.int64)
+        ranks[suffix] = (lo, np.minimum(lo + 1, starts + counts - 1), pos - lo)
+    # Consecutive sorted positions in the same group
+    interior = np.ones(len(group) - 1, dtype=bool)
+    interior[starts[1:] - 1] = False
+    orders = []
+    for name, col in stat_columns.items():
+        values = df[col].values
+        # Size and carbon estimates increase with forward scatter, so the
+        # last order usually sorts them too, which is much cheaper to check
+        # than to sort again
+        for idx in reversed(orders):
+            sorted_values = values[idx]
+            if not np.any((sorted_values[1:] < sorted_values[:-1]) & interior):
+                break
+        else:
+            # Sorting by value then stable sorting by group is faster than
+            # numpy.lexsort, especially when group numbers fit in 16 bits and
+            # numpy uses radix sort
+            idx = np.argsort(values)
+            idx = idx[np.argsort(group[idx], kind="stable")]
+            orders.append(idx)
+            sorted_values = values[idx]
+        for suffix, (lo, hi, frac) in ranks.items():
+            stats[name + suffix] = sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * frac
+        if name.startswith("Qc"):
+            stats[name + "_mean"] = np.add.reduceat(sorted_values, starts) / counts
+
+    stats["gating_id"] = gating_id
+    if "filter_id" in df.columns:
+        stats["filter_id"] = np.asarray(df["filter_id"])[orders[0][starts]]
+    else:
+        stats["filter_id"] = filter_id
+    stats["quantile"] = key_uniques[2][group_codes[2]]
+    return pd.DataFrame(stats, columns=db.vct_field_order)
+
+
+def classify_opp_parquet(path, gates, gating_id, beads_fsc, mie, vct_dir=None, vct_format="csv"):
+    """
+    Classify particles in one OPP parquet file.
+
+    Parameters
+    ----------
+    path: str
+        OPP parquet file, see fileio.write_opp_parquet().
+    gates: list of dict
+        Population gates from get_gates().
+    gating_id: str
+        Gating ID for gates.
+    beads_fsc: dict
+        Linear bead forward scatter from bead_scatter().
+    mie: pandas.DataFrame
+        Mie theory lookup table, see fileio.read_mie_csv().
+    vct_dir: str, optional
+        Directory for VCT files. If None no files are written.
+    vct_format: str, default "csv"
+        VCT file format. "csv" saves one file per SeaFlow file and quantile as
+        vct_dir/<quantile>/<file ID>.vct.gz. "parquet" saves one file for all
+        particles in path with the same name and a .vct.parquet extension, see
+        fileio.write_vct_parquet().
+
+    Raises
+    ------
+    ValueError if vct_format is unknown.
+    seaflowpy.errors.SeaFlowpyError if bead forward scatter is missing for a
+    filter ID and quantile in the data.
+
+    Returns
+    -------
+    dict
+        "path", "particles" as OPP particle count, "files" as the set of file
+        IDs, and "stats" as vct table values from vct_stats().
+    """
+    if vct_format not in vct_formats:
+        raise ValueError(f"unknown VCT format {vct_format}")
+    df = pd.read_parquet(path)
+    df["pop"] = classify_df(df, gates)
+    vct_dfs = []
+    for _q_col, q, q_str, q_df in particleops.quantiles_in_df(df):
+        for filter_id, f_df in q_df.groupby("filter_id", observed=True, sort=False):
+            try:
+                beads = beads_fsc[(filter_id, q)]
+            except KeyError:
+                raise errors.SeaFlowpyError(f"no bead forward scatter for filter ID {filter_id} quantile {q_str}")
+            vct_df = pd.concat(
+                [f_df.reset_index(drop=True), size_carbon(f_df["fsc_small"], beads, mie)],
+                axis=1
+            )
+            vct_df["quantile"] = q
+            if vct_dir and vct_format == "csv":
+                for file_id, file_df in vct_df.groupby("file_id", observed=True, sort=False):
+                    fileio.write_vct_csv(file_df, os.path.join(vct_dir, q_str, file_id + ".vct.gz"))
+            vct_dfs.append(vct_df)
+    if vct_dfs:
+        vct_df = pd.concat(vct_dfs, ignore_index=True)
+        stats = vct_stats(vct_df, gating_id)
+        if vct_dir and vct_format == "parquet":
+            vct_name = os.path.basename(path)[:-len(".opp.parquet")] + ".vct.parquet"
+            fileio.write_vct_parquet(vct_df, os.path.join(vct_dir, vct_name))
+    else:
+        stats = vct_stats(pd.DataFrame(), gating_id)
+    return {
+        "path": path,
+        "particles": len(df.index),
+        "files": set(df["file_id"].unique()),
+        "stats": stats
+    }
+
+
+def _classify_opp_parquet_worker(args):
+    return classify_opp_parquet(*args)
+
+
+def find_opp_parquet_files(opp_dir):
+    """Return a sorted list of OPP parquet files in opp_dir."""
+    return sorted(glob.glob(os.path.join(opp_dir, "*.opp.parquet")))
+
+
+def classify_opp_files(opp_paths, dbpath, mie, vct_dir=None, gating_id=None, process_count=1,
+                       vct_format="csv"):
+    """
+    Classify particles in OPP parquet files and save vct table statistics.
+
+    OPP files are classified in parallel. Results are saved to the vct table
+    of dbpath as each file finishes.
+
+    Parameters
+    ----------
+    opp_paths: list of str
+        OPP parquet files.
+    dbpath: str
+        Popcycle SQLite3 db file with gating and filter parameters.
+    mie: pandas.DataFrame
+        Mie theory lookup table, see fileio.read_mie_csv().
+    vct_dir: str, optional
+        Directory for VCT files, see classify_opp_parquet().
+    gating_id: str, optional
+        Gating ID, default the most recent gating parameters.
+    process_count: int, default 1
+        Number of worker processes.
+    vct_format: str, default "csv"
+        VCT file format, see classify_opp_parquet().
+
+    Raises
+    ------
+    ValueError if vct_format is unknown.
+    seaflowpy.errors.SeaFlowpyError if gating parameters can't be used.
+
+    Returns
+    -------
+    dict
+        "gating_id", "opp_files", "files" as the number of SeaFlow files,
+        "particles" and "vct_rows" as the number of vct table rows saved.
+    """
+    if process_count < 1:
+        raise ValueError("process_count must be > 0")
+    if vct_format not in vct_formats:
+        raise ValueError(f"unknown VCT format {vct_format}")
+    gating_df, poly_df = db.get_gating_params(dbpath, gating_id)
+    gating_id = gating_df["id"].iloc[0]
+    gates = get_gates(gating_df, poly_df)
+    beads_fsc = bead_scatter(db.get_filter_table(dbpath))
+
+    summary = {"gating_id": gating_id, "opp_files": len(opp_paths), "files": 0, "particles": 0, "vct_rows": 0}
+    work = [(p, gates, gating_id, beads_fsc, mie, vct_dir, vct_format) for p in opp_paths]
+    pool = mp.Pool(processes=process_count)
+    try:
+        for result in pool.imap_unordered(_classify_opp_parquet_worker, work):
+            if len(result["stats"].index):
+                db.save_vct_to_db(result["stats"], dbpath)
+            summary["files"] += len(result["files"])
+            summary["particles"] += result["particles"]
+            summary["vct_rows"] += len(result["stats"].index)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return summary
@@ -1,22 +1,41 @@
+import importlib
 import click
-from seaflowpy.cli.commands.dayofyear_cmd import dayofyear_cmd
-from seaflowpy.cli.commands.db_cmd import db_cmd
-from seaflowpy.cli.commands.evt_cmd import evt_cmd
-from seaflowpy.cli.commands.filter_cmd import filter_cmd
-from seaflowpy.cli.commands.sfl_cmd import sfl_cmd
-from seaflowpy.cli.commands.sds2sfl_cmd import sds2sfl_cmd
-from seaflowpy.cli.commands.version_cmd import version_cmd
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
-@click.group(context_settings=CONTEXT_SETTINGS)
+# Subcommand name -> "module:attribute" of its click command. Command modules
+# are only imported when the subcommand is looked up, so e.g. "seaflowpy
+# version" doesn't pay for importing every other command's dependencies.
+COMMANDS = {
+    'bench': 'seaflowpy.cli.commands.bench_cmd:bench_cmd',
+    'classify': 'seaflowpy.cli.commands.classify_cmd:classify_cmd',
+    'dayofyear': 'seaflowpy.cli.commands.dayofyear_cmd:dayofyear_cmd',
+    'db': 'seaflowpy.cli.commands.db_cmd:db_cmd',
+    'evt': 'seaflowpy.cli.commands.evt_cmd:evt_cmd',
+    'filter': 'seaflowpy.cli.commands.filter_cmd:filter_cmd',
+    'psd': 'seaflowpy.cli.commands.psd_cmd:psd_cmd',
+    'sds2sfl': 'seaflowpy.cli.commands.sds2sfl_cmd:sds2sfl_cmd',
+    'serve': 'seaflowpy.cli.commands.serve_cmd:serve_cmd',
+    'sfl': 'seaflowpy.cli.commands.sfl_cmd:sfl_cmd',
+    'vct': 'seaflowpy.cli.commands.vct_cmd:vct_cmd',
+    'version': 'seaflowpy.cli.commands.version_cmd:version_cmd',
+}
+
+
+class LazyGroup(click.Group):
+    """click Group which imports subcommands from COMMANDS on demand."""
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(COMMANDS))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in COMMANDS:
+            module_name, attr = COMMANDS[cmd_name].split(':')
+            module = importlib.import_module(module_name)
+            self.add_command(getattr(module, attr), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, context_settings=CONTEXT_SETTINGS)
 def cli():
     pass
-
-cli.add_command(dayofyear_cmd, 'dayofyear')
-cli.add_command(db_cmd, 'db')
-cli.add_command(evt_cmd, 'evt')
-cli.add_command(filter_cmd, 'filter')
-cli.add_command(sds2sfl_cmd, 'sds2sfl')
-cli.add_command(sfl_cmd, 'sfl')
-cli.add_command(version_cmd, 'version')
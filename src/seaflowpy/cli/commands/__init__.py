@@ -1,7 +0,0 @@
-from . import dayofyear_cmd
-from . import db_cmd
-from . import evt_cmd
-from . import filter_cmd
-from . import sds2sfl_cmd
-from . import sfl_cmd
-from . import version_cmd
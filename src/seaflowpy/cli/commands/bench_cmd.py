@@ -0,0 +1,124 @@
+import sys
+import click
+from seaflowpy import bench
+from seaflowpy.cli.validators import validate_positive
+
+
+def benchmark_options(f):
+    """Add benchmark selection and size options to a command."""
+    f = click.option('-e', '--events', type=int, callback=validate_positive,
+        help='Events per synthetic EVT file. [default: 40000, or baseline value for compare]')(f)
+    f = click.option('-f', '--file-count', type=int, callback=validate_positive,
+        help='Number of synthetic EVT files. [default: 20, or baseline value for compare]')(f)
+    f = click.option('-r', '--repeat', type=int, callback=validate_positive,
+        help='Timed runs per benchmark. [default: 5, or baseline value for compare]')(f)
+    f = click.option('-b', '--benchmark', 'names', multiple=True, type=click.Choice(list(bench.benchmarks)),
+        help='Benchmark to run. Can be specified multiple times. [default: all]')(f)
+    return f
+
+
+def run(names, repeat, file_count, events):
+    """Run benchmarks with progress on STDERR."""
+    return bench.run(
+        names=list(names) if names else None,
+        repeat=repeat,
+        file_count=file_count,
+        events=events,
+        progress=lambda name: print(f'running {name}', file=sys.stderr)
+    )
+
+
+def mib(nbytes):
+    return '{:.1f}'.format(nbytes / 2**20)
+
+
+@click.group()
+def bench_cmd():
+    """Performance benchmarks and regression checks."""
+    pass
+
+
+@bench_cmd.command('list')
+def bench_list_cmd():
+    """Lists benchmarks and default regression thresholds."""
+    for name, (_, threshold) in bench.benchmarks.items():
+        print('\t'.join([name, str(threshold)]))
+
+
+@bench_cmd.command('run')
+@benchmark_options
+@click.option('-o', '--outfile', type=click.Path(dir_okay=False, writable=True),
+    help='Save results as JSON, e.g. to create a baseline for "bench compare".')
+def bench_run_cmd(names, repeat, file_count, events, outfile):
+    """
+    Runs benchmarks on synthetic data.
+
+    Prints tab-delimited median and IQR of run times in seconds and peak
+    memory in MiB to STDOUT.
+    """
+    results = run(names, repeat or 5, file_count or 20, events or 40000)
+    if outfile:
+        bench.save(results, outfile)
+    print('\t'.join(['name', 'median', 'iqr', 'peak_memory_mib']))
+    for name, r in results['benchmarks'].items():
+        print('\t'.join([name, '{:.6f}'.format(r['median']), '{:.6f}'.format(r['iqr']), mib(r['peak_memory'])]))
+
+
+@bench_cmd.command('compare')
+@benchmark_options
+@click.option('-t', '--threshold', type=float,
+    help=f'Regression threshold as fractional slowdown of median time, for benchmarks without a threshold in BASELINE. [default: {bench.default_threshold}]')
+@click.option('-i', '--results', 'results_file', type=click.Path(exists=True, dir_okay=False),
+    help='Compare results saved by "bench run" instead of running benchmarks.')
+@click.option('-o', '--outfile', type=click.Path(dir_okay=False, writable=True),
+    help='Save results as JSON.')
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+def bench_compare_cmd(names, repeat, file_count, events, threshold, results_file, outfile, baseline):
+    """
+    Compares benchmark results to a baseline.
+
+    BASELINE is a JSON file created by "bench run -o". Benchmarks are run with
+    the same number of runs and synthetic data size as BASELINE unless set
+    with options. A benchmark regresses if its median run time is slower than
+    the baseline by more than its threshold and by more than the sum of both
+    IQRs. Prints a tab-delimited comparison to STDOUT, with time and memory
+    changes as fractions of baseline values. Exits with an error if any
+    benchmark regressed.
+    """
+    base = bench.load(baseline)
+    if results_file:
+        results = bench.load(results_file)
+        if names:
+            results['benchmarks'] = {k: v for k, v in results['benchmarks'].items() if k in names}
+    else:
+        meta = base.get('meta', {})
+        results = run(
+            names,
+            repeat or meta.get('repeat', 5),
+            file_count or meta.get('file_count', 20),
+            events or meta.get('events', 40000)
+        )
+    if outfile:
+        bench.save(results, outfile)
+
+    df = bench.compare(results, base, threshold=threshold)
+    print('\t'.join(['name', 'baseline_median', 'median', 'change', 'threshold',
+                     'baseline_peak_memory_mib', 'peak_memory_mib', 'memory_change', 'status']))
+    for r in df.itertuples():
+        if r.status == 'new':
+            print('\t'.join([r.name, 'NA', '{:.6f}'.format(r.median), 'NA', 'NA', 'NA', mib(r.peak_memory), 'NA', r.status]))
+        else:
+            print('\t'.join([
+                r.name,
+                '{:.6f}'.format(r.baseline_median),
+                '{:.6f}'.format(r.median),
+                '{:+.3f}'.format(r.change),
+                str(r.threshold),
+                mib(r.baseline_peak_memory),
+                mib(r.peak_memory),
+                '{:+.3f}'.format(r.memory_change),
+                r.status
+            ]))
+    regressed = df.loc[df['status'] == 'regression', 'name'].tolist()
+    if regressed:
+        raise click.ClickException('performance regression in {}'.format(', '.join(regressed)))
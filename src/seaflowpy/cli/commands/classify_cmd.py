@@ -0,0 +1,54 @@
+import json
+import click
+import seaflowpy
+from seaflowpy import classify
+from seaflowpy import errors
+from seaflowpy import fileio
+from seaflowpy import util
+from seaflowpy.cli.validators import validate_positive
+
+
+@click.command()
+@click.option('-d', '--db', 'dbpath', required=True, metavar='FILE', type=click.Path(exists=True),
+    help='Popcycle SQLite3 db file with gating and filter parameters. Results are saved to the vct table.')
+@click.option('-o', '--opp-dir', metavar='DIR', required=True, type=click.Path(exists=True, file_okay=False),
+    help='Directory of OPP parquet files created by "filter local".')
+@click.option('-m', '--mie', metavar='FILE', required=True, type=click.Path(exists=True, dir_okay=False),
+    help='Mie theory lookup table csv file with columns scatter, diam_lwr, Qc_lwr, diam_mid, Qc_mid, diam_upr, Qc_upr.')
+@click.option('-v', '--vct-dir', metavar='DIR',
+    help='Directory in which to save VCT files. Will be created if does not exist.')
+@click.option('-f', '--vct-format', type=click.Choice(classify.vct_formats), default='csv', show_default=True,
+    help='VCT file format. csv writes one file per SeaFlow file and quantile, parquet writes one file per OPP parquet file.')
+@click.option('-g', '--gating-id', metavar='ID',
+    help='Gating parameters ID. [default: most recent gating parameters]')
+@click.option('-p', '--process-count', type=int, default=1, show_default=True, metavar='N', callback=validate_positive,
+    help='Number of processes to use in classification.')
+@util.quiet_keyboardinterrupt
+def classify_cmd(dbpath, opp_dir, mie, vct_dir, vct_format, gating_id, process_count):
+    """
+    Classify OPP particles into populations.
+
+    Particles in OPP parquet files are assigned to populations with the
+    polygon gates in the gating and poly tables of the database, and given
+    size and carbon quota estimates from the Mie theory lookup table.
+    Per-file, population and quantile statistics are saved to the vct table.
+    Prints a summary as JSON to STDOUT.
+    """
+    opp_files = classify.find_opp_parquet_files(opp_dir)
+    if not opp_files:
+        raise click.ClickException(f'no OPP parquet files found in {opp_dir}')
+    try:
+        mie_df = fileio.read_mie_csv(mie)
+        summary = classify.classify_opp_files(
+            opp_files,
+            dbpath,
+            mie_df,
+            vct_dir=vct_dir,
+            gating_id=gating_id,
+            process_count=process_count,
+            vct_format=vct_format
+        )
+    except errors.SeaFlowpyError as e:
+        raise click.ClickException(str(e))
+    summary['version'] = seaflowpy.__version__
+    print(json.dumps(summary, indent=2))
@@ -1,5 +1,7 @@
+import os
 import sys
 import click
+import pandas as pd
 from seaflowpy import db
 from seaflowpy.errors import SeaFlowpyError
 from seaflowpy import fileio
@@ -48,13 +50,15 @@ def db_create_cmd(db_file, cruise, serial):
 @db_cmd.command('import-sfl')
 @click.option('-f', '--force', is_flag=True,
     help='Attempt DB import even if validation produces errors.')
+@click.option('-i', '--incremental', is_flag=True,
+    help='Only validate and import rows dated after SFL data already in the database.')
 @click.option('-j', '--json', is_flag=True,
     help='Report errors as JSON.')
 @click.option('-v', '--verbose', is_flag=True,
     help='Report all errors.')
 @click.argument('sfl-file', nargs=1, type=click.Path(exists=True))
 @click.argument('db-file', nargs=1, type=click.Path(writable=True))
-def db_import_sfl_cmd(force, json, verbose, sfl_file, db_file):
+def db_import_sfl_cmd(force, incremental, json, verbose, sfl_file, db_file):
     """
     Imports SFL metadata to database.
 
@@ -66,8 +70,12 @@ def db_import_sfl_cmd(force, json, verbose, sfl_file, db_file):
     it's expected that information is already in the database. Databae cruise and
     serial overrides values in filename. If a database
     file does not exist a new one will be created. Any SFL data in the database
-    will be erased before importing new data. Errors or warnings are output to
-    STDOUT.
+    will be erased before importing new data, unless --incremental is used. In
+    that case only lines appended to SFL-FILE since the last incremental import
+    are read, checked and inserted, or on the first incremental import rows
+    following the latest SFL date in the database. New rows are also checked
+    against files and dates already in the database. Errors or warnings are
+    output to STDOUT.
     """
     cruise, serial = None, None
 
@@ -92,19 +100,44 @@ def db_import_sfl_cmd(force, json, verbose, sfl_file, db_file):
     if cruise is None or serial is None:
         raise click.ClickException('instrument serial and cruise must both be specified either in filename as <cruise>_<instrument-serial>.sfl, as command-line options, or in database metadata table.')
 
-    df = sfl.read_file(sfl_file)
-
-    df = sfl.fix(df)
-    errors = sfl.check(df)
+    if incremental:
+        sfl_path = os.path.abspath(sfl_file)
+        last_date = db.get_sfl_max_date(db_file)
+        reader = sfl.SFLTailReader(sfl_file)
+        state = db.get_sfl_import_state(db_file, sfl_path)
+        if state is not None:
+            reader.set_state(state)
+        df = reader.read()
+        if len(df) == 0:
+            if reader.state() != state:
+                db.save_sfl_import_state(db_file, sfl_path, reader.state())
+            return
+        df = sfl.fix(df)
+        if reader.rows == len(df):
+            # Read from the start of the file, skip rows already imported
+            df = sfl.new_rows(df, last_date)
+            if len(df) == 0:
+                db.save_sfl_import_state(db_file, sfl_path, reader.state())
+                return
+        errors = pd.concat([
+            sfl.check(df),
+            sfl.check_db_boundary(df, last_date, db.get_sfl_file_ids(db_file, df["file"]))
+        ], ignore_index=True)
+    else:
+        df = sfl.read_file(sfl_file)
+        df = sfl.fix(df)
+        errors = sfl.check(df)
 
     if len(errors) > 0:
         if json:
             sfl.print_json_errors(errors, sys.stdout, sfl_file, print_all=verbose)
         else:
             sfl.print_tsv_errors(errors, sys.stdout, sfl_file, print_all=verbose)
-        if not force and len([e for e in errors if e["level"] == "error"]) > 0:
+        if not force and (errors["level"] == "error").any():
             sys.exit(1)
-    sfl.save_to_db(df, db_file, cruise, serial)
+    sfl.save_to_db(df, db_file, cruise, serial, incremental=incremental)
+    if incremental:
+        db.save_sfl_import_state(db_file, sfl_path, reader.state())
 
 
 @db_cmd.command('import-filter-params')
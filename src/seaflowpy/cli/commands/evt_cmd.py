@@ -2,50 +2,18 @@ import logging
 import os
 import pathlib
 import sys
+import tempfile
 
 import click
-import numpy as np
 import pandas as pd
-import pkg_resources
-from seaflowpy import beads
+import seaflowpy
 from seaflowpy import errors
 from seaflowpy import seaflowfile
 from seaflowpy import fileio
 from seaflowpy import sample
 from seaflowpy import sfl
-from seaflowpy import time
-
-
-def validate_file_fraction(ctx, param, value):
-    if value <= 0 or value > 1:
-        raise click.BadParameter('must be a number > 0 and <= 1.')
-    return value
-
-
-def validate_positive(ctx, param, value):
-    if value is not None and value <= 0:
-        raise click.BadParameter('must be a number > 0.')
-    return value
-
-
-def validate_seed(ctx, param, value):
-    if value is not None:
-        try:
-            value = int(value)
-        except ValueError as e:
-            raise click.BadParameter('must be an integer: {}.'.format(e))
-        if (value < 0 or value > (2**32 - 1)):
-            raise click.BadParameter('must be between 0 and 2**32 - 1.')
-    return value
-
-
-def validate_timestamp(ctx, param, value):
-    if value is not None:
-        try:
-            value = time.parse_date(value, assume_utc=False)
-        except ValueError:
-            raise click.BadParameter('unable to parse timestamp.')
-    return value
+from seaflowpy.cli.validators import (validate_file_fraction, validate_positive,
+    validate_seed, validate_timestamp)
 
 
 @click.group()
@@ -84,46 +52,48 @@ def count_evt_cmd(no_header, evt_files):
     header_printed = False
 
     for filepath in files:
-        # Default values
-        filetype = '-'
-        file_id = '-'
-        events = 0
-
-        # Try to parse filename as SeaFlow file
-        try:
-            sff = seaflowfile.SeaFlowFile(filepath)
-            file_id = sff.file_id
-            if sff.is_opp:
-                filetype = 'opp'
-            else:
-                filetype = 'evt'
-        except errors.FileError:
-            # Might have unusual name
-            pass
-        try:
-            events = fileio.read_labview_row_count(filepath)
-        except errors.FileError:
-            pass  # accept defaults, do nothing
-
+        r = fileio.count_file(filepath)
         if not header_printed and not no_header:
             print('\t'.join(['path', 'file_id', 'type', 'events']))
             header_printed = True
-        print('\t'.join([filepath, file_id, filetype, str(events)]))
+        print('\t'.join([r['path'], r['file_id'], r['type'], str(r['events'])]))
 
 
 @evt_cmd.command('beads')
 @click.option('-c', '--cruise', type=str, required=True,
     help='Cruise name for summary plot title.')
+@click.option('--cache-dir', type=click.Path(file_okay=False),
+    help="""Directory for cached bead finding results. Time windows with the same
+    event data and clustering parameters as a previous run are read from this
+    cache instead of being clustered again. Cached results are not used for
+    windows that need cytogram plots.""")
+@click.option('--cache-size', type=int, default=256, show_default=True, callback=validate_positive,
+    help='Maximum size of bead finding cache in MiB.')
 @click.option('-C', '--cytograms', is_flag=True, default=False, show_default=True,
-    help="""Create per-time-window cytogram PNGs. Files may be about 1-2MB and plotting
-    is much slower than bead finding itself, so consider using with a limited time
-    range and/or large resolution for diagnostic purposes.""")
+    help="""Create per-time-window cytogram PNGs. Files may be about 1-2MB. With
+    --density hist plotting takes a few times longer than bead finding, mostly to
+    draw the figure. --density densCols is much slower, so consider using it with a
+    limited time range and/or large resolution for diagnostic purposes.""")
+@click.option('--density', type=click.Choice(['hist', 'densCols']), default='hist', show_default=True,
+    help="""Density coloring engine for cytogram plots. 'hist' uses a smoothed 2d
+    histogram, 'densCols' uses a slower kernel density estimate.""")
 @click.option('-e', '--event-limit', type=int, default=30000, show_default=True,
     help='Maximum event count for bead clustering.')
 @click.option('-f', '--frac', type=float, default=0.33, show_default=True,
     help='min_cluster_frac parameter to hdbscan. Min fraction of data which should be in cluster.')
+@click.option('-g', '--grid-bins', type=int, callback=validate_positive,
+    help="""Bin events on a grid with this many bins per axis and cluster weighted
+    bin centers instead of raw events. Makes clustering cost independent of
+    --event-limit.""")
+@click.option('--grid-points', type=int, default=5000, show_default=True, callback=validate_positive,
+    help='Approximate maximum number of weighted bin centers to cluster with --grid-bins.')
 @click.option("-i", "--iqr", type=int, default=3000, show_default=True,
     help='Maximum interquartile spread to accept a bead location for fsc_small, D1, D2.')
+@click.option('-I', '--incremental', is_flag=True, default=False, show_default=True,
+    help="""Update an existing bead position parquet file in --out-dir. Only time
+    windows which are not in the existing file, or whose input events or bead
+    finding parameters have changed, are clustered again. Results for all other
+    windows are kept.""")
 @click.option('--min-date', type=str, callback=validate_timestamp,
     help='Minimum date of file to sample as ISO8601 timestamp.')
 @click.option('--max-date', type=str, callback=validate_timestamp,
@@ -141,12 +111,15 @@ def count_evt_cmd(no_header, evt_files):
 @click.option('-v', '--verbose', count=True,
     help='Print progress info.')
 @click.argument('particle-file', nargs=1, type=click.Path(exists=True))
-def beads_evt_cmd(cruise, cytograms, event_limit, frac, iqr, min_date,
-    max_date, min_fsc, min_pe, out_dir, other_params, resolution, verbose,
-    particle_file):
+def beads_evt_cmd(cruise, cache_dir, cache_size, cytograms, density, event_limit,
+    frac, grid_bins, grid_points, iqr, incremental, min_date, max_date, min_fsc,
+    min_pe, out_dir, other_params, resolution, verbose, particle_file):
     """
     Find bead location and generate filtering parameters.
     """
+    # hdbscan, scipy and matplotlib are slow to import, only load them here
+    from seaflowpy import beads
+
     if verbose == 0:
         loglevel = logging.WARNING
     elif verbose == 1:
@@ -157,17 +130,33 @@ def beads_evt_cmd(cruise, cytograms, event_limit, frac, iqr, min_date,
 
     logging.info("finding beads in cruise %s", cruise)
     logging.info(
-        "version=%s resolution=%s event-limit=%d frac=%f fsc-min=%d pe-min=%d iqr=%d",
-        pkg_resources.get_distribution("seaflowpy").version,
+        "version=%s resolution=%s event-limit=%d frac=%f grid-bins=%s grid-points=%d fsc-min=%d pe-min=%d iqr=%d",
+        seaflowpy.__version__,
         resolution,
         event_limit,
         frac,
+        grid_bins,
+        grid_points,
         min_fsc,
         min_pe,
         iqr
     )
     logging.info("writing results to %s", out_dir)
 
+    if cache_dir:
+        logging.info("bead finding cache: %s", cache_dir)
+        cache = beads.BeadCache(cache_dir, max_bytes=cache_size * 2**20)
+    else:
+        cache = None
+    cache_params = {
+        "frac": frac,
+        "min_fsc": min_fsc,
+        "min_pe": min_pe,
+        "event_limit": event_limit,
+        "grid_bins": grid_bins,
+        "grid_points": grid_points,
+    }
+
     if other_params:
         logging.info("other filter parameter file: %s", other_params)
         try:
@@ -178,52 +167,67 @@ def beads_evt_cmd(cruise, cytograms, event_limit, frac, iqr, min_date,
     else:
         otherip = None
 
-    evt_df = pd.read_parquet(particle_file)
-    if len(evt_df) == 0:
-        raise click.ClickException("no EVT data for bead finding")
-    if "date" not in evt_df.columns:
-        evt_df = evt_df.reset_index()  # maybe it's the index, don't drop
-    if "date" not in evt_df.columns:
-        raise click.ClickException("no date column in EVT dataframe")
-    logging.info("%d particles in %s", len(evt_df), particle_file)
-
-    # Apply any date filters
     if min_date or max_date:
-        date_bool = np.full(len(evt_df), True, dtype=bool)
         logging.info("apply date filter, %s to %s", min_date, max_date)
-        if min_date is not None:
-            date_bool = evt_df["date"] >= min_date
-            logging.info("%s after min_date filter", np.sum(date_bool))
-        if max_date is not None:
-            date_bool = date_bool & (evt_df["date"] <= max_date)
-            logging.info("%s after max_date filter", np.sum(date_bool))
-        evt_df = evt_df[date_bool]
-        logging.info(
-            "%s rows between %s and %s after date filter",
-            len(evt_df), evt_df["date"].min(), evt_df["date"].max()
+    try:
+        windows = beads.iter_evt_windows(
+            particle_file, resolution, min_date=min_date, max_date=max_date
         )
+    except errors.SeaFlowpyError as e:
+        raise click.ClickException(str(e))
 
     pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
     cyto_plot_dir = os.path.join(out_dir, "cytogram_plots")
     summary_plot_path = os.path.join(out_dir, f"{cruise}.summary.png")
+    parquet_path = os.path.join(out_dir, cruise + f".beads-by-{resolution}" + ".parquet")
+
+    prev_df = None
+    prev_hashes = {}
+    if incremental and os.path.exists(parquet_path):
+        logging.info("reading existing bead positions from %s", parquet_path)
+        prev_df = pd.read_parquet(parquet_path)
+        if "input_hash" in prev_df.columns:
+            prev_hashes = dict(zip(prev_df["date"], prev_df["input_hash"]))
+        else:
+            logging.warning("no input_hash column in %s, all windows will be clustered", parquet_path)
 
     all_dfs = []
-    for name, group in evt_df.set_index("date").resample(resolution):
-        if len(group) == 0:
-            continue
+    seen_dates, kept_dates = set(), set()
+    total_events = 0
+    for name, group in windows:
+        total_events += len(group)
         if len(group) <= event_limit:
-            tmp_df = group.reset_index(drop=True)
+            tmp_df = group
+        else:
+            tmp_df = group.sample(n=event_limit, random_state=12345).reset_index(drop=True)
+        seen_dates.add(name)
+        key = beads.cache_key(tmp_df, cache_params)
+        if not cytograms and prev_hashes.get(name) == key:
+            logging.info("keeping    %s", str(name))  # space intentional to line up with "clustering ...."
+            kept_dates.add(name)
+            continue
+        if len(tmp_df) == len(group):
             logging.info("clustering %s (%d events)", str(name), len(group))
         else:
-            tmp_df = group.reset_index(drop=True).sample(n=event_limit, random_state=12345).reset_index(drop=True)
             logging.info("clustering %s (%d events reduced to %d)", str(name), len(group), len(tmp_df))
+        results = None
+        if cache:
+            if not cytograms:
+                results = cache.get(key)
+                if results is not None:
+                    logging.info("using cached results for %s", str(name))
         try:
-            results = beads.find_beads(
-                tmp_df,
-                min_cluster_frac=frac,
-                min_fsc=min_fsc,
-                min_pe=min_pe
-            )
+            if results is None:
+                results = beads.find_beads(
+                    tmp_df,
+                    min_cluster_frac=frac,
+                    min_fsc=min_fsc,
+                    min_pe=min_pe,
+                    grid_bins=grid_bins,
+                    grid_points=grid_points
+                )
+                if cache:
+                    cache.put(key, results)
         except Exception as e:
             logging.warning("%s: %s", type(e).__name__, str(e))
             if type(e).__name__ != "ClusterError":
@@ -233,6 +237,7 @@ def beads_evt_cmd(cruise, cytograms, event_limit, frac, iqr, min_date,
                 logging.warning("%s", results["message"])
             df = results["bead_coordinates"]
             df["date"] = name
+            df["input_hash"] = key
             all_dfs.append(df)
 
         if cytograms:
@@ -241,18 +246,45 @@ def beads_evt_cmd(cruise, cytograms, event_limit, frac, iqr, min_date,
             pathlib.Path(cyto_plot_dir).mkdir(parents=True, exist_ok=True)
             cyto_plot_path = os.path.join(cyto_plot_dir, name.isoformat().replace(":", "-"))
             try:
-                beads.plot(results, cyto_plot_path, file_id=name, otherip=otherip)
+                beads.plot(results, cyto_plot_path, file_id=name, otherip=otherip, density=density)
             except Exception as e:
                 logging.warning("%s: %s", type(e).__name__, str(e))
+    if total_events == 0:
+        raise click.ClickException("no EVT data for bead finding")
+    logging.info("%d particles in %s", total_events, particle_file)
+
+    if prev_df is not None:
+        if seen_dates == kept_dates:
+            logging.info("no changes to existing bead positions")
+            logging.info("done")
+            return
+        # Keep previous results for windows which were not clustered again,
+        # including windows outside this run's date range.
+        logging.info(
+            "%d windows kept, %d windows clustered",
+            len(kept_dates), len(seen_dates) - len(kept_dates)
+        )
+        prev_df = prev_df[~prev_df["date"].isin(seen_dates - kept_dates)]
+        if len(prev_df):
+            all_dfs.insert(0, prev_df)
 
     if all_dfs:
         out_df = pd.concat(all_dfs, ignore_index=True)
+        out_df = out_df.sort_values(by=["date"], kind="mergesort").reset_index(drop=True)
         out_df["resolution"] = resolution
         out_df["resolution"] = out_df["resolution"].astype("category")
-        parquet_path = os.path.join(out_dir, cruise + f".beads-by-{resolution}" + ".parquet")
 
         logging.info("writing bead position parquet %s", parquet_path)
-        out_df.to_parquet(parquet_path)
+        # Write to a temporary file first so an existing file is replaced
+        # atomically.
+        fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=".", suffix=".parquet")
+        os.close(fd)
+        try:
+            out_df.to_parquet(tmp_path)
+            os.replace(tmp_path, parquet_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
         logging.info("creating summary plot")
         beads.plot_cruise(
             out_df,
@@ -261,6 +293,13 @@ def beads_evt_cmd(cruise, cytograms, event_limit, frac, iqr, min_date,
             cruise=cruise,
             iqr=iqr
         )
+    elif prev_df is not None:
+        # Every window left in the existing file was superseded and no new
+        # bead positions were found, don't leave stale results behind
+        logging.warning("no bead positions left, removing %s", parquet_path)
+        for path in [parquet_path, summary_plot_path]:
+            if os.path.exists(path):
+                os.remove(path)
     logging.info("done")
 
 
@@ -436,71 +475,17 @@ def validate_evt_cmd(report_all, files):
     ok, bad = 0, 0
 
     for filepath in files:
-        # Default values
-        type_from_filename = '-'
-        filetype = '-'
-        file_id = '-'
-        events = 0
-
-        # Try to parse filename as SeaFlow file
-        try:
-            sff = seaflowfile.SeaFlowFile(filepath)
-            file_id = sff.file_id
-            if sff.is_evt:
-                type_from_filename = 'evt'
-                filetype = 'evt'
-            elif sff.is_opp:
-                type_from_filename = 'opp'
-                filetype = 'opp'
-        except errors.FileError:
-            # unusual name, no file_id
-            pass
-
-        if type_from_filename == 'evt':
-            try:
-                data = fileio.read_evt_labview(filepath)
-                status = 'OK'
-                ok += 1
-                events = len(data.index)
-            except errors.FileError as e:
-                status = str(e)
-                bad += 1
-                events = 0
-        elif type_from_filename == 'opp':
-            try:
-                data = fileio.read_opp_labview(filepath)
-                status = 'OK'
-                ok += 1
-                events = len(data.index)
-            except errors.FileError as e:
-                status = str(e)
-                bad += 1
-                events = 0
-        elif type_from_filename == '-':
-            # Try to read as both EVT or OPP
-            try:
-                data = fileio.read_evt_labview(filepath)
-                filetype = 'evt'
-                status = 'OK'
-                ok += 1
-                events = len(data.index)
-            except errors.FileError:
-                try:
-                    data = fileio.read_opp_labview(filepath)
-                    filetype = 'opp'
-                    status = 'OK'
-                    ok += 1
-                    events = len(data.index)
-                except errors.FileError as e:
-                    status = str(e)
-                    bad += 1
-                    events = 0
+        r = fileio.validate_file(filepath)
+        if r['status'] == 'OK':
+            ok += 1
+        else:
+            bad += 1
 
         if not header_printed:
             print('\t'.join(['path', 'file_id', 'type', 'status', 'events']))
             header_printed = True
-        if (report_all and status == 'OK') or (status != 'OK'):
-            print('\t'.join([filepath, file_id, filetype, status, str(events)]))
+        if (report_all and r['status'] == 'OK') or (r['status'] != 'OK'):
+            print('\t'.join([r['path'], r['file_id'], r['type'], r['status'], str(r['events'])]))
     print('%d/%d files passed validation' % (ok, bad + ok), file=sys.stderr)
 
 
@@ -7,14 +7,9 @@ import random
 import sys
 import time
 import urllib
-import botocore
 import click
 import pandas as pd
-import pkg_resources
-from fabric.api import (cd, env, execute, hide, local, parallel, put, puts,
-    quiet, run, settings, show, sudo, task)
-from fabric.network import disconnect_all
-from seaflowpy import clouds
+import seaflowpy
 from seaflowpy import conf
 from seaflowpy import db
 from seaflowpy import errors
@@ -60,12 +55,16 @@ def validate_resolution(ctx, param, value):
     help='Limit number of files to process.')
 @click.option('-o', '--opp-dir', metavar='DIR',
     help='Directory in which to save OPP files. Will be created if does not exist.')
+@click.option('-c', '--cytogram-dir', metavar='DIR',
+    help='Directory in which to save per-file 2D cytogram histograms of EVT and OPP data. Will be created if does not exist.')
+@click.option('-k', '--sketches', is_flag=True,
+    help='Save per-window channel distribution sketches of EVT and OPP data to the sketch table of the database.')
 @click.option('-p', '--process-count', default=1, show_default=True, metavar="N", callback=validate_process_count,
     help='Number of processes to use in filtering.')
 @click.option('-r', '--resolution', default=10.0, show_default=True, metavar='N', callback=validate_resolution,
     help='Progress update resolution by %%.')
 @util.quiet_keyboardinterrupt
-def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, process_count, resolution):
+def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, cytogram_dir, sketches, process_count, resolution):
     """Filter EVT data locally."""
     # Validate args
     if not evt_dir and not s3_flag:
@@ -92,9 +91,11 @@ def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, proces
         'limit': limit,
         'db': dbpath,
         'opp_dir': opp_dir,
+        'cytogram_dir': cytogram_dir,
+        'sketches': sketches,
         'process_count': process_count,
         'resolution': resolution,
-        'version': pkg_resources.get_distribution("seaflowpy").version,
+        'version': seaflowpy.__version__,
         'cruise': cruise
     }
     to_delete = [k for k in v if v[k] is None]
@@ -109,8 +110,15 @@ def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, proces
     # Find EVT files
     print('Getting lists of files to filter')
     if evt_dir:
-        evt_files = seaflowfile.sorted_files(seaflowfile.find_evt_files(evt_dir))
+        # Duplicates are checked during directory scanning
+        try:
+            evt_files = seaflowfile.scan_evt_files(evt_dir)["path"].tolist()
+        except errors.FileError as e:
+            raise click.ClickException(str(e))
     elif s3_flag:
+        # boto is slow to import, only load it for S3 access
+        import botocore
+        from seaflowpy import clouds
         # Make sure configuration for s3 is ready to go
         config = conf.get_aws_config(s3_only=True)
         cloud = clouds.AWS(config.items("aws"))
@@ -128,11 +136,11 @@ def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, proces
             print('  $ aws configure', file=sys.stderr)
             raise click.Abort()
 
-    # Check for duplicates, exit with message if any exist
-    # This could be caused by gzipped and uncompressed files in the same location
-    uniques = {seaflowfile.SeaFlowFile(f).file_id for f in evt_files}
-    if len(uniques) < len(evt_files):
-        raise click.ClickException('Duplicate EVT file(s) detected')
+        # Check for duplicates, exit with message if any exist
+        # This could be caused by gzipped and uncompressed files in the same location
+        uniques = {seaflowfile.parse(f).file_id for f in evt_files}
+        if len(uniques) < len(evt_files):
+            raise click.ClickException('Duplicate EVT file(s) detected')
 
     # Get DataFrame of file IDs, paths, dates in common between discovered
     # EVT file paths and SFL files.
@@ -170,7 +178,9 @@ def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, proces
             opp_dir,
             s3=s3_flag,
             worker_count=process_count,
-            every=resolution
+            every=resolution,
+            cytogram_dir=cytogram_dir,
+            sketches=sketches
         )
     except errors.SeaFlowpyError as e:
         raise click.ClickException(str(e))
@@ -180,8 +190,6 @@ def local_filter_evt_cmd(delta, evt_dir, s3_flag, dbpath, limit, opp_dir, proces
 # Remote filter command section
 # ---------------------------------------------------------------------------- #
 
-REMOTE_WORK_DIR = "/mnt/ramdisk"
-REMOTE_DB_DIR = "{}/dbs".format(REMOTE_WORK_DIR)
 LATEST_EXE_URL = "https://github.com/armbrustlab/seaflowpy/releases/latest/download/seaflowpy-linux64"
 
 def validate_executable_file(ctx, param, value):
@@ -220,6 +228,15 @@ def remote_filter_evt_cmd(dryrun, executable, instance_count, no_cleanup,
 
     SQLite3 db files must contain filter parameters and cruise name
     """
+    # Fabric and boto are slow to import, only load them for remote filtering
+    import botocore
+    from seaflowpy import clouds
+    from fabric.api import env, execute, hide
+    from fabric.network import disconnect_all
+    from seaflowpy.cli.commands.filter_remote_tasks import (
+        REMOTE_DB_DIR, create_ramdisk, filter_cruise, install_system_dependencies,
+        mkdir, rsync_put, upload_seaflowpy, wait_for_up)
+
     print("Started at {}{}".format(datetime.datetime.utcnow().isoformat(), os.linesep))
 
     # Print defined parameters and information
@@ -233,7 +250,7 @@ def remote_filter_evt_cmd(dryrun, executable, instance_count, no_cleanup,
         'process_count': process_count,
         'instance_type': instance_type,
         'ramdisk_size': ramdisk_size,
-        'version': pkg_resources.get_distribution("seaflowpy").version
+        'version': seaflowpy.__version__
     }
     to_delete = [k for k in v if v[k] is None]
     for k in to_delete:
@@ -289,7 +306,7 @@ def remote_filter_evt_cmd(dryrun, executable, instance_count, no_cleanup,
                     raise click.Abort()
 
                 # Check for duplicates, exit with message if any exist
-                uniques = {seaflowfile.SeaFlowFile(f).file_id for f in evt_files}
+                uniques = {seaflowfile.parse(f).file_id for f in evt_files}
                 if len(uniques) < len(evt_files):
                     raise click.ClickException('Duplicate EVT file(s) detected')
 
@@ -417,148 +434,6 @@ def assign_keys_to_hosts(hosts, data):
     return assignments
 
 
-@task
-@parallel
-def wait_for_up():
-    # Try to run hostname to establish host is up and SSH is running
-    with hide('everything'):
-        # don't wait longer than 10 minutes
-        run('hostname', timeout=600)
-
-
-@task
-@parallel
-def create_ramdisk(gigabytes):
-    # Make ramdisk at REMOTE_WORK_DIR
-    with hide('everything'):
-        # don't wait longer than 10 minutes
-        sudo('mkdir -p {}'.format(REMOTE_WORK_DIR), timeout=600)
-        sudo('mount -t tmpfs -o size={}G tmpfs {}'.format(gigabytes, REMOTE_WORK_DIR), timeout=600)
-
-
-@task
-@parallel
-def rsync_put(localpaths, remotepath):
-    # Delete to remote
-    rsynccmd = [
-        'rsync', '-au', '--stats', '--delete', '-e',
-        "'ssh -i {} -o StrictHostKeyChecking=no'".format(env.key_filename)
-    ]
-    rsynccmd.extend(localpaths)
-    rsynccmd.append('{}@{}:{}'.format(env.user, env.host_string, remotepath))
-    result = local(' '.join(rsynccmd), capture=True)
-    return result
-
-
-@task
-@parallel
-def rsync_get(remotepath, localpath):
-    # no delete to local
-    rsynccmd = [
-        'rsync', '-au', '--stats', '-e',
-        "'ssh -i {} -o StrictHostKeyChecking=no'".format(env.key_filename),
-        '{}@{}:{}'.format(env.user, env.host_string, remotepath),
-        localpath
-    ]
-    result = local(' '.join(rsynccmd), capture=True)
-    return result
-
-@task
-@parallel
-def mkdir(d):
-    with quiet():
-        if run('test -d {}'.format(d)).failed:
-            run('mkdir -p {}'.format(d))
-
-@task
-@parallel
-def install_system_dependencies():
-    with quiet():
-        sudo('apt-get update -q')
-        sudo('apt-get install -qy zip')
-
-@task
-@parallel
-def upload_seaflowpy(executable):
-    put(executable, '/usr/local/bin/seaflowpy', use_sudo=True)
-    sudo('chmod +x /usr/local/bin/seaflowpy')
-    with show('stdout'):
-        run('seaflowpy version')
-
-@task
-@parallel
-def filter_cruise(host_assignments, output_dir, process_count=16):
-    util.mkdir_p(output_dir)
-
-    cruises = [x[0] for x in host_assignments[env.host_string]]
-    cruise_results = {}
-    with cd(REMOTE_WORK_DIR):
-        for c in cruises:
-            puts('Filtering cruise {}'.format(c))
-            with hide('commands'):
-                run('mkdir {}'.format(c))
-            with hide('commands'):
-                run('cp {}/{}.db {}'.format(REMOTE_DB_DIR, c, c))
-            with cd(c):
-                text = {
-                    'cruise': c,
-                    'process_count': process_count
-                }
-                with settings(warn_only=True), hide('output'):
-                    result = run(
-                        'seaflowpy filter local --s3 -d {cruise}.db -p {process_count} -o {cruise}_opp'.format(**text),
-                        timeout=10800
-                    )
-                    cruise_results[c] = result
-
-            puts(result)
-
-            if result.succeeded:
-                puts('Filtering successfully completed for cruise {}'.format(c))
-                puts('Zipping cruise {} results into single file archive.'.format(c))
-                with settings(warn_only=True), hide('output'):
-                    # Dont' compress, assuming all OPP data is already
-                    # gzipped. This zip file is just a more conveniently
-                    # indexed and cross-platform tar archive.
-                    result = run('zip -r -0 -q {}.zip {}'.format(c, c), timeout=10800)
-
-                puts('Returning results for cruise {}'.format(c))
-                rsyncout = execute(
-                    # rsync files in cruise results dir to local cruise dir
-                    rsync_get,
-                    os.path.join(REMOTE_WORK_DIR, '{}.zip'.format(c)),
-                    output_dir + '/',
-                    hosts=[env.host_string]
-                )
-
-                # Print rsync output on source host, even though this is run
-                # on local, just to make it clear in logs which host is being
-                # transferred from
-                puts(rsyncout[env.host_string])
-
-                # Erase data for this cruise on remote filtering server
-                puts('Removing results for cruise {} after successful transfer'.format(c))
-                with hide('commands'):
-                    run('rm -rf {} {}.zip'.format(c, c))
-            else:
-                sys.stderr.write('Filtering failed for cruise {}\n'.format(c))
-
-            # Always write log output
-            logpath = os.path.join(output_dir, '{}.seaflowpy_filter.log'.format(c))
-
-            with open(logpath, 'w') as logfh:
-                logfh.write('command={}\n'.format(cruise_results[c].command))
-                logfh.write('real_command={}\n'.format(cruise_results[c].real_command))
-                logfh.write(norm(cruise_results[c].stdout) + '\n')
-
-    return cruise_results
-
-# Fabric3 seems to be defaulting to /r/n line-endings. This function should fix
-# that.
-def norm(text):
-    """Normalize line-endings in a text string."""
-    return text.replace('\r\n', os.linesep).replace('\r', os.linesep)
-
 def download_latest_linux():
     """Download latest linux executable and return file path"""
     retry_limit = 3
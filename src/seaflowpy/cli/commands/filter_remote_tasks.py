@@ -0,0 +1,156 @@
+"""Fabric tasks for the remote filter command.
+
+Kept separate from filter_cmd so that Fabric is only imported when remote
+filtering is actually run.
+"""
+import os
+import sys
+from fabric.api import (cd, env, execute, hide, local, parallel, put, puts,
+    quiet, run, settings, show, sudo, task)
+from seaflowpy import util
+
+
+REMOTE_WORK_DIR = "/mnt/ramdisk"
+REMOTE_DB_DIR = "{}/dbs".format(REMOTE_WORK_DIR)
+
+@task
+@parallel
+def wait_for_up():
+    # Try to run hostname to establish host is up and SSH is running
+    with hide('everything'):
+        # don't wait longer than 10 minutes
+        run('hostname', timeout=600)
+
+
+@task
+@parallel
+def create_ramdisk(gigabytes):
+    # Make ramdisk at REMOTE_WORK_DIR
+    with hide('everything'):
+        # don't wait longer than 10 minutes
+        sudo('mkdir -p {}'.format(REMOTE_WORK_DIR), timeout=600)
+        sudo('mount -t tmpfs -o size={}G tmpfs {}'.format(gigabytes, REMOTE_WORK_DIR), timeout=600)
+
+
+@task
+@parallel
+def rsync_put(localpaths, remotepath):
+    # Delete to remote
+    rsynccmd = [
+        'rsync', '-au', '--stats', '--delete', '-e',
+        "'ssh -i {} -o StrictHostKeyChecking=no'".format(env.key_filename)
+    ]
+    rsynccmd.extend(localpaths)
+    rsynccmd.append('{}@{}:{}'.format(env.user, env.host_string, remotepath))
+    result = local(' '.join(rsynccmd), capture=True)
+    return result
+
+
+@task
+@parallel
+def rsync_get(remotepath, localpath):
+    # no delete to local
+    rsynccmd = [
+        'rsync', '-au', '--stats', '-e',
+        "'ssh -i {} -o StrictHostKeyChecking=no'".format(env.key_filename),
+        '{}@{}:{}'.format(env.user, env.host_string, remotepath),
+        localpath
+    ]
+    result = local(' '.join(rsynccmd), capture=True)
+    return result
+
+@task
+@parallel
+def mkdir(d):
+    with quiet():
+        if run('test -d {}'.format(d)).failed:
+            run('mkdir -p {}'.format(d))
+
+@task
+@parallel
+def install_system_dependencies():
+    with quiet():
+        sudo('apt-get update -q')
+        sudo('apt-get install -qy zip')
+
+@task
+@parallel
+def upload_seaflowpy(executable):
+    put(executable, '/usr/local/bin/seaflowpy', use_sudo=True)
+    sudo('chmod +x /usr/local/bin/seaflowpy')
+    with show('stdout'):
+        run('seaflowpy version')
+
+@task
+@parallel
+def filter_cruise(host_assignments, output_dir, process_count=16):
+    util.mkdir_p(output_dir)
+
+    cruises = [x[0] for x in host_assignments[env.host_string]]
+    cruise_results = {}
+    with cd(REMOTE_WORK_DIR):
+        for c in cruises:
+            puts('Filtering cruise {}'.format(c))
+            with hide('commands'):
+                run('mkdir {}'.format(c))
+            with hide('commands'):
+                run('cp {}/{}.db {}'.format(REMOTE_DB_DIR, c, c))
+            with cd(c):
+                text = {
+                    'cruise': c,
+                    'process_count': process_count
+                }
+                with settings(warn_only=True), hide('output'):
+                    result = run(
+                        'seaflowpy filter local --s3 -d {cruise}.db -p {process_count} -o {cruise}_opp'.format(**text),
+                        timeout=10800
+                    )
+                    cruise_results[c] = result
+
+            puts(result)
+
+            if result.succeeded:
+                puts('Filtering successfully completed for cruise {}'.format(c))
+                puts('Zipping cruise {} results into single file archive.'.format(c))
+                with settings(warn_only=True), hide('output'):
+                    # Dont' compress, assuming all OPP data is already
+                    # gzipped. This zip file is just a more conveniently
+                    # indexed and cross-platform tar archive.
+                    result = run('zip -r -0 -q {}.zip {}'.format(c, c), timeout=10800)
+
+                puts('Returning results for cruise {}'.format(c))
+                rsyncout = execute(
+                    # rsync files in cruise results dir to local cruise dir
+                    rsync_get,
+                    os.path.join(REMOTE_WORK_DIR, '{}.zip'.format(c)),
+                    output_dir + '/',
+                    hosts=[env.host_string]
+                )
+
+                # Print rsync output on source host, even though this is run
+                # on local, just to make it clear in logs which host is being
+                # transferred from
+                puts(rsyncout[env.host_string])
+
+                # Erase data for this cruise on remote filtering server
+                puts('Removing results for cruise {} after successful transfer'.format(c))
+                with hide('commands'):
+                    run('rm -rf {} {}.zip'.format(c, c))
+            else:
+                sys.stderr.write('Filtering failed for cruise {}\n'.format(c))
+
+            # Always write log output
+            logpath = os.path.join(output_dir, '{}.seaflowpy_filter.log'.format(c))
+
+            with open(logpath, 'w') as logfh:
+                logfh.write('command={}\n'.format(cruise_results[c].command))
+                logfh.write('real_command={}\n'.format(cruise_results[c].real_command))
+                logfh.write(norm(cruise_results[c].stdout) + '\n')
+
+    return cruise_results
+
+# Fabric3 seems to be defaulting to /r/n line-endings. This function should fix
+# that.
+def norm(text):
+    """Normalize line-endings in a text string."""
+    return text.replace('\r\n', os.linesep).replace('\r', os.linesep)
@@ -0,0 +1,58 @@
+import sys
+import click
+from seaflowpy import psd
+from seaflowpy import util
+from seaflowpy.cli.validators import validate_positive
+
+
+@click.command()
+@click.option('-c', '--column', default='diam_mid', show_default=True,
+    type=click.Choice(['diam_lwr', 'diam_mid', 'diam_upr', 'Qc_lwr', 'Qc_mid', 'Qc_upr']),
+    help='VCT column to bin.')
+@click.option('-C', '--qc-column', default='Qc_mid', show_default=True,
+    type=click.Choice(['Qc_lwr', 'Qc_mid', 'Qc_upr']),
+    help='Carbon quota column summed as biomass.')
+@click.option('-b', '--bins', type=int, default=64, show_default=True, callback=validate_positive,
+    help='Number of log-spaced bins.')
+@click.option('--min', 'start', type=float,
+    help='Lower edge of the first bin. [default: 0.1 for diam, 0.001 for Qc]')
+@click.option('--max', 'stop', type=float,
+    help='Upper edge of the last bin. [default: 100 for diam, 1000 for Qc]')
+@click.option('-f', '--freq', metavar='OFFSET',
+    help='Time bin size as a pandas offset alias, e.g. 1H. [default: one time per SeaFlow file]')
+@click.option('-q', '--quantile', 'quantiles', type=float, multiple=True,
+    help='Quantile to bin. Can be specified multiple times. [default: all]')
+@click.option('-p', '--process-count', type=int, default=1, show_default=True, metavar='N', callback=validate_positive,
+    help='Number of processes to use.')
+@click.argument('vct-dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('outfile', type=click.Path(dir_okay=False, writable=True))
+@util.quiet_keyboardinterrupt
+def psd_cmd(column, qc_column, bins, start, stop, freq, quantiles, process_count, vct_dir, outfile):
+    """
+    Calculates particle size distributions.
+
+    Particles in VCT parquet files in VCT-DIR are counted, and their carbon
+    quotas summed, in log-spaced bins of COLUMN per time, quantile and
+    population. OUTFILE is a dense numpy .npz file if it ends with .npz,
+    otherwise a parquet file of non-empty bins with bin edges in the schema
+    metadata. Particles outside the bins are not counted, their number is
+    printed to STDERR.
+    """
+    vct_files = psd.find_vct_parquet_files(vct_dir)
+    if not vct_files:
+        raise click.ClickException(f'no VCT parquet files found in {vct_dir}')
+    try:
+        edges = psd.log_bins(column, bins, start=start, stop=stop)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    result = psd.psd(
+        vct_files,
+        edges,
+        column=column,
+        qc_column=qc_column,
+        freq=freq,
+        quantiles=list(quantiles) if quantiles else None,
+        process_count=process_count
+    )
+    psd.save(result, outfile)
+    print(f'{result["out_of_range"]} particles outside bins', file=sys.stderr)
@@ -1,7 +1,10 @@
-import datetime
 from builtins import str
+import re
 import click
+import numpy as np
+import pandas as pd
 from seaflowpy import errors
+from seaflowpy import sfl
 
 
 FILE_COLUMNS = [
@@ -10,38 +13,46 @@ FILE_COLUMNS = [
     'EVENT RATE'
 ]
 
-def parse_header(line):
-    """Create a dict of column indexes by field name"""
-    fields = line.rstrip().split('\t')
-    fields = [f.replace('.', ' ') for f in fields]
-    d = {x:i for i, x in enumerate(fields)}
-    return d
+# Legacy SDS file names, e.g. sds_2009_001_42 -> 2009_001/42.evt
+SDS_FILE_RE = re.compile(r'^sds_([^_]*)_([^_]*)_([^_]*)')
 
-def create_file_field(line, header):
-    """Create SeaFlow file name form this line"""
-    file_field = None
-    fields = line.rstrip().split('\t')
-    if ('file' in header) and ('day' in header):
-        filei = header['file']
-        dayi = header['day']
-        file_field = fields[dayi] + '/' + fields[filei] + '.evt'
-    elif 'FILE' in header:
-        filei = header['FILE']
-        if fields[filei].startswith('sds_'):
-            parts = fields[filei].split('_')
-            file_field = parts[1] + '_' + parts[2] + '/' + parts[3] + '.evt'
-    if not file_field:
-        raise errors.FileError('Could not create file name from line:\n%s' % line)
-    return file_field
+def read_sds(path):
+    """Read an SDS file as a DataFrame of unmodified strings.
 
-def create_date_field(line, header):
-    """Create ISO8601 date value from this line"""
-    date_field = None
-    fields = line.rstrip().split('\t')
-    if 'time' in header:
-        timei = header['time']
-        date_field = fields[timei].replace(' ', 'T') + '+00:00'  # assume UTC
-    elif 'computerUTC' in header:
+    '.' in column names is replaced with ' '.
+    """
+    df = pd.read_csv(path, sep='\t', dtype=str, na_filter=False, encoding='utf-8')
+    df.columns = [c.replace('.', ' ') for c in df.columns]
+    return df
+
+def _line(df, i):
+    """Reconstruct the SDS line for row i"""
+    return '\t'.join([str(v) for v in df.loc[i]])
+
+def create_file_column(df):
+    """Create SeaFlow file names for all rows of SDS DataFrame df"""
+    if ('file' in df.columns) and ('day' in df.columns):
+        file_column = [
+            d + '/' + f + '.evt' if isinstance(d, str) and isinstance(f, str) else None
+            for d, f in zip(df['day'], df['file'])
+        ]
+    elif 'FILE' in df.columns:
+        matches = [SDS_FILE_RE.match(f) if isinstance(f, str) else None for f in df['FILE']]
+        file_column = ['%s_%s/%s.evt' % m.groups() if m else None for m in matches]
+    else:
+        file_column = [None] * len(df)
+    file_column = pd.Series(file_column, index=df.index, dtype=object)
+    if file_column.isna().any():
+        bad = file_column.index[file_column.isna()][0]
+        raise errors.FileError('Could not create file name from line:\n%s' % _line(df, bad))
+    return file_column
+
+def create_date_column(df):
+    """Create ISO8601 date values for all rows of SDS DataFrame df"""
+    if 'time' in df.columns:
+        # assume UTC
+        date_column = [t.replace(' ', 'T') + '+00:00' if isinstance(t, str) else None for t in df['time']]
+    elif 'computerUTC' in df.columns:
         # Given the following definitions:
         # y = year
         # j = day of year
@@ -50,67 +61,68 @@ def create_date_field(line, header):
         # s = second
         #
         # Then computerUTC is formatted as yyjjjhhmmss
-        cutc = fields[header['computerUTC']]
-        assert len(cutc) == len('yyjjjhhmmss')
-        year = int('20' + cutc[:2])
-        dayofyear = int(cutc[2:5])
-        hours = int(cutc[5:7])
-        minutes = int(cutc[7:9])
-        seconds = int(cutc[9:11])
-
+        cutc = df['computerUTC']
+        good = np.array(
+            [isinstance(c, str) and len(c) == len('yyjjjhhmmss') and c.isdigit() for c in cutc],
+            dtype=bool
+        )
+        cutc = pd.to_numeric(cutc.where(good, '0')).to_numpy(dtype=np.int64)
+        year = 2000 + cutc // 10**9
+        dayofyear = (cutc // 10**6) % 1000
+        hours = (cutc // 10**4) % 100
+        minutes = (cutc // 10**2) % 100
+        seconds = cutc % 100
         # dayofyear to month/day
-        delta = datetime.timedelta(days=dayofyear-1, hours=hours, minutes=minutes,
-                                   seconds=seconds)
-        tmpd = datetime.datetime(year, 1, 1) + delta
+        dates = (year - 1970).astype('datetime64[Y]').astype('datetime64[s]')
+        dates = dates + ((dayofyear - 1) * 86400 + hours * 3600 + minutes * 60 + seconds)
         # Final UTC ISO8601 SeaFlow compatible timestamp string
-        date_field = tmpd.isoformat()  + '+00:00'
-    if not date_field:
-        raise errors.FileError('could not create date from line:\n%s' % line)
-    return date_field
+        date_column = [
+            d + '+00:00' if g else None
+            for d, g in zip(np.datetime_as_string(dates, unit='s'), good)
+        ]
+    else:
+        date_column = [None] * len(df)
+    date_column = pd.Series(date_column, index=df.index, dtype=object)
+    if date_column.isna().any():
+        bad = date_column.index[date_column.isna()][0]
+        raise errors.FileError('could not create date from line:\n%s' % _line(df, bad))
+    return date_column
+
+def sds2sfl(df):
+    """Convert SDS DataFrame to SFL DataFrame with SQL table column names.
+
+    Returns a 2-tuple of the SFL DataFrame and a list of SFL file columns
+    which were missing from the SDS data and have been filled with NA.
+    """
+    new_columns = {
+        'FILE': create_file_column(df),
+        'DATE': create_date_column(df),
+        'FILE DURATION': '180'
+    }
+    missing_fields = []
+    columns = {}
+    for col in FILE_COLUMNS:
+        if col in new_columns:
+            values = new_columns[col]
+        elif col in df.columns:
+            values = df[col]
+        else:
+            # If column is missing, just output NA and note for later
+            values = None
+            missing_fields.append(col)
+        columns[sfl.colname_mapping['file_to_table'][col]] = values
+    return pd.DataFrame(columns, index=df.index), missing_fields
 
 @click.command()
 @click.argument('input-sds', type=click.File())
 @click.argument('output-sfl', type=click.File(mode='w', atomic=True))
 def sds2sfl_cmd(input_sds, output_sfl):
     """Convert SDS file format to SFL."""
-    header = parse_header(input_sds.readline())
-
-    output_sfl.write('\t'.join(FILE_COLUMNS) + '\n')
-
-    missing_fields = {}
-
-    file_duration_field = '180'
-    for line in input_sds:
-        try:
-            file_field = create_file_field(line, header)
-            date_field = create_date_field(line, header)
-        except errors.FileError as e:
-            raise click.ClickException(str(e))
-
-        # Make a copy of header index lookup
-        d = dict(header)
-        # Capture original fields
-        fields = line.rstrip().split('\t')
-        # Add new or modified fields
-        fields.append(file_duration_field)
-        d['FILE DURATION'] = len(fields) - 1
-        fields.append(file_field)
-        d['FILE'] = len(fields) - 1
-        fields.append(date_field)
-        d['DATE'] = len(fields) - 1
-
-
-        # Write SFL subset of fields in correct order
-        outfields = []
-        for col in FILE_COLUMNS:
-            try:
-                outfields.append(fields[d[col]])
-            except KeyError as e:
-                # If column is missing, just output NA and note for later
-                outfields.append('NA')
-                missing_fields[str(e)] = True
-
-        output_sfl.write('\t'.join(outfields) + '\n')
+    try:
+        df, missing_fields = sds2sfl(read_sds(input_sds))
+    except errors.FileError as e:
+        raise click.ClickException(str(e))
+    sfl.save_to_file(df, output_sfl)
 
     if missing_fields:
-        click.echo('Some fields were missing from input file: %s' % ' '.join(list(missing_fields.keys())))
+        click.echo('Some fields were missing from input file: %s' % ' '.join(["'%s'" % f for f in missing_fields]))
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+import click
+from seaflowpy import errors
+from seaflowpy import service_client
+from seaflowpy.cli.validators import (validate_file_fraction, validate_positive,
+    validate_seed, validate_timestamp)
+
+
+def address_options(f):
+    """Add service host and port options to a command."""
+    f = click.option('--port', type=int, default=service_client.DEFAULT_PORT, show_default=True,
+        envvar='SEAFLOWPY_SERVE_PORT', help='Service port. Can be set with SEAFLOWPY_SERVE_PORT.')(f)
+    f = click.option('--host', default=service_client.DEFAULT_HOST, show_default=True,
+        envvar='SEAFLOWPY_SERVE_HOST', help='Service address. Can be set with SEAFLOWPY_SERVE_HOST.')(f)
+    return f
+
+
+def call(op, params, host, port):
+    """Send a request to the service, converting errors for click."""
+    try:
+        return service_client.request(op, params, host=host, port=port)
+    except errors.SeaFlowpyError as e:
+        raise click.ClickException(str(e))
+
+
+@click.group()
+def serve_cmd():
+    """
+    Local service with warm caches.
+
+    "serve start" runs a service which keeps imports, EVT directory listings,
+    filter parameters and a worker pool warm between requests. The other
+    subcommands are thin clients which send work to a running service.
+    """
+    pass
+
+
+@serve_cmd.command('start')
+@address_options
+@click.option('-p', '--process-count', type=int, default=1, show_default=True, callback=validate_positive,
+    help='Number of worker processes.')
+@click.option('-v', '--verbose', is_flag=True,
+    help='Log each request to STDERR.')
+def serve_start_cmd(host, port, process_count, verbose):
+    """Run the service in the foreground until stopped."""
+    from seaflowpy import service  # only the service needs the full stack
+
+    print(f'seaflowpy service listening on {host}:{port}', file=sys.stderr)
+    try:
+        service.serve(host=host, port=port, process_count=process_count, verbose=verbose)
+    except OSError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        pass
+
+
+@serve_cmd.command('stop')
+@address_options
+def serve_stop_cmd(host, port):
+    """Stop a running service."""
+    call('shutdown', {}, host, port)
+
+
+@serve_cmd.command('status')
+@address_options
+def serve_status_cmd(host, port):
+    """Print service status as JSON."""
+    print(json.dumps(call('status', {}, host, port), indent=2))
+
+
+@serve_cmd.command('count')
+@address_options
+@click.option('-H', '--no-header', is_flag=True, default=False, show_default=True,
+    help="Don't print column headers.")
+@click.argument('evt-files', nargs=-1, type=click.Path(exists=True))
+def serve_count_cmd(host, port, no_header, evt_files):
+    """
+    Reports event counts in EVT/OPP files, see "evt count".
+
+    Directories are searched for EVT/OPP files in the directory itself and its
+    day of year subdirectories. Outputs tab-delimited text to STDOUT.
+    """
+    if not evt_files:
+        return
+    results = call('count', {'paths': [os.path.abspath(f) for f in evt_files]}, host, port)
+    if results and not no_header:
+        print('\t'.join(['path', 'file_id', 'type', 'events']))
+    for r in results:
+        print('\t'.join([r['path'], r['file_id'], r['type'], str(r['events'])]))
+
+
+@serve_cmd.command('validate')
+@address_options
+@click.option('-a', '--all', 'report_all', is_flag=True,
+    help='Show information for all files. If not specified then only files errors are printed.')
+@click.argument('files', nargs=-1, type=click.Path(exists=True))
+def serve_validate_cmd(host, port, report_all, files):
+    """
+    Examines EVT/OPP files, see "evt validate".
+
+    Directories are searched for EVT/OPP files in the directory itself and its
+    day of year subdirectories. Prints file validation report to STDOUT. Print
+    summary of files passing validation to STDERR.
+    """
+    if not files:
+        return
+    results = call('validate', {'paths': [os.path.abspath(f) for f in files]}, host, port)
+    ok = 0
+    if results:
+        print('\t'.join(['path', 'file_id', 'type', 'status', 'events']))
+    for r in results:
+        if r['status'] == 'OK':
+            ok += 1
+        if report_all or r['status'] != 'OK':
+            print('\t'.join([r['path'], r['file_id'], r['type'], r['status'], str(r['events'])]))
+    print('%d/%d files passed validation' % (ok, len(results)), file=sys.stderr)
+
+
+@serve_cmd.command('sample')
+@address_options
+@click.option('-o', '--outpath', type=click.Path(), required=True,
+    help="""Output path for parquet file with subsampled event data.""")
+@click.option('-c', '--count', type=int, default=100000, show_default=True, callback=validate_positive,
+    help='Target number of events to keep.')
+@click.option('-f', '--file-fraction', type=float, default=0.1, show_default=True, callback=validate_file_fraction,
+    help='Fraction of files to sample from, > 0 and <= 1. Using --multi sets this option to 1.')
+@click.option('--min-chl', type=int, default=0, show_default=True,
+    help='Mininum chlorophyll (small) value.')
+@click.option('--min-fsc', type=int, default=0, show_default=True,
+    help='Mininum forward scatter (small) value.')
+@click.option('--min-pe', type=int, default=0, show_default=True,
+    help='Mininum phycoerythrin value.')
+@click.option('--min-date', type=str, callback=validate_timestamp,
+    help='Minimum date of file to sample as ISO8601 timestamp.')
+@click.option('--max-date', type=str, callback=validate_timestamp,
+    help='Maximum date of file to sample as ISO8601 timestamp.')
+@click.option('--multi', is_flag=True, default=False, show_default=True,
+    help='Sample --count events from each input file separately, rather than --count events overall.')
+@click.option('-n', '--noise-filter', is_flag=True, default=False, show_default=True,
+    help='Apply noise filter before subsampling.')
+@click.option('-s', '--seed', callback=validate_seed,
+    help='Integer seed for PRNG, otherwise system-dependent source of randomness is used to seed the PRNG.')
+@click.argument('files', nargs=-1, type=click.Path(exists=True))
+def serve_sample_cmd(host, port, outpath, count, file_fraction, min_chl, min_fsc,
+                     min_pe, min_date, max_date, multi, noise_filter, seed, files):
+    """
+    Sample a subset of events in EVT files, see "evt sample".
+
+    File dates are taken from file names. Prints a summary to STDERR.
+    """
+    params = {
+        'paths': [os.path.abspath(f) for f in files],
+        'outpath': os.path.abspath(outpath),
+        'count': count,
+        'file_fraction': file_fraction,
+        'min_chl': min_chl,
+        'min_fsc': min_fsc,
+        'min_pe': min_pe,
+        'min_date': min_date.isoformat() if min_date else None,
+        'max_date': max_date.isoformat() if max_date else None,
+        'multi': multi,
+        'noise_filter': noise_filter,
+        'seed': seed
+    }
+    result = call('sample', params, host, port)
+    results = result['results']
+    for r in results:
+        if r['msg']:
+            print('\t'.join([r['file_id'], r['msg']]), file=sys.stderr)
+    for err in result['errors']:
+        print(err, file=sys.stderr)
+    print('{} input files'.format(result['input_files']), file=sys.stderr)
+    print('{} files within time window'.format(result['time_files']), file=sys.stderr)
+    print('{} selected files'.format(result['chosen_files']), file=sys.stderr)
+    print('{} total events'.format(sum([r['events'] for r in results])), file=sys.stderr)
+    print('{} events after noise/min filtering'.format(sum([r['events_postfilter'] for r in results])), file=sys.stderr)
+    print('{} events sampled'.format(sum([r['events_postsampling'] for r in results])), file=sys.stderr)
+
+
+@serve_cmd.command('filter')
+@address_options
+@click.option('-D', '--delta', is_flag=True,
+    help='Filter EVT files which are not already present in the opp table.')
+@click.option('-e', '--evt-dir', metavar='DIR', required=True, type=click.Path(exists=True),
+    help='EVT directory path.')
+@click.option('-d', '--db', 'dbpath', required=True, metavar='FILE', type=click.Path(exists=True),
+    help='Popcycle SQLite3 db file with filter parameters and cruise name.')
+@click.option('-l', '--limit', type=int, metavar='N',
+    help='Limit number of files to process.')
+@click.option('-o', '--opp-dir', metavar='DIR',
+    help='Directory in which to save OPP files. Will be created if does not exist.')
+@click.option('-k', '--sketches', is_flag=True,
+    help='Save per-window channel distribution sketches of EVT and OPP data to the sketch table of the database.')
+def serve_filter_cmd(host, port, delta, evt_dir, dbpath, limit, opp_dir, sketches):
+    """
+    Filter EVT data in the service, see "filter local".
+
+    Filtering progress is printed by the service. Prints file counts as JSON
+    when done.
+    """
+    params = {
+        'dbpath': os.path.abspath(dbpath),
+        'evt_dir': os.path.abspath(evt_dir),
+        'opp_dir': os.path.abspath(opp_dir) if opp_dir else None,
+        'delta': delta,
+        'limit': limit,
+        'sketches': sketches
+    }
+    print(json.dumps(call('filter', params, host, port), indent=2))
@@ -1,8 +1,7 @@
 import os
 import sys
-import botocore
 import click
-from seaflowpy import clouds
+import pandas as pd
 from seaflowpy import db
 from seaflowpy import errors as sfperrors
 from seaflowpy import seaflowfile
@@ -84,12 +83,17 @@ def sfl_fix_event_rate_cmd(sfl_file, events_file):
     df = sfl.read_file(sfl_file)
     df = sfl.fix(df)
 
-    # Event counts should be a dict of { file: event_count }
+    # Event counts should be a dict or Series of { file: event_count }
     if events_file.endswith(".db"):
         event_counts = db.get_event_counts(events_file)
     else:
-        lines = [x.rstrip().split('\t') for x in events_file.readlines()]
-        event_counts = {seaflowfile.SeaFlowFile(x[0]).file_id: int(x[-1]) for x in lines}
+        with open(events_file) as fh:
+            lines = [x.rstrip().split('\t') for x in fh]
+        try:
+            parsed = seaflowfile.parse_many_valid([x[0] for x in lines])
+        except sfperrors.FileError as e:
+            raise click.ClickException(str(e))
+        event_counts = pd.Series([int(x[-1]) for x in lines], index=parsed["file_id"].values)
 
     df = sfl.fix_event_rate(df, event_counts)
     sfl.save_to_file(df, sys.stdout)
@@ -119,6 +123,9 @@ def manifest_cmd(verbose, sfl_file, evt_dir):
             _, _, bucket, evt_dir = evt_dir.split("/", 3)
         except ValueError:
             raise click.ClickException("could not parse bucket and folder from S3 EVT-DIR")
+        # boto is slow to import, only load it for S3 access
+        import botocore
+        from seaflowpy import clouds
         cloud = clouds.AWS([("s3-bucket", bucket)])
         try:
             files = cloud.get_files(evt_dir)
@@ -129,12 +136,12 @@ def manifest_cmd(verbose, sfl_file, evt_dir):
             print('  $ aws configure', file=sys.stderr)
             raise click.Abort()
         found_evt_files = seaflowfile.sorted_files(seaflowfile.keep_evt_files(files))
+        found_evt_ids = seaflowfile.parse_many(found_evt_files)["path_file_id"].tolist()
     else:
-        found_evt_files = seaflowfile.find_evt_files(evt_dir)
+        found_evt_ids = seaflowfile.scan_evt_files(evt_dir, check_duplicates=False)["path_file_id"].tolist()
 
     df = sfl.read_file(sfl_file)
     sfl_evt_ids = [seaflowfile.SeaFlowFile(f).file_id for f in df['file']]
-    found_evt_ids = [seaflowfile.SeaFlowFile(f).path_file_id for f in found_evt_files]
     sfl_set = set(sfl_evt_ids)
     found_set = set(found_evt_ids)
 
@@ -154,8 +161,10 @@ def manifest_cmd(verbose, sfl_file, evt_dir):
 
 
 @sfl_cmd.command('print')
+@click.option('-m', '--merge', is_flag=True,
+    help='Merge files by date instead of concatenating, removing duplicate files.')
 @click.argument('sfl-files', metavar='SFL', nargs=-1, type=click.Path(exists=True))
-def sfl_print_cmd(sfl_files):
+def sfl_print_cmd(merge, sfl_files):
     """
     Concatenates raw SFL files, prints a standardized SFL file.
 
@@ -175,17 +184,24 @@ def sfl_print_cmd(sfl_files):
     values.
 
     Input files will be concatenated in the order they're listed on the
-    command-line. Outputs to STDOUT.
+    command-line. With --merge, input files which are each sorted by date will
+    be merged into one stream sorted by date, keeping only the first line for
+    each file. A unique list of duplicate files removed is printed to STDERR.
+    Outputs to STDOUT.
     """
-    df = None
-    for f in sfl_files:
-        onedf = sfl.read_file(f)
-        onedf = sfl.fix(onedf)
-        if df is None:
-            df = onedf
-        else:
-            df = df.append(onedf)
-    sfl.save_to_file(df, sys.stdout)
+    if merge:
+        try:
+            dup_files = sfl.merge_files(sfl_files, sys.stdout)
+        except sfperrors.FileError as e:
+            raise click.ClickException(str(e))
+        if len(dup_files):
+            click.echo(os.linesep.join(['{}\t{}'.format(*d) for d in dup_files]), err=True)
+        return
+
+    for i, f in enumerate(sfl_files):
+        df = sfl.read_file(f)
+        df = sfl.fix(df)
+        sfl.save_to_file(df, sys.stdout, header=(i == 0))
 
 
 @sfl_cmd.command('validate')
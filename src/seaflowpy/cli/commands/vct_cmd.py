@@ -0,0 +1,47 @@
+import click
+from seaflowpy import db
+from seaflowpy import errors
+from seaflowpy import fileio
+from seaflowpy import util
+from seaflowpy.cli.validators import validate_positive
+
+
+@click.group()
+def vct_cmd():
+    """VCT file subcommand."""
+    pass
+
+
+@vct_cmd.command('convert')
+@click.option('-d', '--db', 'dbpath', metavar='FILE', type=click.Path(exists=True, dir_okay=False),
+    help='Popcycle SQLite3 db file with SFL data. Files are dated by the sfl table and files missing from it are skipped. [default: dates from file names]')
+@click.option('-w', '--window-size', default='1H', show_default=True, metavar='OFFSET',
+    help='Time window of each parquet file as a pandas offset alias.')
+@click.option('-p', '--process-count', type=int, default=1, show_default=True, metavar='N', callback=validate_positive,
+    help='Number of processes to use in conversion.')
+@click.argument('vct-dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('out-dir', type=click.Path(file_okay=False))
+@util.quiet_keyboardinterrupt
+def convert_vct_cmd(dbpath, window_size, process_count, vct_dir, out_dir):
+    """
+    Converts VCT CSV files to VCT parquet files.
+
+    VCT-DIR should have one subdirectory per quantile, e.g.
+    VCT-DIR/50/2014_185/2014-07-04T00-00-02+00-00.vct.gz. All files in a time
+    window are saved to one parquet file in OUT-DIR. Prints tab-delimited
+    output file paths, VCT file counts, and particle counts to STDOUT.
+    """
+    sfl_df = db.get_sfl_table(dbpath) if dbpath else None
+    try:
+        results = fileio.convert_vct_csv_tree(
+            vct_dir,
+            out_dir,
+            window_size=window_size,
+            sfl_df=sfl_df,
+            process_count=process_count
+        )
+    except (errors.SeaFlowpyError, ValueError) as e:
+        raise click.ClickException(str(e))
+    print('\t'.join(['path', 'files', 'particles']))
+    for r in results.itertuples(index=False):
+        print('\t'.join([r.path, str(r.files), str(r.particles)]))
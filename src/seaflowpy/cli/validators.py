@@ -0,0 +1,34 @@
+import click
+from seaflowpy import time
+
+
+def validate_file_fraction(ctx, param, value):
+    if value <= 0 or value > 1:
+        raise click.BadParameter('must be a number > 0 and <= 1.')
+    return value
+
+
+def validate_positive(ctx, param, value):
+    if value is not None and value <= 0:
+        raise click.BadParameter('must be a number > 0.')
+    return value
+
+
+def validate_seed(ctx, param, value):
+    if value is not None:
+        try:
+            value = int(value)
+        except ValueError as e:
+            raise click.BadParameter('must be an integer: {}.'.format(e))
+        if (value < 0 or value > (2**32 - 1)):
+            raise click.BadParameter('must be between 0 and 2**32 - 1.')
+    return value
+
+
+def validate_timestamp(ctx, param, value):
+    if value is not None:
+        try:
+            value = time.parse_date(value, assume_utc=False)
+        except ValueError:
+            raise click.BadParameter('unable to parse timestamp.')
+    return value
@@ -0,0 +1,224 @@
+"""
+Per-file 2D cytogram histograms.
+
+Histograms are computed during filtering for all EVT events and for focused
+particles in each quantile, for channel pairs in pairs. Raw SeaFlow channel
+values are already on a log scale, 0 to 2**16 - 1, so bins are equal width in
+raw values and log-spaced in linear values. Histograms for all files in a
+filtering time window are saved together in one compressed .npz file, so a
+time range can be viewed by summing histograms instead of reading particle
+data.
+"""
+import glob
+import os
+import numpy as np
+import pandas as pd
+from . import util
+
+
+# Channel pairs, as (x, y) columns
+pairs = [("fsc_small", "pe"), ("fsc_small", "chl_small"), ("D1", "D2")]
+
+# Default number of bins on each axis
+default_bins = 256
+
+# Upper bound of raw channel values
+_max_value = 2**16
+
+_arrays = ["file_ids", "dates", "layers", "pairs", "counts"]
+
+
+def bin_index(df, bins=default_bins):
+    """
+    Return flat 2D bin indices of particles for each channel pair.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        SeaFlow raw (not linearized) particle data.
+    bins: int, default default_bins
+        Number of bins on each axis.
+
+    Returns
+    -------
+    list of numpy.ndarray
+        For each pair in pairs, x bin * bins + y bin of each particle.
+    """
+    scale = bins / _max_value
+    # Each column is binned once, fsc_small is in more than one pair
+    columns = {c for pair in pairs for c in pair}
+    col_bins = {c: np.clip(df[c].values * scale, 0, bins - 1).astype(np.intp) for c in columns}
+    return [col_bins[x] * bins + col_bins[y] for x, y in pairs]
+
+
+def file_histograms(evt_df, bins=default_bins):
+    """
+    Calculate cytogram histograms for one EVT file.
+
+    Parameters
+    ----------
+    evt_df: pandas.DataFrame
+        SeaFlow raw EVT data with focused particles marked by
+        particleops.mark_focused().
+    bins: int, default default_bins
+        Number of bins on each axis.
+
+    Returns
+    -------
+    layers: list of str
+        "evt" for all events, then quantile column names, e.g. "q50", for
+        focused particles.
+    counts: numpy.ndarray
+        numpy.uint32 counts with dimensions (layer, pair, x bin, y bin).
+    """
+    q_cols = [c for c in evt_df.columns if c.startswith("q")]
+    layers = ["evt"] + q_cols
+    # Focused particle positions are shared by all pairs
+    selections = [np.flatnonzero(evt_df[q_col].values) for q_col in q_cols]
+    counts = np.zeros((len(layers), len(pairs), bins, bins), dtype=np.uint32)
+    for p, idx in enumerate(bin_index(evt_df, bins)):
+        counts[0, p] = np.bincount(idx, minlength=bins * bins).reshape(bins, bins)
+        for l, sel in enumerate(selections, start=1):
+            counts[l, p] = np.bincount(idx[sel], minlength=bins * bins).reshape(bins, bins)
+    return layers, counts
+
+
+def write_window(hists, date, window_size, outdir):
+    """
+    Save cytogram histograms for files in one time window.
+
+    Parameters
+    ----------
+    hists: list of dict
+        Histograms for each file, with "file_id", "date", "layers" and
+        "counts" from file_histograms(). All files must have the same layers
+        and bins.
+    date: pandas.Timestamp
+        Start timestamp of the time window.
+    window_size: str
+        pandas offset alias for the time window.
+    outdir: str
+        Output directory.
+
+    Raises
+    ------
+    ValueError if layers or bins differ between files.
+
+    Returns
+    -------
+    str
+        Path of outdir/<date>.<window_size>.cytogram.npz.
+    """
+    if not hists:
+        return None
+    layers = hists[0]["layers"]
+    shape = hists[0]["counts"].shape
+    for h in hists[1:]:
+        if h["layers"] != layers or h["counts"].shape != shape:
+            raise ValueError("cytogram histograms must have the same layers and bins")
+    util.mkdir_p(outdir)
+    path = os.path.join(outdir, date.isoformat().replace(":", "-")) + f".{window_size}.cytogram.npz"
+    np.savez_compressed(
+        path,
+        file_ids=np.array([h["file_id"] for h in hists], dtype=str),
+        dates=pd.to_datetime([h["date"] for h in hists]).values.astype("datetime64[ns]").astype(np.int64),
+        layers=np.array(layers, dtype=str),
+        pairs=np.array(["{}:{}".format(*p) for p in pairs], dtype=str),
+        counts=np.stack([h["counts"] for h in hists])
+    )
+    return path
+
+
+def read_window(path):
+    """
+    Read cytogram histograms saved by write_window().
+
+    Parameters
+    ----------
+    path: str
+        Cytogram histogram .npz file.
+
+    Returns
+    -------
+    dict
+        "file_ids", "dates" as numpy.datetime64, "layers", "pairs" as list of
+        (x, y) column tuples, and "counts" as numpy.uint32 counts with
+        dimensions (file, layer, pair, x bin, y bin).
+    """
+    with np.load(path) as data:
+        h = {k: data[k] for k in _arrays}
+    return {
+        "file_ids": h["file_ids"].tolist(),
+        "dates": h["dates"].astype("datetime64[ns]"),
+        "layers": h["layers"].tolist(),
+        "pairs": [tuple(p.split(":")) for p in h["pairs"].tolist()],
+        "counts": h["counts"]
+    }
+
+
+def find_window_files(cytogram_dir):
+    """Return a sorted list of cytogram histogram files in cytogram_dir."""
+    return sorted(glob.glob(os.path.join(cytogram_dir, "*.cytogram.npz")))
+
+
+def sum_histograms(cytogram_dir, start=None, end=None):
+    """
+    Sum cytogram histograms of all files in a time range.
+
+    Parameters
+    ----------
+    cytogram_dir: str
+        Directory of files saved by write_window().
+    start, end: pandas.Timestamp or str, optional
+        Only include files with start <= date <= end. Timestamps without a
+        time zone are UTC. Default no bound.
+
+    Raises
+    ------
+    ValueError if no files are found or layers, pairs or bins differ between
+    files.
+
+    Returns
+    -------
+    dict
+        "layers", "pairs", "files" as the number of files summed, and
+        "counts" as numpy.uint64 counts with dimensions (layer, pair, x bin,
+        y bin).
+    """
+    start = _utc_naive(start)
+    end = _utc_naive(end)
+    total, layers, pair_list, files = None, None, None, 0
+    for path in find_window_files(cytogram_dir):
+        # Arrays in .npz files are read on access, so counts are only read and
+        # decompressed for windows in the time range
+        with np.load(path) as data:
+            dates = data["dates"].astype("datetime64[ns]")
+            keep = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                keep &= dates >= start
+            if end is not None:
+                keep &= dates <= end
+            if not keep.any():
+                continue
+            window_layers = data["layers"].tolist()
+            window_pairs = [tuple(p.split(":")) for p in data["pairs"].tolist()]
+            window_sum = data["counts"][keep].sum(axis=0, dtype=np.uint64)
+        if total is None:
+            total, layers, pair_list = window_sum, window_layers, window_pairs
+        elif window_layers != layers or window_pairs != pair_list or window_sum.shape != total.shape:
+            raise ValueError(f"incompatible cytogram histograms in {path}")
+        else:
+            total += window_sum
+        files += int(keep.sum())
+    if total is None:
+        raise ValueError(f"no cytogram histograms in time range in {cytogram_dir}")
+    return {"layers": layers, "pairs": pair_list, "files": files, "counts": total}
+
+
+def _utc_naive(t):
+    if t is None:
+        return None
+    t = pd.Timestamp(t)
+    if t.tzinfo is not None:
+        t = t.tz_convert(None)
+    return t.to_datetime64()
@@ -73,6 +73,18 @@ CREATE TABLE IF NOT EXISTS sfl (
 
 CREATE INDEX IF NOT EXISTS sflDateIndex ON sfl (date);
 
+-- Progress of incremental SFL imports, as SFLTailReader state for each SFL
+-- file path. last_line is the last complete line read, used to detect a file
+-- that was replaced since the last import.
+CREATE TABLE IF NOT EXISTS sfl_import (
+  path TEXT NOT NULL,
+  offset INTEGER NOT NULL,
+  rows INTEGER NOT NULL,
+  header TEXT,
+  last_line BLOB,
+  PRIMARY KEY (path)
+);
+
 CREATE TABLE IF NOT EXISTS filter (
   id TEXT NOT NULL,
   date TEXT NOT NULL,
@@ -127,6 +139,27 @@ CREATE TABLE IF NOT EXISTS outlier (
   PRIMARY KEY (file)
 );
 
+-- Raw channel value distribution sketches per filtering time window, for
+-- EVT events above noise (layer "evt") and OPP particles in each quantile
+-- (layer e.g. "q50"). bins is zlib compressed little-endian uint32 counts.
+CREATE TABLE IF NOT EXISTS sketch (
+  window_start TEXT NOT NULL,
+  window_size TEXT NOT NULL,
+  filter_id TEXT NOT NULL,
+  layer TEXT NOT NULL,
+  channel TEXT NOT NULL,
+  count INTEGER NOT NULL,
+  p1 REAL,
+  p5 REAL,
+  p25 REAL,
+  p50 REAL,
+  p75 REAL,
+  p95 REAL,
+  p99 REAL,
+  bins BLOB NOT NULL,
+  PRIMARY KEY (window_start, filter_id, layer, channel)
+);
+
 CREATE VIEW IF NOT EXISTS stat AS
   SELECT
     opp.file as file,
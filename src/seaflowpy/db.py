@@ -6,7 +6,110 @@ import uuid
 import pandas as pd
 from . import errors
 from . import particleops
-from .seaflowfile import SeaFlowFile
+from . import seaflowfile
+
+
+# NOTE: values inserted must be in the same order as fields in sfl
+# table. Defining that order in a list here makes it easier to verify
+# that the right order is used.
+sfl_field_order = [
+    "file",
+    "date",
+    "file_duration",
+    "lat",
+    "lon",
+    "conductivity",
+    "salinity",
+    "ocean_tmp",
+    "par",
+    "bulk_red",
+    "stream_pressure",
+    "event_rate"
+]
+
+gating_field_order = [
+    "id",
+    "date",
+    "pop_order",
+    "pop",
+    "method",
+    "channel1",
+    "channel2",
+    "gate1",
+    "gate2",
+    "position1",
+    "position2",
+    "scale",
+    "minpe"
+]
+
+poly_field_order = [
+    "pop",
+    "fsc_small",
+    "fsc_perp",
+    "fsc_big",
+    "pe",
+    "chl_small",
+    "chl_big",
+    "point_order",
+    "gating_id"
+]
+
+vct_field_order = [
+    "file",
+    "pop",
+    "count",
+    "chl_1q",
+    "chl_med",
+    "chl_3q",
+    "pe_1q",
+    "pe_med",
+    "pe_3q",
+    "fsc_1q",
+    "fsc_med",
+    "fsc_3q",
+    "diam_lwr_1q",
+    "diam_lwr_med",
+    "diam_lwr_3q",
+    "diam_mid_1q",
+    "diam_mid_med",
+    "diam_mid_3q",
+    "diam_upr_1q",
+    "diam_upr_med",
+    "diam_upr_3q",
+    "Qc_lwr_1q",
+    "Qc_lwr_med",
+    "Qc_lwr_mean",
+    "Qc_lwr_3q",
+    "Qc_mid_1q",
+    "Qc_mid_med",
+    "Qc_mid_mean",
+    "Qc_mid_3q",
+    "Qc_upr_1q",
+    "Qc_upr_med",
+    "Qc_upr_mean",
+    "Qc_upr_3q",
+    "gating_id",
+    "filter_id",
+    "quantile"
+]
+
+sketch_field_order = [
+    "window_start",
+    "window_size",
+    "filter_id",
+    "layer",
+    "channel",
+    "count",
+    "p1",
+    "p5",
+    "p25",
+    "p50",
+    "p75",
+    "p95",
+    "p99",
+    "bins"
+]
 
 
 def create_db(dbpath):
@@ -50,6 +153,38 @@ def save_filter_params(dbpath, vals):
     executemany(dbpath, sql_insert, vals)
 
 
+def save_gating_params(dbpath, gating_vals, poly_vals):
+    """
+    Save a new set of gating parameters.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite DB file.
+    gating_vals: list of dicts
+        gating table rows, without "id" and "date". Optional columns can be
+        omitted.
+    poly_vals: list of dicts
+        poly table rows, without "gating_id". Channel columns not used by a
+        population's polygon can be omitted.
+
+    Returns
+    -------
+    str
+        New gating ID.
+    """
+    create_db(dbpath)
+    id_ = str(uuid.uuid4())
+    date = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    gating_vals = [dict(dict.fromkeys(gating_field_order), **v, id=id_, date=date) for v in gating_vals]
+    poly_vals = [dict(dict.fromkeys(poly_field_order), **v, gating_id=id_) for v in poly_vals]
+    gating_str = ", ".join([":" + f for f in gating_field_order])
+    executemany(dbpath, "INSERT INTO gating VALUES ({})".format(gating_str), gating_vals)
+    poly_str = ", ".join([":" + f for f in poly_field_order])
+    executemany(dbpath, "INSERT INTO poly VALUES ({})".format(poly_str), poly_vals)
+    return id_
+
+
 def save_metadata(dbpath, vals):
     create_db(dbpath)
     # Bit drastic but there should only be one entry in metadata at a time
@@ -115,6 +250,7 @@ def prep_opp(file, df, all_count, evt_count, filter_id):
     -------
     Array of values for save_opp_to_db().
     """
+    file_id = seaflowfile.parse(file).file_id
     vals = []
     for _q_col, q, _q_str, q_df in particleops.quantiles_in_df(df):
         opp_count = len(q_df.index)
@@ -123,7 +259,7 @@ def prep_opp(file, df, all_count, evt_count, filter_id):
         except ZeroDivisionError:
             opp_evt_ratio = 0.0
         vals.append({
-            "file": SeaFlowFile(file).file_id,
+            "file": file_id,
             "all_count": all_count,
             "opp_count": opp_count,
             "evt_count": evt_count,
@@ -134,6 +270,48 @@ def prep_opp(file, df, all_count, evt_count, filter_id):
     return vals
 
 
+def save_vct_to_db(df, dbpath):
+    """
+    Save aggregate statistics for classified particle data to SQLite.
+
+    Rows are inserted in a single transaction from DataFrame columns. Existing
+    rows with the same file, pop, gating_id and quantile are replaced.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        vct table values with columns from vct_field_order, e.g. from
+        classify.vct_stats().
+    dbpath: str
+        Path to SQLite DB file.
+    """
+    values_str = ", ".join(["?"] * len(vct_field_order))
+    sql_insert = "INSERT OR REPLACE INTO vct VALUES ({})".format(values_str)
+    columns = [df[f].tolist() for f in vct_field_order]
+    executemany(dbpath, sql_insert, zip(*columns))
+
+
+def save_sketch(vals, dbpath):
+    """
+    Save channel distribution sketches to the sketch table.
+
+    The sketch table is created if it doesn't exist, e.g. in databases created
+    by older versions.
+
+    Parameters
+    ----------
+    vals: list of dicts
+        Values array to be saved to sketch table, created by
+        sketch.prep_sketch().
+    dbpath: str
+        Path to SQLite DB file.
+    """
+    create_db(dbpath)
+    values_str = ", ".join([":" + f for f in sketch_field_order])
+    sql_insert = "INSERT OR REPLACE INTO sketch VALUES ({})".format(values_str)
+    executemany(dbpath, sql_insert, vals)
+
+
 def save_outlier(vals, dbpath):
     """
     Save entries in outlier table.
@@ -169,38 +347,136 @@ def prep_outlier(file, flag):
     -------
     A single item array of values for save_outlier().
     """
-    return [{"file": SeaFlowFile(file).file_id, "flag": flag}]
+    return [{"file": seaflowfile.parse(file).file_id, "flag": flag}]
 
 
 def save_sfl(dbpath, vals):
     create_db(dbpath)
 
-    # Remove any previous SFL data
-    sql_delete = "DELETE FROM sfl"
-    execute(dbpath, sql_delete)
+    # Remove any previous SFL data and incremental import progress
+    execute(dbpath, "DELETE FROM sfl")
+    execute(dbpath, "DELETE FROM sfl_import")
 
-    # NOTE: values inserted must be in the same order as fields in sfl
-    # table. Defining that order in a list here makes it easier to verify
-    # that the right order is used.
-    field_order = [
-        "file",
-        "date",
-        "file_duration",
-        "lat",
-        "lon",
-        "conductivity",
-        "salinity",
-        "ocean_tmp",
-        "par",
-        "bulk_red",
-        "stream_pressure",
-        "event_rate"
-    ]
-    values_str = ", ".join([":" + f for f in field_order])
+    values_str = ", ".join([":" + f for f in sfl_field_order])
     sql_insert = "INSERT OR REPLACE INTO sfl VALUES (%s)" % values_str
     executemany(dbpath, sql_insert, vals)
 
 
+def upsert_sfl(dbpath, df):
+    """
+    Insert or replace SFL rows without removing existing SFL data.
+
+    Rows are inserted in a single transaction from DataFrame columns. Existing
+    rows with the same file are replaced.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite3 database file.
+    df: pandas.DataFrame
+        SFL DataFrame with columns matching the sfl table.
+    """
+    create_db(dbpath)
+    values_str = ", ".join(["?"] * len(sfl_field_order))
+    sql_insert = "INSERT OR REPLACE INTO sfl VALUES (%s)" % values_str
+    columns = [df[f].tolist() for f in sfl_field_order]
+    executemany(dbpath, sql_insert, zip(*columns))
+
+
+def save_sfl_import_state(dbpath, path, state):
+    """
+    Save incremental import progress for an SFL file.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite3 database file.
+    path: str
+        SFL file path.
+    state: dict
+        sfl.SFLTailReader.state() after the last imported rows.
+    """
+    create_db(dbpath)
+    header = None if state["header"] is None else "\t".join(state["header"])
+    sql_insert = "INSERT OR REPLACE INTO sfl_import VALUES (?, ?, ?, ?, ?)"
+    executemany(dbpath, sql_insert, [(path, state["offset"], state["rows"], header, state["last_line"])])
+
+
+def get_sfl_import_state(dbpath, path):
+    """
+    Get incremental import progress for an SFL file.
+
+    Returns
+    -------
+    dict or None
+        State for sfl.SFLTailReader.set_state(), or None if path has not
+        been imported incrementally.
+    """
+    sql = "SELECT offset, rows, header, last_line FROM sfl_import WHERE path = ?"
+    try:
+        with sqlite3.connect(dbpath) as dbcon:
+            row = dbcon.execute(sql, (path,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+    offset, rows, header, last_line = row
+    return {
+        "offset": offset,
+        "rows": rows,
+        "header": None if header is None else header.split("\t"),
+        "last_line": last_line
+    }
+
+
+def get_sfl_file_ids(dbpath, file_ids):
+    """
+    Get file IDs which are already in the sfl table.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite3 database file.
+    file_ids: list of str
+        File IDs to look up.
+
+    Returns
+    -------
+    set of str
+        Items of file_ids present in the sfl table.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    found = set()
+    try:
+        with sqlite3.connect(dbpath) as dbcon:
+            # Stay below SQLite's default limit on query parameters
+            for i in range(0, len(file_ids), 500):
+                chunk = file_ids[i:i + 500]
+                sql = "SELECT file FROM sfl WHERE file IN ({})".format(", ".join(["?"] * len(chunk)))
+                found.update(r[0] for r in dbcon.execute(sql, chunk))
+    except sqlite3.Error:
+        return set()
+    return found
+
+
+def get_sfl_max_date(dbpath):
+    """
+    Get the latest date in the sfl table.
+
+    Returns
+    -------
+    str or None
+        Latest date as stored in the database, or None if there is no SFL
+        data.
+    """
+    sql = "SELECT MAX(date) FROM sfl"
+    try:
+        with sqlite3.connect(dbpath) as dbcon:
+            return dbcon.execute(sql).fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
 def get_cruise(dbpath):
     sql = "SELECT cruise FROM metadata"
     with sqlite3.connect(dbpath) as dbcon:
@@ -232,6 +508,37 @@ def get_serial(dbpath):
     return df.inst.tolist()[0]
 
 
+def get_latest_filter_stamp(dbpath):
+    """
+    Get the ID and date of the latest filter parameters.
+
+    This is much faster than get_latest_filter() and changes whenever the
+    latest filter parameters change.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite DB file.
+
+    Raises
+    ------
+    seaflowpy.errors.SeaFlowpyError if no filter parameters are found.
+
+    Returns
+    -------
+    (str, str)
+        Filter ID and date.
+    """
+    with sqlite3.connect(dbpath) as dbcon:
+        try:
+            row = dbcon.execute("SELECT id, date FROM filter ORDER BY date DESC LIMIT 1").fetchone()
+        except sqlite3.DatabaseError as e:
+            raise errors.SeaFlowpyError(f"Could not read filter table in {dbpath}: {e}") from e
+    if row is None:
+        raise errors.SeaFlowpyError("No filter parameters found in database {}\n".format(dbpath))
+    return tuple(row)
+
+
 def get_latest_filter(dbpath):
     with sqlite3.connect(dbpath) as dbcon:
         df = safe_read_sql("SELECT * FROM filter ORDER BY date DESC, quantile ASC", dbcon)
@@ -241,6 +548,49 @@ def get_latest_filter(dbpath):
     return df[df["id"] == _id]
 
 
+def get_gating_params(dbpath, gating_id=None):
+    """
+    Get gating parameters.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite DB file.
+    gating_id: str, optional
+        Gating ID, default the most recent gating parameters.
+
+    Raises
+    ------
+    seaflowpy.errors.SeaFlowpyError if no matching gating parameters are
+    found.
+
+    Returns
+    -------
+    (pandas.DataFrame, pandas.DataFrame)
+        gating table rows ordered by pop_order, and poly table rows ordered by
+        pop and point_order.
+    """
+    with sqlite3.connect(dbpath) as dbcon:
+        gating_df = safe_read_sql("SELECT * FROM gating ORDER BY date DESC, pop_order ASC", dbcon)
+        poly_df = safe_read_sql("SELECT * FROM poly ORDER BY pop ASC, point_order ASC", dbcon)
+    if gating_id is None:
+        if len(gating_df.index) == 0:
+            raise errors.SeaFlowpyError("No gating parameters found in database {}".format(dbpath))
+        gating_id = gating_df.iloc[0]["id"]
+    gating_df = gating_df[gating_df["id"] == gating_id].reset_index(drop=True)
+    if len(gating_df.index) == 0:
+        raise errors.SeaFlowpyError("No gating parameters with ID {} found in database {}".format(gating_id, dbpath))
+    poly_df = poly_df[poly_df["gating_id"] == gating_id].reset_index(drop=True)
+    return gating_df, poly_df
+
+
+def get_vct_table(dbpath):
+    sql = "SELECT * FROM vct ORDER BY file ASC, pop ASC, quantile ASC"
+    with sqlite3.connect(dbpath) as dbcon:
+        vctdf = safe_read_sql(sql, dbcon)
+    return vctdf
+
+
 def get_opp_table(dbpath, filter_id=""):
     if filter_id == "":
         sql = "SELECT * FROM opp ORDER BY file ASC, quantile ASC"
@@ -258,6 +608,44 @@ def get_outlier_table(dbpath):
     return outlierdf
 
 
+def get_sketch_table(dbpath, layer=None, channel=None):
+    """
+    Get channel distribution sketches saved during filtering.
+
+    Parameters
+    ----------
+    dbpath: str
+        Path to SQLite DB file.
+    layer: str, optional
+        Only get this layer, e.g. "evt" or "q50".
+    channel: str, optional
+        Only get this channel, e.g. "fsc_small".
+
+    Returns
+    -------
+    pandas.DataFrame
+        sketch table rows ordered by window, see sketch.merge_table() to
+        merge windows.
+    """
+    where, params = [], []
+    if layer is not None:
+        where.append("layer = ?")
+        params.append(layer)
+    if channel is not None:
+        where.append("channel = ?")
+        params.append(channel)
+    sql = "SELECT * FROM sketch"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY window_start ASC, layer ASC, channel ASC"
+    with sqlite3.connect(dbpath) as dbcon:
+        try:
+            df = pd.read_sql(sql, dbcon, params=params)
+        except pd.io.sql.DatabaseError as e:
+            raise errors.SeaFlowpyError(str(e))
+    return df
+
+
 def get_sfl_table(dbpath):
     sql = "SELECT * FROM sfl ORDER BY date ASC"
     with sqlite3.connect(dbpath) as dbcon:
@@ -266,10 +654,29 @@ def get_sfl_table(dbpath):
 
 
 def get_event_counts(dbpath):
+    """
+    Get EVT event counts for each file from the opp table.
+
+    Only opp results for the most recent filter parameters are considered.
+
+    Returns
+    -------
+    dict of {str: int}
+        Dictionary of file_id: event count.
+    """
     filterid = get_latest_filter(dbpath).loc[0, "id"]
-    opp = get_opp_table(dbpath, filterid)
-    grouped = opp[["file", "all_count"]].groupby(["file"])
-    return {name: group["all_count"].head(1).values[0] for name, group in grouped}
+    # all_count is repeated for each quantile, so take it from the row with the
+    # lowest quantile for each file. SQLite fills bare columns in aggregate
+    # queries from the row that matched MIN().
+    sql = """
+        SELECT file, all_count, MIN(quantile)
+        FROM opp
+        WHERE filter_id = ?
+        GROUP BY file
+    """
+    with sqlite3.connect(dbpath) as dbcon:
+        rows = dbcon.execute(sql, (filterid,)).fetchall()
+    return {file_id: all_count for file_id, all_count, _ in rows}
 
 
 def merge_dbs(db1, db2):
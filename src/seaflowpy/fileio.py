@@ -1,16 +1,33 @@
 from contextlib import contextmanager
 import gzip
 import io
+import multiprocessing as mp
 import os
 import zlib
 import numpy as np
 import pandas as pd
 from . import errors
 from . import particleops
-from .seaflowfile import SeaFlowFile
+from . import seaflowfile
 from . import util
 
 
+# Columns in VCT files, per-particle size and carbon quota estimates from
+# Mie theory for lower, middle and upper refractive indices, and population
+VCT_COLUMNS = ["diam_lwr", "Qc_lwr", "diam_mid", "Qc_mid", "diam_upr", "Qc_upr", "pop"]
+
+# Columns in Mie theory lookup tables, scatter is forward scatter normalized
+# to calibration bead forward scatter
+MIE_COLUMNS = ["scatter"] + VCT_COLUMNS[:-1]
+
+# Columns in VCT parquet files, one row per particle and quantile. Size and
+# carbon quota columns are float32, file_id and pop are categorical.
+VCT_PARQUET_COLUMNS = ["date", "file_id", "quantile"] + VCT_COLUMNS
+
+# Categorical VCT parquet columns, which are filtered after reading
+_vct_parquet_categorical = ["file_id", "pop"]
+
+
 @contextmanager
 def file_open_r(path, fileobj=None):
     """
@@ -58,7 +75,7 @@ def file_open_r(path, fileobj=None):
 
 
 @contextmanager
-def file_open_w(path):
+def file_open_w(path, compresslevel=9):
     """
     Open path for writing as a context manager.
 
@@ -72,13 +89,15 @@ def file_open_w(path):
     -----------
     path: str
         File path.
+    compresslevel: int, default 9
+        gzip compression level.
 
     Returns
     -------
     Context manager for writable file-like object.
     """
     if path.endswith('.gz'):
-        with gzip.open(path, mode='wb', compresslevel=9) as fh:
+        with gzip.open(path, mode='wb', compresslevel=compresslevel) as fh:
             yield fh
     else:
         with io.open(path, 'wb') as fh:
@@ -280,7 +299,7 @@ def read_vct_csv(path, fileobj=None):
         one text column for population labels.
     """
     with file_open_r(path, fileobj) as fh:
-        df = pd.read_csv(fh, sep=" ", names=["diam_lwr", "Qc_lwr", "diam_mid", "Qc_mid", "diam_upr", "Qc_upr", "pop"])
+        df = pd.read_csv(fh, sep=" ", names=VCT_COLUMNS)
         return df
 
 
@@ -314,6 +333,115 @@ def read_filter_params_csv(path):
     return df
 
 
+def read_mie_csv(path):
+    """
+    Read a Mie theory lookup table csv file.
+
+    Parameters
+    ----------
+    path: str
+        Path to csv file with columns from MIE_COLUMNS. Other columns are
+        ignored.
+
+    Returns
+    -------
+    pandas.DataFrame
+        MIE_COLUMNS columns sorted by increasing scatter.
+    """
+    try:
+        df = pd.read_csv(path)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError):
+        raise errors.FileError("could not parse {} as csv Mie table file".format(path))
+    missing = [c for c in MIE_COLUMNS if c not in df.columns]
+    if missing:
+        raise errors.FileError("Mie table file {} is missing columns: {}".format(path, ", ".join(missing)))
+    return df[MIE_COLUMNS].sort_values("scatter", kind="mergesort").reset_index(drop=True)
+
+
+def count_file(path):
+    """
+    Report the event count in the header of an EVT/OPP file.
+
+    Only the 4 byte row count header is read, see read_labview_row_count.
+    Files which can't be read or have unusual names are reported with defaults
+    rather than raising an exception.
+
+    Parameters
+    ----------
+    path: str
+        File path.
+
+    Returns
+    -------
+    dict
+        "path", "file_id" ('-' if unknown), "type" ("evt", "opp", or '-' if
+        unknown), and "events" (0 if unreadable).
+    """
+    result = {"path": path, "file_id": "-", "type": "-", "events": 0}
+    # Try to parse filename as SeaFlow file
+    try:
+        sff = seaflowfile.SeaFlowFile(path)
+        result["file_id"] = sff.file_id
+        result["type"] = "opp" if sff.is_opp else "evt"
+    except errors.FileError:
+        # Might have unusual name
+        pass
+    try:
+        result["events"] = int(read_labview_row_count(path))
+    except errors.FileError:
+        pass  # accept defaults, do nothing
+    return result
+
+
+def validate_file(path):
+    """
+    Validate an EVT/OPP file by reading all of its data.
+
+    The file type is determined from the file name. If the name can't be
+    parsed the file is read first as EVT and then as OPP.
+
+    Parameters
+    ----------
+    path: str
+        File path.
+
+    Returns
+    -------
+    dict
+        "path", "file_id" ('-' if unknown), "type" ("evt", "opp", or '-' if
+        unknown), "status" ("OK" or the reason validation failed), and
+        "events" (0 if invalid).
+    """
+    result = {"path": path, "file_id": "-", "type": "-", "status": "OK", "events": 0}
+    readers = [("evt", read_evt_labview), ("opp", read_opp_labview)]
+    # Try to parse filename as SeaFlow file
+    try:
+        sff = seaflowfile.SeaFlowFile(path)
+        result["file_id"] = sff.file_id
+        if sff.is_evt:
+            readers = readers[:1]
+        elif sff.is_opp:
+            readers = readers[1:]
+    except errors.FileError:
+        # unusual name, no file_id
+        pass
+
+    for filetype, reader in readers:
+        try:
+            data = reader(path)
+        except errors.FileError as e:
+            result["status"] = str(e)
+        else:
+            result["type"] = filetype
+            result["status"] = "OK"
+            result["events"] = len(data.index)
+            break
+    if result["status"] != "OK" and len(readers) == 1:
+        # Type is known from the file name even if the file is invalid
+        result["type"] = readers[0][0]
+    return result
+
+
 def write_labview(df, path):
     """
     Write SeaFlow event DataFrame as LabView binary file.
@@ -369,7 +497,7 @@ def write_evt_labview(df, path, outdir, gz=True):
     if df is None:
         return
 
-    sfile = SeaFlowFile(path)
+    sfile = seaflowfile.parse(path)
     outpath = os.path.join(outdir, sfile.file_id)
     if gz:
         outpath = outpath + ".gz"
@@ -416,7 +544,7 @@ def write_opp_labview(df, path, outdir, gz=True, require_all=True):
         # particle flags.
         df = particleops.encode_bit_flags(df.copy())
 
-        sfile = SeaFlowFile(path)
+        sfile = seaflowfile.parse(path)
         outpath = os.path.join(outdir, sfile.file_id + ".opp")
         if gz:
             outpath = outpath + ".gz"
@@ -424,6 +552,26 @@ def write_opp_labview(df, path, outdir, gz=True, require_all=True):
         write_labview(df[particleops.COLUMNS + ["bitflags"]], outpath)
 
 
+def write_vct_csv(df, path):
+    """
+    Write a VCT space-separated CSV SeaFlow data file for one quantile.
+
+    Parameters
+    -----------
+    df: pandas.DataFrame
+        SeaFlow VCT DataFrame with columns from VCT_COLUMNS.
+    path: str
+        Output file path. If this ends with '.gz' data will be gzip compressed.
+    """
+    # Make sure directory necessary directory tree exists
+    util.mkdir_p(os.path.dirname(path))
+    text = df[VCT_COLUMNS].to_csv(sep=" ", header=False, index=False)
+    # Full precision float text compresses slowly at higher levels for little
+    # size reduction
+    with file_open_w(path, compresslevel=1) as fh:
+        fh.write(text.encode("utf-8"))
+
+
 def write_opp_parquet(opp_dfs, date, window_size, outdir):
     """
     Write an OPP Parquet file.
@@ -447,7 +595,7 @@ def write_opp_parquet(opp_dfs, date, window_size, outdir):
 
     # Make sure directory necessary directory tree exists
     util.mkdir_p(outdir)
-    outpath = os.path.join(outdir, date.isoformat().replace(":", "-")) + f".{window_size}.opp.parquet"
+    outpath = window_parquet_path(outdir, date, window_size, "opp")
     df = pd.concat(opp_dfs, ignore_index=True)
     # Linearize data columns
     df = particleops.linearize_particles(df, columns=["D1", "D2", "fsc_small", "pe", "chl_small"])
@@ -487,3 +635,221 @@ def write_opp_parquet(opp_dfs, date, window_size, outdir):
 
     # Write parquet
     df.to_parquet(outpath, compression="snappy", index=False, engine="pyarrow")
+
+
+def window_parquet_path(outdir, date, window_size, kind):
+    """
+    Return the path of a time window parquet file.
+
+    Parameters
+    -----------
+    outdir: str
+        Output directory.
+    date: pandas.Timestamp or datetime.datetime object
+        Start timestamp of the time window.
+    window_size: str
+        pandas offset alias for the time window.
+    kind: str
+        File type, e.g. "opp" or "vct".
+
+    Returns
+    -------
+    str
+        outdir/<date>.<window_size>.<kind>.parquet, with ":" replaced by "-" in
+        date.
+    """
+    return os.path.join(outdir, date.isoformat().replace(":", "-")) + f".{window_size}.{kind}.parquet"
+
+
+def write_vct_parquet(df, path):
+    """
+    Write a VCT Parquet file.
+
+    Use snappy compression. Size and carbon quota columns are written as
+    float32, file_id and pop as categorical columns. Population categories of
+    a categorical pop column, e.g. from classify.classify_df(), are kept.
+    Dates are written as UTC without a time zone, the same as OPP parquet
+    files.
+
+    Parameters
+    -----------
+    df: pandas.DataFrame
+        SeaFlow VCT DataFrame for any number of files and quantiles, with
+        columns from VCT_PARQUET_COLUMNS. Other columns are not written.
+    path: str
+        Output file path.
+    """
+    util.mkdir_p(os.path.dirname(path))
+    df = df[VCT_PARQUET_COLUMNS].reset_index(drop=True)
+    df = df.astype({c: np.float32 for c in VCT_COLUMNS[:-1]})
+    df["quantile"] = df["quantile"].astype(np.float64)
+    df["date"] = pd.to_datetime(df["date"])
+    if df["date"].dt.tz is not None:
+        df["date"] = df["date"].dt.tz_convert(None)
+    for col in _vct_parquet_categorical:
+        if df[col].dtype.name != "category":
+            df[col] = df[col].astype("category")
+    df.to_parquet(path, compression="snappy", index=False, engine="pyarrow")
+
+
+def read_vct_parquet(path, columns=None, filters=None):
+    """
+    Read VCT Parquet files.
+
+    Parameters
+    -----------
+    path: str
+        VCT parquet file, or a directory of VCT parquet files.
+    columns: list of str, optional
+        Only read these columns, default all columns.
+    filters: list of tuple, optional
+        Only return rows which match all filters. Each filter is a tuple of
+        (column, op, value), where op is one of "=", "==", "!=", "<", ">",
+        "<=", ">=", "in" or "not in", e.g. [("quantile", "==", 50)] or
+        [("pop", "in", ["prochloro", "synecho"])]. Filtered columns don't need
+        to be in columns. Categorical columns file_id and pop can only be
+        filtered by equality and membership. Other filters are applied while
+        reading, which skips data that doesn't match.
+
+    Raises
+    ------
+    ValueError if a filter on file_id or pop uses an unsupported op.
+
+    Returns
+    -------
+    pandas.DataFrame
+        SeaFlow VCT DataFrame with columns from VCT_PARQUET_COLUMNS.
+    """
+    arrow_filters, df_filters = [], []
+    for f in filters or []:
+        if f[0] in _vct_parquet_categorical:
+            if f[1] not in ("=", "==", "!=", "in", "not in"):
+                raise ValueError(f"unsupported filter op for {f[0]}: {f[1]}")
+            df_filters.append(f)
+        else:
+            arrow_filters.append(f)
+    read_columns = columns
+    if columns is not None:
+        read_columns = list(columns) + [f[0] for f in df_filters if f[0] not in columns]
+    df = pd.read_parquet(path, engine="pyarrow", columns=read_columns, filters=arrow_filters or None)
+    if df_filters:
+        keep = np.ones(len(df.index), dtype=bool)
+        for col, op, value in df_filters:
+            if op in ("in", "not in"):
+                match = df[col].isin(value).values
+            else:
+                match = (df[col] == value).values
+            keep &= ~match if op in ("!=", "not in") else match
+        df = df[keep].reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def find_vct_csv_files(vct_dir):
+    """
+    Find VCT CSV files in a directory tree created by classify.
+
+    Parameters
+    -----------
+    vct_dir: str
+        VCT directory with one subdirectory per quantile, e.g.
+        vct_dir/50/2014_185/2014-07-04T00-00-02+00-00.vct.gz.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Chronologically sorted VCT files with "path", "file_id", "date" as
+        parsed from file names and "quantile" columns.
+    """
+    paths = []
+    with os.scandir(vct_dir) as it:
+        q_dirs = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+    for q_dir in q_dirs:
+        try:
+            q = float(q_dir.name)
+        except ValueError:
+            continue
+        q_paths = [p for p in util.find_files(q_dir.path) if p.endswith((".vct", ".vct.gz"))]
+        paths.extend((p, q) for p in q_paths)
+    parsed = seaflowfile.parse_many_valid([p for p, _ in paths])
+    parsed["quantile"] = [q for _, q in paths]
+    parsed = seaflowfile.sort_parsed(parsed)
+    return parsed[["path", "file_id", "date", "quantile"]].reset_index(drop=True)
+
+
+def _convert_vct_window(args):
+    files_df, outpath = args
+    # Parsing text from all files at once is much faster than reading each
+    # small file into its own DataFrame
+    chunks, counts = [], []
+    for path in files_df["path"]:
+        with file_open_r(path) as fh:
+            data = fh.read()
+        if data and not data.endswith(b"\n"):
+            data += b"\n"
+        chunks.append(data)
+        counts.append(data.count(b"\n"))
+    df = pd.read_csv(io.BytesIO(b"".join(chunks)), sep=" ", names=VCT_COLUMNS, dtype={"pop": "category"})
+    if len(df.index) != sum(counts):
+        raise errors.FileError(f"blank lines in VCT files for {outpath}")
+    for col in ["date", "file_id", "quantile"]:
+        df[col] = np.repeat(files_df[col].values, counts)
+    write_vct_parquet(df, outpath)
+    return outpath, len(files_df.index), len(df.index)
+
+
+def convert_vct_csv_tree(vct_dir, outdir, window_size="1H", sfl_df=None, process_count=1):
+    """
+    Convert a directory tree of VCT CSV files to VCT Parquet files.
+
+    Files are grouped into time windows and each window is written to
+    outdir/<window start>.<window_size>.vct.parquet. Windows are converted in
+    parallel.
+
+    Parameters
+    -----------
+    vct_dir: str
+        VCT directory, see find_vct_csv_files().
+    outdir: str
+        Output directory.
+    window_size: str, default "1H"
+        pandas offset alias for the time window of each output file.
+    sfl_df: pandas.DataFrame, optional
+        SFL data with "file" and "date" columns. If provided file dates come
+        from this table and files missing from it are skipped, otherwise dates
+        are parsed from file names.
+    process_count: int, default 1
+        Number of worker processes.
+
+    Raises
+    ------
+    seaflowpy.errors.FileError if a VCT file name can't be parsed or a file
+    has no date.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per output file with "path", "files" as count of VCT CSV
+        files and "particles" as count of rows.
+    """
+    files_df = find_vct_csv_files(vct_dir)
+    if sfl_df is not None:
+        dated = seaflowfile.date_evt_files(files_df["path"], sfl_df)
+        dated["date"] = pd.to_datetime(dated["date"], utc=True)
+        files_df = files_df.drop(columns="date").merge(dated[["path", "date"]], on="path")
+    undated = files_df["date"].isna()
+    if undated.any():
+        raise errors.FileError(f"no date for VCT file {files_df.loc[undated, 'path'].iloc[0]}")
+
+    work = []
+    for window_start, window_df in files_df.groupby(files_df["date"].dt.floor(window_size), sort=True):
+        work.append((window_df, window_parquet_path(outdir, window_start, window_size, "vct")))
+
+    results = []
+    if process_count > 1 and len(work) > 1:
+        with mp.Pool(min(process_count, len(work))) as pool:
+            results = list(pool.imap(_convert_vct_window, work))
+    else:
+        results = [_convert_vct_window(w) for w in work]
+    return pd.DataFrame(results, columns=["path", "files", "particles"])
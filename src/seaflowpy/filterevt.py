@@ -5,13 +5,15 @@ import sys
 import time
 import multiprocessing as mp
 import queue
+import numpy as np
 
-from . import clouds
 from .conf import get_aws_config
+from . import cytogram
 from . import db
 from . import errors
 from . import fileio
 from . import particleops
+from . import sketch
 from . import util
 
 
@@ -23,7 +25,8 @@ quantiles = [2.5, 50, 97.5]
 
 @util.quiet_keyboardinterrupt
 def filter_evt_files(files_df, dbpath, opp_dir, s3=False, worker_count=1,
-                     every=10.0, window_size="1H"):
+                     every=10.0, window_size="1H", filter_params=None,
+                     cytogram_dir=None, sketches=False):
     """Filter a list of EVT files.
 
     Positional arguments:
@@ -38,20 +41,15 @@ def filter_evt_files(files_df, dbpath, opp_dir, s3=False, worker_count=1,
         every - Percent progress output resolution
         window_size - Time window for grouping filtering EVT file sets,
             expressed as pandas time offsets.
+        filter_params - Filter parameters DataFrame as returned by
+            db.get_latest_filter(). If None, read from dbpath.
+        cytogram_dir - Directory for per-file 2D cytogram histograms of EVT
+            and OPP data, see cytogram.write_window(). If None, histograms
+            are not calculated.
+        sketches - Save per-window channel distribution sketches of EVT and
+            OPP data to the sketch table of dbpath, see sketch.prep_sketch(),
+            and print cruise median OPP channel values.
     """
-    work = {
-        "files_df": None,  # fill in later
-        "s3": s3,
-        "cloud_config_items": None,
-        "dbpath": dbpath,
-        "opp_dir": opp_dir,
-        "filter_params": None,  # fill in later from db,
-        "window_size": window_size,
-        "window_start_date": None,
-        "errors": [],  # global errors outside of processing single files
-        "results": []
-    }
-
     if not dbpath:
         raise ValueError("Must provide db path to filter_evt_files()")
     if worker_count < 1:
@@ -59,16 +57,21 @@ def filter_evt_files(files_df, dbpath, opp_dir, s3=False, worker_count=1,
     if every <= 0 or every > 100:
         raise ValueError("resolution must be > 0 and <= 100")
 
-    # Group by window_size
-    grouped = files_df.set_index("date").resample(window_size)
-
-    worker_count = min(len(grouped), worker_count)
-
-    work["filter_params"] = db.get_latest_filter(dbpath)
+    if filter_params is None:
+        filter_params = db.get_latest_filter(dbpath)
 
+    cloud_config_items = None
     if s3:
         aws_config = get_aws_config(s3_only=True)
-        work["cloud_config_items"] = aws_config.items("aws")
+        cloud_config_items = aws_config.items("aws")
+
+    works = window_work(
+        files_df, dbpath, opp_dir, filter_params, s3=s3,
+        cloud_config_items=cloud_config_items, window_size=window_size,
+        cytogram_dir=cytogram_dir, sketches=sketches
+    )
+
+    worker_count = min(len(works), worker_count)
 
     # Create input queue with info necessary to filter one file
     work_q = mp.Queue()
@@ -99,12 +102,8 @@ def filter_evt_files(files_df, dbpath, opp_dir, s3=False, worker_count=1,
     reporter.start()
 
     # Add work to the work queue, binned by hour
-    for name, group in grouped:
-        if len(group) > 0:
-            work_copy = copy.deepcopy(work)
-            work_copy["files_df"] = group.copy()
-            work_copy["window_start_date"] = name
-            work_q.put(work_copy)
+    for work in works:
+        work_q.put(work)
     # Put sentinel stop values on the input queue, one for each consumer process
     for _ in range(worker_count):
         work_q.put(stop)
@@ -124,99 +123,181 @@ def filter_evt_files(files_df, dbpath, opp_dir, s3=False, worker_count=1,
         reporter.join()
 
 
+def window_work(files_df, dbpath, opp_dir, filter_params, s3=False,
+                cloud_config_items=None, window_size="1H", cytogram_dir=None,
+                sketches=False):
+    """Group EVT files into time window work items for filter_window().
+
+    Positional and keyword arguments are the same as filter_evt_files(),
+    except cloud_config_items are AWS config items used when s3 is True.
+
+    Returns a list of work dicts, one per time window with EVT files.
+    """
+    work = {
+        "files_df": None,  # fill in later
+        "s3": s3,
+        "cloud_config_items": cloud_config_items,
+        "dbpath": dbpath,
+        "opp_dir": opp_dir,
+        "cytogram_dir": cytogram_dir,
+        "sketches": sketches,
+        "filter_params": filter_params,
+        "window_size": window_size,
+        "window_start_date": None,
+        "errors": [],  # global errors outside of processing single files
+        "results": []
+    }
+    works = []
+    for name, group in files_df.set_index("date").resample(window_size):
+        if len(group) > 0:
+            work_copy = copy.deepcopy(work)
+            work_copy["files_df"] = group.copy()
+            work_copy["window_start_date"] = name
+            works.append(work_copy)
+    return works
+
+
 @util.quiet_keyboardinterrupt
 def do_filter(work_q, opps_q):
-    """Filter one EVT file, save to sqlite3, return filter stats"""
+    """Filter time windows from work_q and put results on opps_q"""
     work = work_q.get()
     while work != stop:
-        #print("{} {} starting {} at {}".format(work["window_start_date"], os.getpid(), len(work["files_df"]), datetime.datetime.now().isoformat()), file=sys.stderr)
-        for date, row in work["files_df"].iterrows():
-            result = {
-                "error": "",
-                "all_count": 0,
-                "evt_count": 0,
-                "saturated_count": 0,
-                "opp": None,
-                "file_id": row["file_id"],
-                "path": row["path"]
-            }
+        opps_q.put(filter_window(work))
+        work = work_q.get()
 
-            try:
-                fileobj = None
-                if work["s3"]:
-                    cloud = clouds.AWS(work["cloud_config_items"])
-                    fileobj = cloud.download_file_memory(row["path"])
-                evt_df = fileio.read_evt_labview(path=row["path"], fileobj=fileobj)
-            except errors.FileError as e:
-                result["error"] = f"Could not parse file {row['path']}: {e}"
-                evt_df = particleops.empty_df()
-            except Exception as e:
-                result["error"] = f"Unexpected error when parsing file {row['path']}: {e}"
-                evt_df = particleops.empty_df()
 
+def filter_window(work):
+    """Filter EVT files in one time window work item, save OPP files, prep db data
+
+    Returns work with per-file filtering "results", db values and errors
+    added, ready for save_window().
+    """
+    #print("{} {} starting {} at {}".format(work["window_start_date"], os.getpid(), len(work["files_df"]), datetime.datetime.now().isoformat()), file=sys.stderr)
+    sketch_layers, sketch_counts = None, None  # window sum of file sketches
+    for date, row in work["files_df"].iterrows():
+        result = {
+            "error": "",
+            "all_count": 0,
+            "evt_count": 0,
+            "saturated_count": 0,
+            "opp": None,
+            "file_id": row["file_id"],
+            "path": row["path"]
+        }
+
+        try:
+            fileobj = None
+            if work["s3"]:
+                from . import clouds  # boto is slow to import, only load for S3
+                cloud = clouds.AWS(work["cloud_config_items"])
+                fileobj = cloud.download_file_memory(row["path"])
+            evt_df = fileio.read_evt_labview(path=row["path"], fileobj=fileobj)
+        except errors.FileError as e:
+            result["error"] = f"Could not parse file {row['path']}: {e}"
+            evt_df = particleops.empty_df()
+        except Exception as e:
+            result["error"] = f"Unexpected error when parsing file {row['path']}: {e}"
+            evt_df = particleops.empty_df()
+
+        try:
+            evt_df = particleops.mark_focused(evt_df, work["filter_params"], inplace=True)
+            opp_df = particleops.select_focused(evt_df)
+            opp_df["date"] = date
+            opp_df["file_id"] = row["file_id"]
+            opp_df["filter_id"] = work["filter_params"]["id"][0]
+            result["opp"] = opp_df
+            result["all_count"] = len(evt_df.index)
+            result["noise_count"] = len(evt_df[evt_df["noise"]].index)
+            result["saturated_count"] = len(evt_df[evt_df["saturated"]].index)
+            result["opp_count"] = len(opp_df[opp_df["q50"]])
+        except Exception as e:
+            result["error"] = f"Unexpected error when selecting focused partiles in file {row['path']}: {e}"
+
+        if work.get("cytogram_dir") and not result["error"]:
+            # Bin while EVT data is in memory, before it's discarded
             try:
-                evt_df = particleops.mark_focused(evt_df, work["filter_params"], inplace=True)
-                opp_df = particleops.select_focused(evt_df)
-                opp_df["date"] = date
-                opp_df["file_id"] = row["file_id"]
-                opp_df["filter_id"] = work["filter_params"]["id"][0]
-                result["opp"] = opp_df
-                result["all_count"] = len(evt_df.index)
-                result["noise_count"] = len(evt_df[evt_df["noise"]].index)
-                result["saturated_count"] = len(evt_df[evt_df["saturated"]].index)
-                result["opp_count"] = len(opp_df[opp_df["q50"]])
+                layers, counts = cytogram.file_histograms(evt_df)
+                result["cytogram"] = {"file_id": row["file_id"], "date": date, "layers": layers, "counts": counts}
             except Exception as e:
-                result["error"] = f"Unexpected error when selecting focused partiles in file {row['path']}: {e}"
-
-            work["results"].append(result)
+                # Not a filtering error, OPP data is still saved
+                work["errors"].append(f"Unexpected error when calculating cytograms for file {row['path']}: {e}")
 
-        # Prep db data
-        filter_id = work["filter_params"]["id"].unique().tolist()[0]
-        work["opp_vals"], work["outlier_vals"] = [], []
-        for r in work["results"]:
-            work["opp_vals"].extend(
-                db.prep_opp(
-                    r["file_id"],
-                    r["opp"],
-                    r["all_count"],
-                    r["all_count"] - r["noise_count"],
-                    filter_id
-                )
-            )
-            work["outlier_vals"].extend(db.prep_outlier(r["file_id"], 0))
-        # Save OPP file
-        # Only include OPP files with data in all quantiles
-        good_opps = []
-        for r in work["results"]:
-            if (not r["error"]) and particleops.all_quantiles(r["opp"]):
-                good_opps.append(r["opp"])
-        if (len(good_opps)):
-            #print("{} {} saving parquet at {}".format(work["window_start_date"], os.getpid(), datetime.datetime.now().isoformat()), file=sys.stderr)
+        if work.get("sketches") and not result["error"]:
             try:
-                if work["opp_dir"]:
-                    fileio.write_opp_parquet(
-                        good_opps,
-                        work["window_start_date"],
-                        work["window_size"],
-                        work["opp_dir"]
-                    )
+                layers, counts = sketch.file_sketches(evt_df)
+                if sketch_counts is None:
+                    sketch_layers, sketch_counts = layers, counts
+                elif layers == sketch_layers:
+                    sketch_counts += counts
+                else:
+                    raise ValueError(f"sketch layers {layers} != {sketch_layers}")
             except Exception as e:
-                work["errors"].append(f"Unexpected error when saving OPP for {work['window_start_date']}: {e}")
-        else:
-            work["errors"].append(f"No OPPs had data in all quantiles for {work['window_start_date']}")
+                work["errors"].append(f"Unexpected error when calculating sketches for file {row['path']}: {e}")
+
+        work["results"].append(result)
+
+    # Prep db data
+    filter_id = work["filter_params"]["id"].unique().tolist()[0]
+    work["opp_vals"], work["outlier_vals"] = [], []
+    for r in work["results"]:
+        work["opp_vals"].extend(
+            db.prep_opp(
+                r["file_id"],
+                r["opp"],
+                r["all_count"],
+                r["all_count"] - r["noise_count"],
+                filter_id
+            )
+        )
+        work["outlier_vals"].extend(db.prep_outlier(r["file_id"], 0))
+    work["sketch"], work["sketch_vals"] = None, []
+    if sketch_counts is not None:
+        work["sketch"] = {"layers": sketch_layers, "counts": sketch_counts}
+        work["sketch_vals"] = sketch.prep_sketch(
+            work["window_start_date"],
+            work["window_size"],
+            filter_id,
+            sketch_layers,
+            sketch_counts
+        )
+    # Save OPP file
+    # Only include OPP files with data in all quantiles
+    good_opps = []
+    for r in work["results"]:
+        if (not r["error"]) and particleops.all_quantiles(r["opp"]):
+            good_opps.append(r["opp"])
+    if (len(good_opps)):
+        #print("{} {} saving parquet at {}".format(work["window_start_date"], os.getpid(), datetime.datetime.now().isoformat()), file=sys.stderr)
+        try:
+            if work["opp_dir"]:
+                fileio.write_opp_parquet(
+                    good_opps,
+                    work["window_start_date"],
+                    work["window_size"],
+                    work["opp_dir"]
+                )
+        except Exception as e:
+            work["errors"].append(f"Unexpected error when saving OPP for {work['window_start_date']}: {e}")
+    else:
+        work["errors"].append(f"No OPPs had data in all quantiles for {work['window_start_date']}")
 
-        # Erase OPP from payload
-        for r in work["results"]:
-            del r["opp"]
+    # Save cytogram histograms
+    hists = [r.pop("cytogram") for r in work["results"] if "cytogram" in r]
+    if hists:
+        try:
+            cytogram.write_window(
+                hists,
+                work["window_start_date"],
+                work["window_size"],
+                work["cytogram_dir"]
+            )
+        except Exception as e:
+            work["errors"].append(f"Unexpected error when saving cytograms for {work['window_start_date']}: {e}")
 
-        #print("{} {} sending {}/{} results at {}".format(work["window_start_date"], os.getpid(), len(work["results"]), len(work["files_df"]), datetime.datetime.now().isoformat()), file=sys.stderr)
-        opps_q.put(work)
-        #print("{} {} sent {}/{} results at {}".format(work["window_start_date"], os.getpid(), len(work["results"]), len(work["files_df"]), datetime.datetime.now().isoformat()), file=sys.stderr)
-        work = work_q.get()
-        # if work != stop:
-        #     print("{} {} got more work {} at {}".format(work["window_start_date"], os.getpid(), len(work["files_df"]), datetime.datetime.now().isoformat()), file=sys.stderr)
-        # else:
-        #     print("{} got stop {}".format(os.getpid(), datetime.datetime.now().isoformat()), file=sys.stderr)
+    # Erase OPP from payload
+    for r in work["results"]:
+        del r["opp"]
+    return work
 
 
 @util.quiet_keyboardinterrupt
@@ -234,21 +315,26 @@ def do_save(opps_q, stats_q, files_left):
 
         files_left -= len(work["files_df"])
 
-        # Save to DB
-        try:
-            if work["dbpath"]:
-                if work["opp_vals"]:
-                    db.save_opp_to_db(work["opp_vals"], work["dbpath"])
-                if work["outlier_vals"]:
-                    db.save_outlier(work["outlier_vals"], work["dbpath"])
-                #print("{} {} db saved at {}".format(work["window_start_date"], os.getpid(), datetime.datetime.now().isoformat()), file=sys.stderr)
-        except Exception as e:
-            work["errors"].append("Unexpected error when saving file {} to db: {}".format(work["file"], e))
+        save_window(work)
 
         #print("{} {} sent stats at {}".format(work["window_start_date"], os.getpid(), datetime.datetime.now().isoformat()), file=sys.stderr)
         stats_q.put(work)
 
 
+def save_window(work):
+    """Save db values of a time window work item returned by filter_window()"""
+    try:
+        if work["dbpath"]:
+            if work["opp_vals"]:
+                db.save_opp_to_db(work["opp_vals"], work["dbpath"])
+            if work["outlier_vals"]:
+                db.save_outlier(work["outlier_vals"], work["dbpath"])
+            if work.get("sketch_vals"):
+                db.save_sketch(work["sketch_vals"], work["dbpath"])
+    except Exception as e:
+        work["errors"].append(f"Unexpected error when saving {work['window_start_date']} to db: {e}")
+
+
 @util.quiet_keyboardinterrupt
 def do_reporting(stats_q, done_q, file_count, every):
     event_count = 0
@@ -257,6 +343,7 @@ def do_reporting(stats_q, done_q, file_count, every):
     saturated_count = 0
     opp_count = 0
     files_ok = 0
+    sketch_layers, sketch_total = None, None  # window sketches merged across workers
 
     print("")
     print(f"Filtering {file_count} EVT files. Progress for 50th quantile every ~ {every}%")
@@ -289,6 +376,13 @@ def do_reporting(stats_q, done_q, file_count, every):
             for e in work["errors"]:
                 print(e, file=sys.stderr)
 
+        if work.get("sketch"):
+            if sketch_total is None:
+                sketch_layers = work["sketch"]["layers"]
+                sketch_total = work["sketch"]["counts"].astype(np.uint64)
+            elif work["sketch"]["layers"] == sketch_layers:
+                sketch_total += work["sketch"]["counts"]
+
         for r in work["results"]:
             files_seen += 1
 
@@ -355,4 +449,8 @@ def do_reporting(stats_q, done_q, file_count, every):
         )
     print(summary_text)
     print(f"{files_ok} / {file_count} EVT files parsed successfully")
+    if sketch_total is not None and "q50" in sketch_layers:
+        medians = sketch.percentile_values(sketch_total[sketch_layers.index("q50")], [50])[:, 0]
+        text = " ".join(f"{c}: {m:.0f}" for c, m in zip(sketch.channels, medians) if c in ["fsc_small", "chl_small", "pe"])
+        print(f"OPP 50% quantile median raw values {text}")
     done_q.put(None)
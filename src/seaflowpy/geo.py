@@ -1,5 +1,7 @@
 """Geo operations"""
 import re
+import numpy as np
+import pandas as pd
 
 
 GGALAT_RE = re.compile(r'^(?P<degrees>-?\d{2})(?P<minutes>\d{2}(?:\.\d+)?)$')
@@ -50,3 +52,74 @@ def is_gga_lat(coord):
 def is_gga_lon(coord):
     """Does this string look like a GGA longitude coordinate"""
     return bool(GGALON_RE.match(coord))
+
+
+def ggalat2dd_many(coords):
+    """
+    Vectorized GGA latitude to decimal degrees conversion.
+
+    Parameters
+    ----------
+    coords: pandas.Series or array-like of str
+        GGA latitude strings (with +/- for N/S).
+
+    Returns
+    -------
+    (pandas.Series of float, pandas.Series of bool)
+        Decimal degrees, with NaN for NA or malformed values, and a mask of
+        values which are not NA but could not be converted.
+    """
+    return _gga2dd_many(coords, GGALAT_RE, 90)
+
+
+def ggalon2dd_many(coords):
+    """
+    Vectorized GGA longitude to decimal degrees conversion.
+
+    Parameters
+    ----------
+    coords: pandas.Series or array-like of str
+        GGA longitude strings (with +/- for E/W).
+
+    Returns
+    -------
+    (pandas.Series of float, pandas.Series of bool)
+        Decimal degrees, with NaN for NA or malformed values, and a mask of
+        values which are not NA but could not be converted.
+    """
+    return _gga2dd_many(coords, GGALON_RE, 180)
+
+
+def is_gga_lat_many(coords):
+    """Vectorized is_gga_lat. Returns a boolean numpy array, False for non-strings."""
+    return _match_many(coords, GGALAT_RE)
+
+
+def is_gga_lon_many(coords):
+    """Vectorized is_gga_lon. Returns a boolean numpy array, False for non-strings."""
+    return _match_many(coords, GGALON_RE)
+
+
+def _match_many(coords, regex):
+    return np.array(
+        [isinstance(c, str) and regex.match(c) is not None for c in coords],
+        dtype=bool
+    )
+
+
+def _gga2dd_many(coords, regex, max_degrees):
+    if not isinstance(coords, pd.Series):
+        coords = pd.Series(coords, dtype=object)
+    matched = _match_many(coords, regex)
+    values = pd.to_numeric(coords.where(matched), errors="coerce").to_numpy(dtype=float)
+    magnitude = np.abs(values)
+    degrees = np.floor(magnitude / 100)
+    # Round away float error from subtraction to recover minutes as written
+    minutes = np.round(magnitude - degrees * 100, 10)
+    sign = np.where(np.signbit(values), -1, 1)
+    dd = sign * (degrees + (minutes / 60.0))
+    with np.errstate(invalid="ignore"):
+        good = matched & (degrees <= max_degrees) & (minutes <= 60)
+    dd[~good] = np.nan
+    bad = ~good & coords.notna().to_numpy()
+    return pd.Series(dd, index=coords.index), pd.Series(bad, index=coords.index)
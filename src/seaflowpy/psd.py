@@ -0,0 +1,448 @@
+"""
+Particle size distributions from VCT parquet files.
+
+Particles are counted, and their carbon quotas summed as biomass, in
+log-spaced bins of a size or carbon quota column, per time, quantile and
+population. VCT parquet files are processed one time window at a time, in
+parallel, so memory use depends on the size of one window and of the result,
+not of the cruise. Results are dense arrays with dimensions (time, quantile,
+population, bin).
+"""
+import glob
+import json
+import multiprocessing as mp
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from . import fileio
+
+
+# Default bin range for size and carbon quota columns, in um and pgC / cell
+default_range = {"diam": (0.1, 100.0), "Qc": (0.001, 1000.0)}
+
+# Columns of long format PSD parquet files
+parquet_columns = ["date", "quantile", "pop", "bin", "count", "biomass"]
+
+# Parquet schema metadata key for PSD bin edges and binned column
+_metadata_key = b"seaflowpy.psd"
+
+
+def find_vct_parquet_files(vct_dir):
+    """Return a sorted list of VCT parquet files in vct_dir."""
+    return sorted(glob.glob(os.path.join(vct_dir, "*.vct.parquet")))
+
+
+def log_bins(column, count=64, start=None, stop=None):
+    """
+    Create log-spaced bin edges.
+
+    Parameters
+    ----------
+    column: str
+        Binned VCT column, e.g. "diam_mid" or "Qc_mid".
+    count: int, default 64
+        Number of bins.
+    start, stop: float, optional
+        Lower edge of the first bin and upper edge of the last bin. Default
+        from default_range for column.
+
+    Raises
+    ------
+    ValueError if start or stop aren't set and column has no default range,
+    or if bounds aren't positive and increasing.
+
+    Returns
+    -------
+    numpy.ndarray
+        count + 1 bin edges.
+    """
+    if start is None or stop is None:
+        try:
+            default_start, default_stop = default_range[column.split("_")[0]]
+        except KeyError:
+            raise ValueError(f"no default bin range for {column}")
+        start = default_start if start is None else start
+        stop = default_stop if stop is None else stop
+    if start <= 0 or stop <= start:
+        raise ValueError("bin range must be positive and increasing")
+    if count < 1:
+        raise ValueError("count must be > 0")
+    return np.logspace(np.log10(start), np.log10(stop), count + 1)
+
+
+def bin_window(path, edges, column="diam_mid", qc_column="Qc_mid", freq=None, quantiles=None):
+    """
+    Bin particles in one VCT parquet file.
+
+    Bins are half-open [left, right) except the last bin, which includes its
+    upper edge, the same as numpy.histogram(). Particles outside the edges or
+    with missing values are not counted.
+
+    Parameters
+    ----------
+    path: str
+        VCT parquet file, see fileio.write_vct_parquet().
+    edges: numpy.ndarray
+        Increasing bin edges, e.g. from log_bins().
+    column: str, default "diam_mid"
+        VCT column to bin.
+    qc_column: str, default "Qc_mid"
+        Carbon quota column summed as biomass.
+    freq: str, optional
+        pandas offset alias of time bins. By default each file timestamp is a
+        separate time.
+    quantiles: list of float, optional
+        Only bin these quantiles, default all quantiles.
+
+    Returns
+    -------
+    dict
+        Partial PSD, see psd(), plus "out_of_range" as the count of particles
+        not counted.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    nbins = len(edges) - 1
+    filters = [("quantile", "in", list(quantiles))] if quantiles is not None else None
+    df = fileio.read_vct_parquet(
+        path,
+        columns=list(dict.fromkeys(["date", "quantile", "pop", column, qc_column])),
+        filters=filters
+    )
+    dates = df["date"].values
+    if freq is not None:
+        dates = pd.DatetimeIndex(dates).floor(freq).values
+    # Hash based factorize is faster than np.unique, which sorts all values
+    t_idx, times = pd.factorize(dates, sort=True)
+    q_idx, qs = pd.factorize(df["quantile"].values, sort=True)
+    if df["pop"].dtype.name == "category":
+        pops = list(df["pop"].cat.categories)
+        p_idx = df["pop"].cat.codes.values
+    else:
+        p_idx, pops = pd.factorize(df["pop"], sort=True)
+        pops = list(pops)
+
+    values = df[column].values
+    b_idx = np.searchsorted(edges, values, side="right") - 1
+    b_idx[values == edges[-1]] = nbins - 1
+    counted = (b_idx >= 0) & (b_idx < nbins) & (p_idx >= 0)
+
+    shape = (len(times), len(qs), len(pops), nbins)
+    flat = np.ravel_multi_index(
+        (t_idx[counted], q_idx[counted], p_idx[counted], b_idx[counted]),
+        shape
+    )
+    size = int(np.prod(shape))
+    counts = np.bincount(flat, minlength=size).astype(np.uint32).reshape(shape)
+    qc = df[qc_column].values[counted].astype(np.float64)
+    biomass = np.bincount(flat, weights=qc, minlength=size).reshape(shape)
+    return {
+        "dates": times,
+        "quantiles": qs,
+        "pops": pops,
+        "edges": edges,
+        "column": column,
+        "counts": counts,
+        "biomass": biomass,
+        "out_of_range": int(len(values) - counted.sum())
+    }
+
+
+def _bin_window_worker(args):
+    return bin_window(*args)
+
+
+class _Sum:
+    """
+    Running sum of partial PSDs.
+
+    Counts and biomass are added into arrays allocated for an expected number
+    of times, which grow by doubling if more times are added, so partial PSDs
+    don't need to be held until all are available. Times and quantiles are
+    sorted, and populations kept in order of first appearance, by result().
+    """
+
+    def __init__(self, edges, column, time_count=1):
+        self.edges = edges
+        self.column = column
+        self.times = {}
+        self.qs = {}
+        # Populations in order of first appearance, which keeps gate order
+        self.pops = {}
+        self.out_of_range = 0
+        self.dtype = None
+        shape = (max(time_count, 1), 0, 0, len(edges) - 1)
+        self.counts = np.zeros(shape, dtype=np.uint32)
+        self.biomass = np.zeros(shape, dtype=np.float64)
+
+    def _grow(self):
+        """Make room for all times, quantiles and populations added so far."""
+        cap, nq, npop = self.counts.shape[:3]
+        if len(self.times) <= cap and (nq, npop) == (len(self.qs), len(self.pops)):
+            return
+        if len(self.times) > cap:
+            cap = max(len(self.times), 2 * cap)
+        shape = (cap, len(self.qs), len(self.pops), len(self.edges) - 1)
+        for name in ["counts", "biomass"]:
+            prev = getattr(self, name)
+            arr = np.zeros(shape, dtype=prev.dtype)
+            # New times, quantiles and populations are appended to each axis
+            arr[:prev.shape[0], :nq, :npop] = prev
+            setattr(self, name, arr)
+
+    def add(self, part):
+        if part["column"] != self.column or not np.array_equal(part["edges"], self.edges):
+            raise ValueError("can't merge PSDs with different bins")
+        if self.dtype is None:
+            self.dtype = np.asarray(part["dates"]).dtype
+        idx = []
+        for keys, values in [
+                (self.times, part["dates"]),
+                (self.qs, part["quantiles"]),
+                (self.pops, part["pops"])]:
+            idx.append(np.array([keys.setdefault(v, len(keys)) for v in values], dtype=np.intp))
+        self._grow()
+        ix = np.ix_(*idx)
+        self.counts[ix] += part["counts"]
+        self.biomass[ix] += part["biomass"]
+        self.out_of_range += part.get("out_of_range", 0)
+
+    def result(self):
+        n = len(self.times)
+        times = np.array(list(self.times), dtype=self.dtype)
+        qs = np.array(list(self.qs))
+        t_order = np.argsort(times, kind="stable")
+        q_order = np.argsort(qs, kind="stable")
+        if np.array_equal(t_order, np.arange(n)) and np.array_equal(q_order, np.arange(len(qs))):
+            # Usual case of files added in time order, no copy unless fewer
+            # times than expected were added
+            counts, biomass = self.counts[:n], self.biomass[:n]
+            if n < self.counts.shape[0]:
+                counts, biomass = counts.copy(), biomass.copy()
+        else:
+            ix = np.ix_(t_order, q_order)
+            counts, biomass = self.counts[ix], self.biomass[ix]
+        return {
+            "dates": times[t_order],
+            "quantiles": qs[q_order],
+            "pops": list(self.pops),
+            "edges": self.edges,
+            "column": self.column,
+            "counts": counts,
+            "biomass": biomass,
+            "out_of_range": self.out_of_range
+        }
+
+
+def merge(parts):
+    """
+    Merge partial PSDs.
+
+    Times, quantiles and populations are combined, and counts and biomass for
+    the same time, quantile, population and bin are added, so windows may
+    share time bins.
+
+    Parameters
+    ----------
+    parts: list of dict
+        PSDs from bin_window() or psd() with the same bin edges and column.
+
+    Raises
+    ------
+    ValueError if parts is empty or bin edges or columns differ.
+
+    Returns
+    -------
+    dict
+        PSD, see psd().
+    """
+    if not parts:
+        raise ValueError("no PSDs to merge")
+    total = _Sum(parts[0]["edges"], parts[0]["column"], sum(len(p["dates"]) for p in parts))
+    for part in parts:
+        total.add(part)
+    return total.result()
+
+
+def psd(vct_paths, edges, column="diam_mid", qc_column="Qc_mid", freq=None, quantiles=None,
+        process_count=1):
+    """
+    Calculate particle size distributions from VCT parquet files.
+
+    Files are binned in parallel with bin_window() and each result is added
+    to the PSD as soon as it's available, as in merge().
+
+    Parameters
+    ----------
+    vct_paths: list of str
+        VCT parquet files.
+    edges: numpy.ndarray
+        Increasing bin edges, e.g. from log_bins().
+    column: str, default "diam_mid"
+        VCT column to bin.
+    qc_column: str, default "Qc_mid"
+        Carbon quota column summed as biomass.
+    freq: str, optional
+        pandas offset alias of time bins. By default each file timestamp is a
+        separate time.
+    quantiles: list of float, optional
+        Only bin these quantiles, default all quantiles.
+    process_count: int, default 1
+        Number of worker processes.
+
+    Raises
+    ------
+    ValueError if vct_paths is empty.
+
+    Returns
+    -------
+    dict
+        "dates" as numpy.datetime64 times, "quantiles", "pops" as list of
+        population names, "edges", "column" as the binned column, "counts"
+        as numpy.uint32 particle counts and "biomass" as summed carbon quota,
+        both arrays with dimensions (time, quantile, population, bin), and
+        "out_of_range" as the count of particles outside the edges.
+    """
+    if not vct_paths:
+        raise ValueError("no VCT parquet files")
+    edges = np.asarray(edges, dtype=np.float64)
+    work = [(p, edges, column, qc_column, freq, quantiles) for p in vct_paths]
+    # Usually one time per file
+    total = _Sum(edges, column, len(work))
+    if process_count > 1 and len(work) > 1:
+        with mp.Pool(min(process_count, len(work))) as pool:
+            for part in pool.imap(_bin_window_worker, work):
+                total.add(part)
+    else:
+        for w in work:
+            total.add(bin_window(*w))
+    return total.result()
+
+
+def to_df(result, drop_empty=True):
+    """
+    Convert a PSD to a long format DataFrame.
+
+    Parameters
+    ----------
+    result: dict
+        PSD from psd().
+    drop_empty: bool, default True
+        Drop rows with no particles.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns from parquet_columns, where "bin" is the bin index into edges
+        and "pop" is categorical.
+    """
+    shape = result["counts"].shape
+    t, q, p, b = np.indices(shape).reshape(4, -1)
+    counts = result["counts"].reshape(-1)
+    biomass = result["biomass"].reshape(-1)
+    if drop_empty:
+        keep = counts > 0
+        t, q, p, b, counts, biomass = t[keep], q[keep], p[keep], b[keep], counts[keep], biomass[keep]
+    return pd.DataFrame({
+        "date": result["dates"][t],
+        "quantile": result["quantiles"][q],
+        "pop": pd.Categorical.from_codes(p, categories=result["pops"]),
+        "bin": b.astype(np.uint16),
+        "count": counts,
+        "biomass": biomass
+    }, columns=parquet_columns)
+
+
+def save(result, path):
+    """
+    Save a PSD.
+
+    Paths ending in ".npz" save dense compressed numpy arrays. Other paths
+    save a long format parquet file of non-empty bins from to_df(), with bin
+    edges, all times, quantiles and populations in the schema metadata.
+
+    Parameters
+    ----------
+    result: dict
+        PSD from psd().
+    path: str
+        Output file path.
+    """
+    if path.endswith(".npz"):
+        np.savez_compressed(
+            path,
+            dates=result["dates"].astype("datetime64[ns]").astype(np.int64),
+            quantiles=result["quantiles"],
+            pops=np.array(result["pops"], dtype=str),
+            edges=result["edges"],
+            column=np.array(result["column"]),
+            counts=result["counts"],
+            biomass=result["biomass"]
+        )
+        return
+    meta = {
+        "column": result["column"],
+        "edges": [float(e) for e in result["edges"]],
+        "dates": result["dates"].astype("datetime64[ns]").astype(np.int64).tolist(),
+        "quantiles": [float(q) for q in result["quantiles"]],
+        "pops": list(result["pops"])
+    }
+    table = pa.Table.from_pandas(to_df(result), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_metadata_key] = json.dumps(meta).encode("utf-8")
+    pq.write_table(table.replace_schema_metadata(metadata), path, compression="snappy")
+
+
+def load(path):
+    """
+    Load a PSD saved by save().
+
+    Parameters
+    ----------
+    path: str
+        PSD .npz or parquet file.
+
+    Returns
+    -------
+    dict
+        PSD, see psd(), without "out_of_range".
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {
+                "dates": data["dates"].astype("datetime64[ns]"),
+                "quantiles": data["quantiles"],
+                "pops": data["pops"].tolist(),
+                "edges": data["edges"],
+                "column": str(data["column"]),
+                "counts": data["counts"],
+                "biomass": data["biomass"]
+            }
+    table = pq.read_table(path)
+    meta = json.loads(table.schema.metadata[_metadata_key])
+    df = table.to_pandas()
+    dates = np.array(meta["dates"], dtype=np.int64).astype("datetime64[ns]")
+    quantiles = np.array(meta["quantiles"], dtype=np.float64)
+    pops = meta["pops"]
+    edges = np.array(meta["edges"], dtype=np.float64)
+    shape = (len(dates), len(quantiles), len(pops), len(edges) - 1)
+    ix = (
+        np.searchsorted(dates, df["date"].values.astype("datetime64[ns]")),
+        np.searchsorted(quantiles, df["quantile"].values),
+        pd.Categorical(df["pop"], categories=pops).codes,
+        df["bin"].values.astype(np.intp)
+    )
+    counts = np.zeros(shape, dtype=np.uint32)
+    biomass = np.zeros(shape, dtype=np.float64)
+    counts[ix] = df["count"].values
+    biomass[ix] = df["biomass"].values
+    return {
+        "dates": dates,
+        "quantiles": quantiles,
+        "pops": pops,
+        "edges": edges,
+        "column": meta["column"],
+        "counts": counts,
+        "biomass": biomass
+    }
@@ -59,6 +59,7 @@ def sample(
     noise_filter=False,
     process_count=1,
     seed=None,
+    pool=None,
 ):
     """
     Randomly sample rows from EVT files.
@@ -91,6 +92,9 @@ def sample(
     seed: int, default None
         Integer seed for PRNG, used in sampling files and events. If None, a
         source of random seed will be used.
+    pool: multiprocessing.pool.Pool, default None
+        Existing worker pool to use. It's left open when sampling is done. If
+        None, a pool of process_count workers is created for this call.
 
     Returns
     -------
@@ -119,7 +123,9 @@ def sample(
     else:
         n_per_file = n // len(evtpaths)
 
-    pool = mp.Pool(processes=process_count)
+    own_pool = pool is None
+    if own_pool:
+        pool = mp.Pool(processes=process_count)
 
     # Result handling callbacks for mp.async_apply
     mp_results, mp_errs = [], []
@@ -139,17 +145,22 @@ def sample(
         "seed": seed,
     }
 
+    async_results = []
     for i, bucket_o_files in enumerate(file_buckets):
         args = (i, bucket_o_files, n_per_file)
-        pool.apply_async(
+        async_results.append(pool.apply_async(
             _sample_many_to_one_worker,
             args,
             kwargs,
             callback=cb,
             error_callback=err_cb,
-        )
-    pool.close()
-    pool.join()
+        ))
+    if own_pool:
+        pool.close()
+        pool.join()
+    else:
+        for r in async_results:
+            r.wait()
     mp_results = sorted(
         mp_results, key=lambda x: x["i"]
     )  # sort async results by orig order
@@ -230,7 +241,7 @@ def sample_many_to_one(
             seed=seed,
         )
         result["df"] = result["df"][columns]
-        file_id = seaflowfile.SeaFlowFile(f).file_id
+        file_id = seaflowfile.parse(f).file_id
         result["df"]["file_id"] = file_id
         result["file_id"] = file_id
         result["msg"] = msg
@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import os
 import re
 
+import numpy as np
 import pandas as pd
 from . import errors
 from . import time
@@ -14,6 +17,23 @@ old_path_re = r'^\d{1,4}_\d{1,3}/\d+\.evt$'
 old_file_re = r'^\d+\.evt$'
 evt_file_re = r'^\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}[+-]\d{2}-\d{2}(?:\.gz)?$|^\d+\.evt(?:\.gz)?$'
 opp_file_re = r'^\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}[+-]\d{2}-\d{2}\.opp(?:\.gz)?$|^\d+\.evt\.opp(?:\.gz)?$'
+# Match a whole path in one pass for parse_many. Must agree with splitpath,
+# dayofyear_re, new_file_re, old_file_re and remove_ext. Captures the day of
+# year directory right above the file, file name, file name without extension,
+# new style name, old style name, and the extension.
+path_re = (
+    r'^(?:(?:.*/)?(?:(?P<pdoy>\d{1,4}_\d{1,3})|[^/]+)/+|.*/)?'
+    r'(?P<file>(?=[^/])(?P<noext>'
+    r'(?P<new>(?P<ymdh>\d{4}-\d{2}-\d{2}T\d{2})-(?P<mi>\d{2})-(?P<ss>\d{2})[+-]\d{2}-\d{2})(?=\.|/*$)|'
+    r'(?P<old>(?P<oldnum>\d+)\.evt)(?=\.|/*$)|'
+    r'[^./]*)'
+    r'(?P<ext>[^/]*))/*$'
+)
+_path_rx = re.compile(path_re)
+# Columns of parse_many output to sort by
+sort_columns = ["sort_year", "sort_day", "sort_num", "sort_name"]
+# Maximum number of parsed paths kept in memory by parse()
+parse_cache_size = 2**16
 
 
 class SeaFlowFile:
@@ -140,6 +160,72 @@ class SeaFlowFile:
         return (year, day, file_key)
 
 
+class ParsedFile:
+    """
+    Immutable record of a parsed SeaFlow file path.
+
+    Has the same attributes as SeaFlowFile, but all values are computed once
+    when the record is created. Create with parse() rather than directly.
+    """
+
+    __slots__ = (
+        "path", "filename", "filename_noext", "path_dayofyear", "dayofyear",
+        "file_id", "path_file_id", "date", "rfc3339", "isgz", "is_old_style",
+        "is_new_style", "is_evt", "is_opp", "sort_key"
+    )
+
+    def __init__(self, path):
+        sfile = SeaFlowFile(path)
+        for name in self.__slots__:
+            object.__setattr__(self, name, getattr(sfile, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, ParsedFile):
+            return NotImplemented
+        return self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return "ParsedFile({!r})".format(self.path)
+
+    def __str__(self):
+        return "ParsedFile: {}, {}".format(self.file_id, self.path)
+
+
+@functools.lru_cache(maxsize=parse_cache_size)
+def parse(path):
+    """
+    Parse a SeaFlow file path, with caching.
+
+    The most recently used parse_cache_size results are cached, so repeated
+    parsing of the same path within one process is cheap. Cache statistics
+    are available from parse.cache_info() and the cache can be emptied with
+    parse.cache_clear().
+
+    Parameters
+    ----------
+    path: str
+        SeaFlow file path.
+
+    Raises
+    ------
+    seaflowpy.errors.FileError if path can't be parsed.
+
+    Returns
+    -------
+    ParsedFile
+    """
+    return ParsedFile(path)
+
+
 def create_dayofyear_directory(dt):
     """Create SeaFlow day of year directory from a datetime object"""
     if dt:
@@ -170,6 +256,153 @@ def parse_path(file_path):
     return d
 
 
+def parse_many(paths):
+    """
+    Parse many SeaFlow file paths at once.
+
+    This is a vectorized equivalent of creating a SeaFlowFile for each path.
+    Paths that can't be parsed as SeaFlow files are marked as invalid rather
+    than raising an exception.
+
+    Parameters
+    ----------
+    paths: list-like of str
+        File paths. If a pandas.Series is passed the result will have the same
+        index.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per path with columns:
+        "path": original path,
+        "file": file name,
+        "path_dayofyear": day of year directory in path or '',
+        "file_id": SeaFlowFile.file_id,
+        "path_file_id": SeaFlowFile.path_file_id,
+        "dayofyear": day of year directory from file name timestamp or '',
+        "date": timestamp parsed from file name as datetime64 UTC or NaT,
+        "rfc3339": SeaFlowFile.rfc3339,
+        "style": "new", "old" or None,
+        "type": "evt", "opp" or None,
+        "valid": True if this is a valid SeaFlow file path,
+        "sort_year", "sort_day", "sort_num", "sort_name": sort key columns.
+        Sorting on these columns gives the same order as SeaFlowFile.sort_key.
+        Columns other than path, file, path_dayofyear and valid are null for
+        invalid paths.
+    """
+    if isinstance(paths, pd.Series):
+        index = paths.index
+        paths = paths.values
+    else:
+        paths = np.array(list(paths), dtype=object)
+        index = pd.RangeIndex(len(paths))
+    n = len(paths)
+
+    # A plain loop over compiled regex matches is a few times faster than
+    # Series.str.extract, the rest is vectorized.
+    empty = (None,) * _path_rx.groups
+    groups = np.array(
+        [m.groups() if m else empty for m in map(_path_rx.match, map(str, paths))],
+        dtype=object
+    ).reshape(n, _path_rx.groups)
+    parts = {name: groups[:, i - 1] for name, i in _path_rx.groupindex.items()}
+    is_new = pd.notna(parts["new"])
+    is_old = pd.notna(parts["old"])
+    has_path_doy = pd.notna(parts["pdoy"])
+    filename = np.where(pd.notna(parts["file"]), parts["file"], "").astype(object)
+    path_dayofyear = np.where(has_path_doy, parts["pdoy"], "").astype(object)
+    noext = np.where(pd.notna(parts["noext"]), parts["noext"], "").astype(object)
+
+    # Timezone offset is ignored, same as time.parse_date
+    timestamp = np.full(n, None, dtype=object)
+    timestamp[is_new] = (
+        parts["ymdh"][is_new] + ":" + parts["mi"][is_new] + ":" + parts["ss"][is_new]
+    )
+    date = pd.DatetimeIndex(
+        pd.to_datetime(timestamp, format="%Y-%m-%dT%H:%M:%S", errors="coerce", utc=True)
+    )
+    has_date = ~date.isna()
+    valid = is_old | has_date
+
+    # Day of year from file name timestamp, or from path, or 0
+    sort_year = np.zeros(n, dtype=int)
+    sort_day = np.zeros(n, dtype=int)
+    use_path_doy = has_path_doy & ~has_date
+    if use_path_doy.any():
+        path_doy = np.array([d.split("_") for d in path_dayofyear[use_path_doy]], dtype=int)
+        sort_year[use_path_doy] = path_doy[:, 0]
+        sort_day[use_path_doy] = path_doy[:, 1]
+    sort_year[has_date] = date.year[has_date]
+    sort_day[has_date] = date.dayofyear[has_date]
+    sort_num = np.zeros(n, dtype=int)
+    sort_num[is_old] = parts["oldnum"][is_old].astype(int)
+    sort_name = np.where(is_new, noext, "").astype(object)
+
+    # Same string formatting as create_dayofyear_directory, but only once for
+    # each year and day
+    dayofyear = np.full(n, "", dtype=object)
+    if has_date.any():
+        years, year_idx = np.unique(sort_year[has_date], return_inverse=True)
+        year_strs = np.array([f"{y}_" for y in years], dtype=object)
+        day_strs = np.array([f"{d:03d}" for d in range(367)], dtype=object)
+        dayofyear[has_date] = year_strs[year_idx] + day_strs[sort_day[has_date]]
+    rfc3339 = np.full(n, "", dtype=object)
+    rfc3339[has_date] = timestamp[has_date] + "+00:00"
+
+    path_file_id = np.where(has_path_doy, path_dayofyear + "/" + noext, noext)
+    file_id = np.where(is_old, path_file_id, dayofyear + "/" + noext)
+
+    style = np.full(n, None, dtype=object)
+    style[is_new] = "new"
+    style[is_old] = "old"
+    # Same as evt_file_re and opp_file_re for new and old style files
+    ext = parts["ext"]
+    filetype = np.full(n, None, dtype=object)
+    filetype[(ext == "") | (ext == ".gz")] = "evt"
+    filetype[(ext == ".opp") | (ext == ".opp.gz")] = "opp"
+
+    df = pd.DataFrame({
+        "path": paths,
+        "file": filename,
+        "path_dayofyear": path_dayofyear,
+        "file_id": file_id,
+        "path_file_id": path_file_id,
+        "dayofyear": dayofyear,
+        "date": date,
+        "rfc3339": rfc3339,
+        "style": style,
+        "type": filetype,
+        "valid": valid,
+        "sort_year": sort_year,
+        "sort_day": sort_day,
+        "sort_num": sort_num,
+        "sort_name": sort_name,
+    }, index=index)
+    nullable = ["file_id", "path_file_id", "dayofyear", "rfc3339", "style", "type"]
+    df.loc[~valid, nullable] = None
+    return df
+
+
+def parse_many_valid(paths):
+    """
+    Parse many SeaFlow file paths with parse_many, requiring all to be valid.
+
+    Raises
+    ------
+    seaflowpy.errors.FileError if any path can't be parsed.
+    """
+    df = parse_many(paths)
+    if not df["valid"].all():
+        bad = df.loc[~df["valid"], "path"].iloc[0]
+        raise errors.FileError(f"Filename doesn't look like a SeaFlow file: {bad}")
+    return df
+
+
+def sort_parsed(df):
+    """Sort a dataframe created by parse_many in SeaFlowFile.sort_key order."""
+    return df.sort_values(by=sort_columns, kind="mergesort")
+
+
 def remove_ext(filename):
     """Remove extensions from filename except .evt in old files."""
     file_parts = filename.split(".")
@@ -185,8 +418,7 @@ def sorted_files(files):
 
     Order is based on day of year directory parsed from path and then file name.
     """
-    sfiles = [SeaFlowFile(f) for f in files]
-    return [s.path for s in sorted(sfiles, key=lambda x: x.sort_key)]
+    return sort_parsed(parse_many_valid(files))["path"].tolist()
 
 
 def filtered_file_list(total_list, filter_list):
@@ -195,13 +427,9 @@ def filtered_file_list(total_list, filter_list):
 
     Match by file_id, but return original path in total_list.
     """
-    filter_set = {SeaFlowFile(f).file_id for f in filter_list}
-    files = []
-    for f in total_list:
-        if SeaFlowFile(f).file_id in filter_set:
-            files.append(f)
-    files = sorted_files(files)
-    return files
+    filter_ids = parse_many_valid(filter_list)["file_id"]
+    total_df = parse_many_valid(total_list)
+    return sort_parsed(total_df[total_df["file_id"].isin(filter_ids)])["path"].tolist()
 
 
 def find_evt_files(root_dir, opp=False):
@@ -211,18 +439,76 @@ def find_evt_files(root_dir, opp=False):
     return sorted_files(files)
 
 
+def scan_evt_files(root_dir, opp=False, max_workers=8, check_duplicates=True):
+    """
+    Find and parse EVT/OPP files in a SeaFlow EVT directory tree.
+
+    Files are collected from root_dir and from its day of year subdirectories,
+    e.g. root_dir/2014_185/. Other subdirectories are not searched. Day of year
+    directories are listed concurrently, which is much faster than os.walk on
+    network filesystems.
+
+    Parameters
+    ----------
+    root_dir: str
+        EVT directory, either the top level cruise directory or a day of year
+        directory.
+    opp: bool, default False
+        Find OPP files instead of EVT files.
+    max_workers: int, default 8
+        Number of threads used to list directories.
+    check_duplicates: bool, default True
+        Raise an error if more than one file has the same file ID, e.g. a
+        gzipped and uncompressed copy of the same file.
+
+    Raises
+    ------
+    seaflowpy.errors.FileError if check_duplicates is True and duplicate files
+    are found.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Parsed files in chronological order, with the same columns as
+        parse_many().
+    """
+    file_re = re.compile(opp_file_re if opp else evt_file_re)
+    day_dirs = []
+    root_files = []
+    with os.scandir(root_dir) as it:
+        for entry in it:
+            if entry.is_dir():
+                if re.match(dayofyear_re, entry.name):
+                    day_dirs.append(entry.path)
+            elif file_re.match(entry.name):
+                root_files.append(entry.path)
+
+    paths = root_files
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for day_paths in executor.map(_scan_day_dir, day_dirs, [file_re] * len(day_dirs)):
+            paths.extend(day_paths)
+
+    df = parse_many(paths)
+    df = df[df["valid"]]
+    if check_duplicates:
+        dups = df["file_id"].duplicated(keep=False)
+        if dups.any():
+            raise errors.FileError(
+                "Duplicate EVT files: {}".format(", ".join(df.loc[dups, "path"]))
+            )
+    return sort_parsed(df).reset_index(drop=True)
+
+
+def _scan_day_dir(path, file_re):
+    with os.scandir(path) as it:
+        return [e.path for e in it if file_re.match(e.name) and not e.is_dir()]
+
+
 def keep_evt_files(files, opp=False):
     """Filter list of files to only keep EVT files."""
-    files_list = []
-    for f in files:
-        try:
-            sfile = SeaFlowFile(f)
-        except errors.FileError:
-            pass
-        else:
-            if (opp and sfile.is_opp) | (not opp and sfile.is_evt):
-                files_list.append(f)
-    return files_list
+    df = parse_many(files)
+    keep = df["valid"] & (df["type"] == ("opp" if opp else "evt"))
+    return df.loc[keep, "path"].tolist()
 
 
 def timeselect_evt_files(sfiles, tstart, tend):
@@ -283,12 +569,12 @@ def date_evt_files(evt_paths, sfl_df):
     """
     if not pd.api.types.is_datetime64_ns_dtype(sfl_df["date"]):
         sfl_df["date"] = sfl_df["date"].map(time.parse_date)
-    sfl_dates_by_file = dict(zip(sfl_df["file"].tolist(), sfl_df["date"].tolist()))
-    data = {"date": [], "file_id": [], "path": []}
-    for path in evt_paths:
-        file_id = SeaFlowFile(path).file_id
-        if file_id in sfl_dates_by_file:
-            data["file_id"].append(file_id)
-            data["path"].append(path)
-            data["date"].append(sfl_dates_by_file[file_id])
-    return pd.DataFrame(data)[["date", "file_id", "path"]]
+    # Last date wins for duplicate files
+    sfl_dates_by_file = sfl_df.drop_duplicates("file", keep="last").set_index("file")["date"]
+    evt_df = parse_many_valid(evt_paths)
+    evt_df = evt_df[evt_df["file_id"].isin(sfl_dates_by_file.index)]
+    return pd.DataFrame({
+        "date": sfl_dates_by_file.loc[evt_df["file_id"]].values,
+        "file_id": evt_df["file_id"].values,
+        "path": evt_df["path"].values
+    })
@@ -0,0 +1,348 @@
+"""
+Long-running local service which keeps state warm between requests.
+
+Starting seaflowpy, reading filter parameters and scanning EVT directories
+can take longer than the work requested by small frequent calls, e.g. from
+monitoring scripts. The service keeps imports loaded, caches directory scans
+and filter parameters, and keeps a worker pool running. It accepts JSON
+requests over HTTP on localhost, one operation per URL path, e.g.
+POST /count with body {"paths": ["/data/evt"]}. See service_client for
+sending requests.
+"""
+import json
+import multiprocessing as mp
+import os
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from . import db
+from . import errors
+from . import fileio
+from . import filterevt
+from . import sample as sfpsample
+from . import seaflowfile
+from .service_client import DEFAULT_HOST, DEFAULT_PORT
+from .time import parse_date
+
+
+# Operations available to clients, mapped to Service method names
+operations = ["count", "filter", "sample", "shutdown", "status", "validate"]
+
+
+class Catalog:
+    """
+    Cache of parsed EVT/OPP file listings for SeaFlow directories.
+
+    A cached listing is reused until the modification time of the directory or
+    one of its day of year subdirectories changes, which happens when files
+    are added, removed or renamed.
+    """
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, root_dir, opp=False, check_duplicates=True):
+        """
+        Get EVT/OPP files in root_dir, see seaflowfile.scan_evt_files.
+
+        Parameters
+        ----------
+        root_dir: str
+            EVT directory.
+        opp: bool, default False
+            Find OPP files instead of EVT files.
+        check_duplicates: bool, default True
+            Raise an error if more than one file has the same file ID.
+
+        Raises
+        ------
+        seaflowpy.errors.FileError if check_duplicates is True and duplicate
+        files are found.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Parsed files in chronological order, with the same columns as
+            seaflowfile.parse_many().
+        """
+        key = (os.path.abspath(root_dir), opp, check_duplicates)
+        stamp = dir_stamp(key[0])
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is None or cached[0] != stamp:
+            df = seaflowfile.scan_evt_files(key[0], opp=opp, check_duplicates=check_duplicates)
+            cached = (stamp, df)
+            with self._lock:
+                self._cache[key] = cached
+        return cached[1]
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def dir_stamp(root_dir):
+    """Return modification times for root_dir and its day of year subdirectories."""
+    stamp = [(root_dir, os.stat(root_dir).st_mtime_ns)]
+    with os.scandir(root_dir) as it:
+        for entry in it:
+            if entry.is_dir() and re.match(seaflowfile.dayofyear_re, entry.name):
+                stamp.append((entry.path, entry.stat().st_mtime_ns))
+    return sorted(stamp)
+
+
+class Service:
+    """
+    Warm state and operations for the seaflowpy service.
+
+    Parameters
+    ----------
+    process_count: int, default 1
+        Number of worker processes kept running for count, validate, sample
+        and filter operations.
+    """
+    def __init__(self, process_count=1):
+        if process_count < 1:
+            raise ValueError("process_count must be > 0")
+        self.process_count = process_count
+        self.catalog = Catalog()
+        self.started = time.time()
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+        self._filter_params = {}
+        self._filter_lock = threading.Lock()
+        self._pool = mp.Pool(processes=process_count)
+
+    def close(self):
+        """Stop worker processes."""
+        self._pool.close()
+        self._pool.join()
+
+    def handle(self, op, params):
+        """Run operation op with keyword arguments from params dict."""
+        if op not in operations:
+            raise errors.SeaFlowpyError(f"unknown operation '{op}'")
+        with self._requests_lock:
+            self.requests += 1
+        return getattr(self, op)(**params)
+
+    def filter_params(self, dbpath):
+        """
+        Get the latest filter parameters in dbpath.
+
+        Parameters are cached until the latest filter ID or date in dbpath
+        changes. Other tables, e.g. opp written by filtering, don't affect
+        the cache.
+        """
+        dbpath = os.path.abspath(dbpath)
+        stamp = db.get_latest_filter_stamp(dbpath)
+        cached = self._filter_params.get(dbpath)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, db.get_latest_filter(dbpath))
+            self._filter_params[dbpath] = cached
+        return cached[1]
+
+    def expand_paths(self, paths):
+        """
+        Convert directories in paths to EVT and OPP file paths.
+
+        Directories are searched with the warm catalog, so only a cruise
+        directory and its day of year subdirectories are searched.
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(self.catalog.get(path, check_duplicates=False)["path"])
+                files.extend(self.catalog.get(path, opp=True, check_duplicates=False)["path"])
+            else:
+                files.append(path)
+        return files
+
+    def count(self, paths):
+        """Event counts for EVT/OPP files, see fileio.count_file."""
+        return self._pool.map(fileio.count_file, self.expand_paths(paths))
+
+    def validate(self, paths):
+        """Validation results for EVT/OPP files, see fileio.validate_file."""
+        return self._pool.map(fileio.validate_file, self.expand_paths(paths))
+
+    def sample(self, paths, outpath, count=100000, file_fraction=0.1, min_chl=0,
+               min_fsc=0, min_pe=0, min_date=None, max_date=None, multi=False,
+               noise_filter=False, seed=None):
+        """
+        Sample events from EVT files, see sample.sample.
+
+        EVT file dates are taken from file names. min_date and max_date are
+        ISO8601 timestamp strings. Returns a dict of per-file "results",
+        unhandled "errors", and file counts at each selection step.
+        """
+        min_date = parse_date(min_date, assume_utc=False) if min_date else None
+        max_date = parse_date(max_date, assume_utc=False) if max_date else None
+        files = seaflowfile.keep_evt_files(self.expand_paths(paths))
+        sfiles = [seaflowfile.SeaFlowFile(f) for f in files]
+        dates = {sf.file_id: sf.date for sf in sfiles}
+        time_files = [sf.path for sf in seaflowfile.timeselect_evt_files(sfiles, min_date, max_date)]
+        if multi:
+            chosen_files = time_files
+        else:
+            chosen_files = sfpsample.random_select(time_files, file_fraction, seed)
+        os.makedirs(os.path.dirname(os.path.abspath(outpath)), exist_ok=True)
+        results, errs = sfpsample.sample(
+            chosen_files,
+            count,
+            outpath,
+            dates=dates,
+            min_chl=min_chl,
+            min_fsc=min_fsc,
+            min_pe=min_pe,
+            multi=multi,
+            noise_filter=noise_filter,
+            process_count=self.process_count,
+            seed=seed,
+            pool=self._pool
+        )
+        return {
+            "results": results,
+            "errors": [str(e) for e in errs],
+            "input_files": len(files),
+            "time_files": len(time_files),
+            "chosen_files": len(chosen_files)
+        }
+
+    def filter(self, dbpath, evt_dir, opp_dir, delta=False, limit=None, every=10.0, sketches=False):
+        """
+        Filter EVT files in evt_dir which are present in the SFL table of dbpath.
+
+        Time windows are filtered in the warm worker pool and saved to dbpath
+        by the service. Only one filter operation runs at a time. Filtering
+        progress is printed by the service, not returned. Returns a dict of
+        file counts.
+        """
+        with self._filter_lock:
+            filter_params = self.filter_params(dbpath)
+            result = {"cruise": db.get_cruise(dbpath)}
+            evt_df = self.catalog.get(evt_dir)
+            sfl_df = db.get_sfl_table(dbpath)
+            files_df = seaflowfile.date_evt_files(evt_df["path"].tolist(), sfl_df)
+            result.update({"sfl": len(sfl_df), "evt": len(evt_df), "intersection": len(files_df)})
+            if delta:
+                opp_df = db.get_opp_table(dbpath)
+                files_df = files_df[~files_df["file_id"].isin(opp_df["file"])]
+                result["evt_not_in_opp"] = len(files_df)
+            if (limit is not None) and (limit > 0):
+                files_df = files_df.head(limit)
+            result["filtered"] = len(files_df)
+            if len(files_df):
+                self._filter_windows(files_df, dbpath, opp_dir, filter_params, every, sketches)
+        return result
+
+    def _filter_windows(self, files_df, dbpath, opp_dir, filter_params, every, sketches):
+        # Workers are forked once when the service starts, so no process is
+        # forked from a request thread here
+        works = filterevt.window_work(files_df, dbpath, opp_dir, filter_params, sketches=sketches)
+        stats_q, done_q = queue.Queue(), queue.Queue()
+        reporter = threading.Thread(
+            target=filterevt.do_reporting,
+            args=(stats_q, done_q, len(files_df), every)
+        )
+        reporter.start()
+        try:
+            for work in self._pool.imap_unordered(filterevt.filter_window, works):
+                filterevt.save_window(work)
+                stats_q.put(work)
+        except BaseException:
+            # Stop the reporter, it exits without waiting for other windows
+            stats_q.put("QUEUE ERROR")
+            raise
+        finally:
+            reporter.join()
+        done = done_q.get()
+        if done is not None:
+            raise errors.SeaFlowpyError(done)
+
+    def status(self):
+        """Service status and cache sizes."""
+        from . import __version__
+        return {
+            "version": __version__,
+            "pid": os.getpid(),
+            "process_count": self.process_count,
+            "uptime": time.time() - self.started,
+            "requests": self.requests,
+            "catalog_entries": len(self.catalog),
+            "filter_params_entries": len(self._filter_params)
+        }
+
+    def shutdown(self):
+        """Acknowledge a shutdown request, the server stops after replying."""
+        return "shutting down"
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        op = self.path.strip("/")
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            result = self.server.service.handle(op, params)
+        except (errors.SeaFlowpyError, OSError, KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"error": str(e)})
+        except Exception as e:  # keep serving after unexpected errors
+            self._reply(500, {"error": f"unexpected error: {e!r}"})
+        else:
+            self._reply(200, {"result": result})
+            if op == "shutdown":
+                # shutdown() blocks until serve_forever() returns, so it must
+                # run outside of this request thread
+                threading.Thread(target=self.server.shutdown).start()
+
+    def _reply(self, code, body):
+        data = json.dumps(body, default=_json_default).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(o).isoformat()
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, process_count=1, verbose=False):
+    """
+    Run the service until a shutdown request is received.
+
+    Parameters
+    ----------
+    host: str, default "127.0.0.1"
+        Address to listen on. The service has no authentication, so this
+        should normally be a loopback address.
+    port: int, default 8127
+        Port to listen on.
+    process_count: int, default 1
+        Number of worker processes.
+    verbose: bool, default False
+        Log each request to STDERR.
+    """
+    # Create the worker pool before any server threads exist
+    service = Service(process_count=process_count)
+    try:
+        with ThreadingHTTPServer((host, port), _RequestHandler) as server:
+            server.service = service
+            server.verbose = verbose
+            server.serve_forever()
+    finally:
+        service.close()
+
@@ -0,0 +1,63 @@
+"""
+Client for the seaflowpy service in seaflowpy.service.
+
+Kept separate from the service so that clients don't pay for importing the
+data processing stack.
+"""
+import json
+import urllib.error
+import urllib.request
+from . import errors
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8127
+
+
+def request(op, params=None, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """
+    Send a request to a running service.
+
+    Parameters
+    ----------
+    op: str
+        Operation name, one of seaflowpy.service.operations.
+    params: dict, optional
+        Keyword arguments for the operation. Paths should be absolute since
+        the service may run in a different working directory.
+    host: str, default "127.0.0.1"
+        Service address.
+    port: int, default 8127
+        Service port.
+    timeout: float, optional
+        Seconds to wait for a response.
+
+    Raises
+    ------
+    seaflowpy.errors.SeaFlowpyError if the service can't be reached or the
+    operation fails.
+
+    Returns
+    -------
+    Operation result decoded from JSON.
+    """
+    data = json.dumps(params or {}).encode("utf-8")
+    req = urllib.request.Request(
+        f"http://{host}:{port}/{op}",
+        data=data,
+        headers={"Content-Type": "application/json"}
+    )
+    # Don't send requests for a local service through an HTTP proxy
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    try:
+        with opener.open(req, timeout=timeout) as resp:
+            body = json.load(resp)
+    except urllib.error.HTTPError as e:
+        try:
+            msg = json.load(e)["error"]
+        except (ValueError, KeyError):
+            msg = str(e)
+        raise errors.SeaFlowpyError(msg)
+    except urllib.error.URLError as e:
+        raise errors.SeaFlowpyError(f"could not connect to seaflowpy service at {host}:{port}: {e.reason}")
+    return body["result"]
@@ -1,8 +1,10 @@
 """Do things to SFL data DataFrames"""
 from collections import OrderedDict
+import io
 import json
 import os
 import re
+from time import sleep
 import numpy as np
 import pandas as pd
 import pytz
@@ -43,6 +45,13 @@ numeric_columns = [
     "stream_pressure", "event_rate"
 ]
 
+# Columns of errors DataFrames created by check()
+error_columns = ["column", "message", "line (1-based)", "value", "level"]
+
+# Timestamp with UTC offset, as accepted by time.parse_date
+date_re = r"^\d{4}-\d{2}-\d{2}.\d{2}(:\d{2}(:\d{2}(\.\d{3}(\d{3})?)?)?)?[+-]00:00$"
+_date_rx = re.compile(date_re, re.ASCII)
+
 output_columns = [
     "file", "date", "file_duration", "lat", "lon", "conductivity",
     "salinity", "ocean_tmp", "par", "bulk_red", "stream_pressure",
@@ -60,53 +69,74 @@ min_event_rate = 0
 def add_date_column(df):
     """Add a date column if needed and return a new dataframe."""
     newdf = df.copy(deep=True)
-
-    def date_from_file(f):
-        try:
-            d = seaflowfile.SeaFlowFile(f).rfc3339
-        except sfperrors.FileError:
-            d = ''
-        return d
-
     if "date" not in newdf.columns:
-        newdf["date"] = newdf["file"].map(date_from_file)
+        newdf["date"] = seaflowfile.parse_many(newdf["file"])["rfc3339"].fillna("")
     return newdf
 
 
 def check(df):
     """Perform checks on SFL dataframe
 
-    Returns a list of errors.
+    Returns a DataFrame of errors with columns from error_columns, one row per
+    error.
+    """
+    errors = [
+        check_numeric(df, "file_duration", minval=min_file_duration, require_all=True),
+        check_numeric(df, "lat", minval=min_lat, maxval=max_lat, require_all=False, require_some=True, warn_missing=True),
+        check_numeric(df, "lon", minval=min_lon, maxval=max_lon, require_all=False, require_some=True, warn_missing=True),
+        check_numeric(df, "conductivity", require_all=False, warn_missing=True),
+        check_numeric(df, "salinity", require_all=False, warn_missing=True),
+        check_numeric(df, "ocean_tmp", require_all=False, warn_missing=True),
+        check_numeric(df, "par", require_all=False, warn_missing=True),
+        check_numeric(df, "bulk_red", require_all=False, warn_missing=True),
+        check_numeric(df, "stream_pressure", minval=min_stream_pressure, require_all=True),
+        check_numeric(df, "event_rate", minval=min_event_rate, require_all=True),
+        check_file(df),
+        check_date(df)
+    ]
+    return pd.concat(errors, ignore_index=True)
+
+
+def check_db_boundary(df, last_date, db_files):
+    """Check new SFL rows against rows already in a database.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        New SFL rows.
+    last_date: str or None
+        Latest date in the database sfl table, e.g. from
+        db.get_sfl_max_date(). If None dates are not checked.
+    db_files: set of str
+        File IDs of df already in the database, e.g. from
+        db.get_sfl_file_ids().
+
+    Returns a DataFrame of errors.
     """
     errors = []
-    errors.extend(check_numeric(df, "file_duration", minval=min_file_duration, require_all=True))
-    errors.extend(check_numeric(df, "lat", minval=min_lat, maxval=max_lat, require_all=False, require_some=True, warn_missing=True))
-    errors.extend(check_numeric(df, "lon", minval=min_lon, maxval=max_lon, require_all=False, require_some=True, warn_missing=True))
-    errors.extend(check_numeric(df, "conductivity", require_all=False, warn_missing=True))
-    errors.extend(check_numeric(df, "salinity", require_all=False, warn_missing=True))
-    errors.extend(check_numeric(df, "ocean_tmp", require_all=False, warn_missing=True))
-    errors.extend(check_numeric(df, "par", require_all=False, warn_missing=True))
-    errors.extend(check_numeric(df, "bulk_red", require_all=False, warn_missing=True))
-    errors.extend(check_numeric(df, "stream_pressure", minval=min_stream_pressure, require_all=True))
-    errors.extend(check_numeric(df, "event_rate", minval=min_event_rate, require_all=True))
-    errors.extend(check_file(df))
-    errors.extend(check_date(df))
-    return errors
+    if "file" in df.columns:
+        dup_files = df.loc[df["file"].isin(db_files), "file"]
+        errors.append(create_errors("file", msg="Duplicate file already in database", values=dup_files))
+    if last_date is not None and "date" in df.columns:
+        dates = pd.to_datetime(df["date"], utc=True, errors="coerce")
+        early = (dates <= pd.Timestamp(last_date)).values
+        errors.append(create_errors("date", msg="Date not after latest date in database", values=df.loc[early, "date"]))
+    if not errors:
+        return create_errors("file", msg="", values=pd.Series([], dtype=object))
+    return pd.concat(errors, ignore_index=True)
 
 
 def check_date(df):
-    errors = []
+    """Check that date column contains UTC RFC3339 timestamps.
+
+    Returns a DataFrame of errors.
+    """
     if "date" not in df.columns:
-        errors.append(create_error(df, "date", msg="date column is missing"))
-    else:
-        # All dates must match RFC 3339 with no fractional seconds
-        # only integer seconds.
-        date_flags = df["date"].map(check_date_string)
-        if len(date_flags) > 0:
-            # select rows that failed date check
-            for i, v in df[~date_flags]["date"].iteritems():
-                errors.append(create_error(df, "date", msg="Invalid date format", row=i, val=v))
-    return errors
+        return create_errors("date", msg="date column is missing")
+    # All dates must match RFC 3339 with no fractional seconds
+    # only integer seconds.
+    date_flags = check_date_strings(df["date"])
+    return create_errors("date", msg="Invalid date format", values=df.loc[~date_flags, "date"])
 
 
 def check_date_string(date):
@@ -123,52 +153,79 @@ def check_date_string(date):
     return passed
 
 
+def check_date_strings(dates):
+    """
+    Vectorized version of check_date_string.
+
+    Parameters
+    ----------
+    dates: pandas.Series
+        Date values to check.
+
+    Returns
+    -------
+    pandas.Series of bool
+        True for each value that is an RFC3339 string with UTC timezone as
+        [+-]00:00, indexed like dates.
+    """
+    flags = np.array(
+        [isinstance(d, str) and _date_rx.fullmatch(d) is not None for d in dates],
+        dtype=bool
+    )
+    # Confirm the calendar date and time are real, e.g. reject February 30 or
+    # hour 24.
+    candidates = dates[flags]
+    parsed = pd.to_datetime(candidates, utc=True, errors="coerce")
+    unparsed = parsed.isna().values
+    # Fall back to slower per-value checks for anything pandas couldn't parse,
+    # e.g. dates outside the range of pandas.Timestamp.
+    if unparsed.any():
+        unparsed_flags = candidates[unparsed].map(check_date_string).values.astype(bool)
+        unparsed[unparsed] = ~unparsed_flags
+    flags[flags] = ~unparsed
+    return pd.Series(flags, index=dates.index)
+
+
 def check_file(df):
-    errors = []
+    """Check file column values, order, and agreement with date column.
+
+    Returns a DataFrame of errors.
+    """
     # File field must be present
     if "file" not in df.columns:
-        errors.append(create_error(df, "file", msg="file column is missing"))
-    else:
-        # File field must contain well formatted file strings, valid dates, and
-        # day-of-year directory.
-        def parse_filename(f):
-            try:
-                s = seaflowfile.SeaFlowFile(f)
-            except sfperrors.FileError:
-                return False
-            if s.path_dayofyear:
-                return True
-            return False
-
-        good_files_selector = df["file"].map(parse_filename)
-        good_files = df[good_files_selector]
-        bad_files = df[~good_files_selector]
-        for i, v in bad_files["file"].iteritems():
-            errors.append(create_error(bad_files, "file", msg="Invalid file name", row=i, val=v))
-
-        # Files must be unique
-        dup_files = df.loc[df["file"].duplicated(keep=False), "file"]
-        for i, v in dup_files.iteritems():
-            errors.append(create_error(dup_files, "file", msg="Duplicate file", row=i, val=v))
-
-        # Files should be in order
-        # Only consider files that are parseable by seaflowfile.SeaFlowFile
-        inorder = seaflowfile.sorted_files(good_files["file"])
-        files_equal = good_files["file"] == inorder
-        if not files_equal.all():
-            i = int(good_files[~files_equal].index[0])
-            v = "First out of order file {}".format(good_files.loc[i, "file"])
-            errors.append(create_error(good_files, "file", msg="Files out of order", row=i, val=v))
-
-        # Files should match date in same row
-        if "date" in df.columns:
-            for i, v in good_files["file"].iteritems():
-                s = seaflowfile.SeaFlowFile(v)
-                d = good_files.loc[i, "date"]
-                if s.is_new_style and s.rfc3339 != d:
-                    errors.append(create_error(good_files, "file/date", msg="File and date don't match", row=i, val=f"{v} {d}"))
+        return create_errors("file", msg="file column is missing")
 
-    return errors
+    errors = []
+    # File field must contain well formatted file strings, valid dates, and
+    # day-of-year directory.
+    parsed = seaflowfile.parse_many(df["file"])
+    good_files_selector = parsed["valid"] & (parsed["path_dayofyear"] != "")
+    good_parsed = parsed[good_files_selector]
+    good_files = df.loc[good_files_selector, [c for c in ["file", "date"] if c in df.columns]]
+    errors.append(create_errors("file", msg="Invalid file name", values=df.loc[~good_files_selector, "file"]))
+
+    # Files must be unique
+    dup_files = df.loc[df["file"].duplicated(keep=False), "file"]
+    errors.append(create_errors("file", msg="Duplicate file", values=dup_files))
+
+    # Files should be in order
+    # Only consider files that are parseable by seaflowfile.SeaFlowFile
+    inorder = seaflowfile.sort_parsed(good_parsed)["path"].values
+    files_equal = good_files["file"] == inorder
+    if not files_equal.all():
+        i = good_files[~files_equal].index[0]
+        v = "First out of order file {}".format(good_files.loc[i, "file"])
+        errors.append(create_errors("file", msg="Files out of order", values=pd.Series([v], index=[i])))
+
+    # Files should match date in same row
+    if "date" in df.columns:
+        mismatched = (good_parsed["style"] == "new") & (good_parsed["rfc3339"] != good_files["date"])
+        mismatched_files = good_files.loc[mismatched, "file"]
+        mismatched_dates = good_files.loc[mismatched, "date"]
+        values = mismatched_files.astype(str) + " " + mismatched_dates.astype(str)
+        errors.append(create_errors("file/date", msg="File and date don't match", values=values))
+
+    return pd.concat(errors, ignore_index=True)
 
 
 def check_numeric(df, colname, require_all=False, require_some=False, warn_missing=False, minval=None, maxval=None):
@@ -197,79 +254,107 @@ def check_numeric(df, colname, require_all=False, require_some=False, warn_missi
 
     Returns
     -------
-    list of error dicts
-        Errors created with create_error()
+    pandas.DataFrame
+        Errors created with create_errors()
     """
-    errors = []
     if colname not in df.columns:
         # column must be present
-        errors.append(create_error(df, colname, msg=f"{colname} column is missing", level="error"))
-    else:
-        notnas = df[df[colname].notna()]
-        numbers = pd.to_numeric(notnas[colname], errors="coerce")
-        # Create boolean index for values in acceptable range
-        # Start by selecting everything, then select by minval/maxval
-        good_selector = np.ones(len(numbers), dtype=bool)
-        if minval is not None:
-            good_selector = good_selector & (numbers >= minval)
-        if maxval is not None:
-            good_selector = good_selector & (numbers <= maxval)
-        # Catch values outside correct range
-        # Catch non-numeric values (NAs created during to_numeric())
-        bad_numbers = notnas.loc[~good_selector, colname]
-        for i, v in bad_numbers.iteritems():
-            errors.append(create_error(df, colname, msg=f"Invalid {colname}", row=i, val=v, level="error"))
-
-        nas = df.loc[df[colname].isna(), colname]
-        if len(nas) == len(df):
-            # No data in column
-            if require_all or require_some:
-                errors.append(create_error(df, colname, msg=f"{colname} column has no data", level="error"))
-            else:
-                errors.append(create_error(df, colname, msg=f"{colname} column has no data", level="warning"))
-        elif len(nas) > 0:
-            # Some missing
-            if require_all:
-                for i, v in nas.iteritems():
-                    errors.append(create_error(df, colname, msg="Missing required data", row=i, val=v, level="error"))
-            elif warn_missing:
-                for i, v in nas.iteritems():
-                    errors.append(create_error(df, colname, msg="Missing data", row=i, val=v, level="warning"))
+        return create_errors(colname, msg=f"{colname} column is missing", level="error")
 
-    return errors
+    errors = []
+    values = df[colname]
+    notnas = values[values.notna()]
+    numbers = pd.to_numeric(notnas, errors="coerce")
+    # Create boolean index for values in acceptable range
+    # Start by selecting everything, then select by minval/maxval
+    good_selector = np.ones(len(numbers), dtype=bool)
+    if minval is not None:
+        good_selector = good_selector & (numbers >= minval)
+    if maxval is not None:
+        good_selector = good_selector & (numbers <= maxval)
+    # Catch values outside correct range
+    # Catch non-numeric values (NAs created during to_numeric())
+    bad_numbers = notnas[~good_selector]
+    errors.append(create_errors(colname, msg=f"Invalid {colname}", values=bad_numbers, level="error"))
+
+    nas = values[values.isna()]
+    if len(nas) == len(df):
+        # No data in column
+        if require_all or require_some:
+            errors.append(create_errors(colname, msg=f"{colname} column has no data", level="error"))
+        else:
+            errors.append(create_errors(colname, msg=f"{colname} column has no data", level="warning"))
+    elif len(nas) > 0:
+        # Some missing
+        if require_all:
+            errors.append(create_errors(colname, msg="Missing required data", values=nas, level="error"))
+        elif warn_missing:
+            errors.append(create_errors(colname, msg="Missing data", values=nas, level="warning"))
+
+    return pd.concat(errors, ignore_index=True)
 
 
 def convert_gga2dd(df):
-    """Return a copy of df with coordinates converted from GGA to decimal degrees."""
+    """Return a copy of df with coordinates converted from GGA to decimal degrees.
+
+    Converted coordinates are strings with 4 decimal places. NA values are
+    left as is. Raises ValueError for the first invalid GGA value found.
+    """
     newdf = df.copy(deep=True)
-    newdf["lat"] = df["lat"].map(geo.ggalat2dd, na_action="ignore")
-    newdf["lon"] = df["lon"].map(geo.ggalon2dd, na_action="ignore")
+    for col, convert, name in [("lat", geo.ggalat2dd_many, "latitude"), ("lon", geo.ggalon2dd_many, "longitude")]:
+        dd, bad = convert(df[col])
+        if bad.any():
+            raise ValueError("Invalid GGA {} string '{}'".format(name, df.loc[bad, col].iloc[0]))
+        good = dd.notna()
+        newdf[col] = df[col].astype(object)
+        newdf.loc[good, col] = ["{:.4f}".format(x) for x in dd[good]]
     return newdf
 
 
-def create_error(df, col, msg, row=None, val=None, level='error'):
-    """Create an error dictionary.
+def create_errors(col, msg, values=None, level='error'):
+    """
+    Create an errors DataFrame.
+
+    Parameters
+    ----------
+    col: str
+        Column name the errors refer to.
+    msg: str
+        Error message.
+    values: pandas.Series, optional
+        Offending values indexed by SFL DataFrame row. One error is created
+        for each item. If not provided a single error is created with no line
+        number or value.
+    level: str, default 'error'
+        'error' (fatal) or 'warning'.
 
-    Error levels can be 'error' (fatal) or 'warning'.
+    Returns
+    -------
+    pandas.DataFrame
+        Errors with columns from error_columns.
     """
     level_values = ['error', 'warning']
     if level not in level_values:
         raise ValueError(f"valid values for 'level' are {level_values}")
 
-    e = {
-        "column": col,
-        "message": msg,
-        "line (1-based)": None,
-        "value": None,
-        "level": level,
-    }
-    if row is not None:
-        e["line (1-based)"] = row + 2
-    if val is not None:
-        e["value"] = make_json_serializable(val)
-    elif row is not None:
-        e["value"] = make_json_serializable(df.loc[row, col])
-    return e
+    if values is None:
+        lines = [None]
+        values = [None]
+    else:
+        lines = [i + 2 for i in values.index]
+        values = values.tolist()
+    n = len(lines)
+    # Fill object array item-wise so sequence values aren't broadcast
+    value_array = np.empty(n, dtype=object)
+    value_array[:] = values
+    errors = pd.DataFrame({
+        "column": np.full(n, col, dtype=object),
+        "message": np.full(n, msg, dtype=object),
+        "line (1-based)": np.array(lines, dtype=object),
+        "value": value_array,
+        "level": np.full(n, level, dtype=object),
+    }, columns=error_columns)
+    return errors
 
 
 def dedup(df):
@@ -280,14 +365,11 @@ def dedup(df):
         - df without duplicate file rows
     """
     # Find all duplicate files
-    dups = df[df.duplicated("file", keep=False)]["file"].tolist()
+    dups = df.loc[df.duplicated("file", keep=False), "file"]
     # Create a unique list of duplicate file names in order of occurrence
-    d = OrderedDict()
-    for f in dups:
-        if f not in d:
-            d[f] = 0
-        d[f] += 1
-    return (list(d.items()), df.drop_duplicates(subset="file", keep=False))
+    counts = dups.value_counts()
+    order = dups.drop_duplicates().tolist()
+    return (list(zip(order, counts[order].tolist())), df.drop_duplicates(subset="file", keep=False))
 
 
 def find_sfl_files(root):
@@ -316,15 +398,10 @@ def fix(df):
 
     newdf = add_date_column(newdf)
 
-    # Add day of year directory if needed
-    def dayofyear_from_file(f):
-        try:
-            d = seaflowfile.SeaFlowFile(f).file_id
-        except sfperrors.FileError:
-            d = f  # don't change anything if can't parse filename
-        return d
-
-    newdf["file"] = newdf["file"].map(dayofyear_from_file)
+    # Add day of year directory if needed, don't change anything if can't
+    # parse filename
+    parsed = seaflowfile.parse_many(newdf["file"])
+    newdf["file"] = parsed["file_id"].where(parsed["valid"], newdf["file"])
 
     # Convert stream pressure <= 0 to small positive number
     newdf.loc[newdf["stream_pressure"] <= 0, "stream_pressure"] = min_stream_pressure
@@ -341,49 +418,200 @@ def fix_event_rate(df, event_counts):
     """
     Update event_rate field based on event counts in event_counts.
 
+    Event rates are event count / file duration. Rows with a file duration of
+    0 get an event rate of 0. Rows with a negative or NA file duration get an
+    NA event rate. Rows without an event count keep their current event rate.
+
     Parameters
     -----------
     df: pandas DataFrame
         SFL DataFrame, based on a "fixed" file
-    event_counts: dict of {str: int}
-        Dictionary with file_id: event count
+    event_counts: dict of {str: int}, pandas.Series, or pandas.DataFrame
+        Event counts by file ID. This may be a dictionary or Series of
+        file_id: event count, or a DataFrame with "file" and "all_count"
+        columns such as the opp table. Only the first count for each file is
+        used.
 
     Returns
     -------
     df: pandas DataFrame
         Copy of df with updated event_rate fields where possible.
     """
+    if isinstance(event_counts, pd.DataFrame):
+        counts = event_counts.set_index("file")["all_count"]
+    elif isinstance(event_counts, pd.Series):
+        counts = event_counts
+    else:
+        counts = pd.Series(event_counts, dtype=object)
+    counts = pd.to_numeric(counts[~counts.index.duplicated()], errors="coerce")
+
     newdf = df.copy(deep=True)
-    for i, row in newdf.iterrows():
-        try:
-            file_duration = float(row["file_duration"])
-        except ValueError:
-            continue
-        try:
-            event_count = int(event_counts[row["file"]])
-        except (ValueError, KeyError):
-            continue
-        try:
-            newdf.loc[i, "event_rate"] = event_count / file_duration
-        except ZeroDivisionError:
-            newdf.iloc[i, "event_rate"] = 0.0
+    event_count = newdf["file"].map(counts)
+    file_duration = pd.to_numeric(newdf["file_duration"], errors="coerce")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        event_rate = event_count / file_duration
+    event_rate[file_duration == 0] = 0.0
+    event_rate[file_duration < 0] = np.nan
+    has_count = event_count.notna()
+    newdf.loc[has_count, "event_rate"] = event_rate[has_count]
     return newdf
 
 
 def has_gga(df):
     """Do any coordinates Series in this DataFrame contain GGA values?"""
-    gga_lats = df["lat"].map(geo.is_gga_lat, na_action="ignore")
-    gga_lons = df["lon"].map(geo.is_gga_lon, na_action="ignore")
-    return (gga_lats | gga_lons).any()
+    return bool(geo.is_gga_lat_many(df["lat"]).any() or geo.is_gga_lon_many(df["lon"]).any())
 
 
 def make_json_serializable(v):
     """Make sure v is JSON serializable if it's numpy type or plain object"""
     if isinstance(v, np.generic):
-        return np.asscalar(v)
+        return v.item()
     return v
 
 
+def merge_files(file_paths, outpath, chunksize=100000):
+    """
+    Merge SFL files sorted by date into one SFL file sorted by date.
+
+    Inputs are streamed in chunks, fixed with fix(), and merged by date so
+    memory use is bounded by the number of inputs times chunksize. Rows with
+    equal dates are output in input file order. Only the first row for each
+    file ID is kept.
+
+    Parameters
+    ----------
+    file_paths: list of str
+        SFL file paths. Each file must be sorted by date.
+    outpath: str or file-like
+        Output SFL file path or open file handle.
+    chunksize: int, default 100000
+        Maximum number of rows to read from an input at a time.
+
+    Returns
+    -------
+    list of (str, int)
+        Duplicate file IDs removed and their number of occurrences, in order of
+        first occurrence.
+
+    Raises
+    ------
+    seaflowpy.errors.FileError
+        If an input file can't be parsed or isn't sorted by date.
+    """
+    if isinstance(outpath, str):
+        with open(outpath, "w", encoding="utf-8", newline="") as fh:
+            return merge_files(file_paths, fh, chunksize=chunksize)
+
+    inputs = [_MergeInput(f, chunksize) for f in file_paths]
+    seen = set()
+    dup_counts = OrderedDict()
+    header = True
+    while True:
+        for inp in inputs:
+            while len(inp.buffer) == 0 and not inp.done:
+                inp.load()
+        live = [inp for inp in inputs if not inp.done]
+        if live:
+            # Rows dated before the last buffered date of all inputs that
+            # may still have more data are safe to output
+            bound = min(inp.buffer["date"].iloc[-1] for inp in live)
+            parts = [inp.take_before(bound) for inp in inputs]
+            if sum(len(p) for p in parts) == 0:
+                # Every row left is dated at or after bound, load more rows for
+                # inputs which end at bound.
+                for inp in live:
+                    if inp.buffer["date"].iloc[-1] == bound:
+                        inp.load()
+                continue
+        else:
+            parts = [inp.buffer for inp in inputs]
+        block = pd.concat(parts).sort_values(by="date", kind="mergesort")
+
+        # Remove duplicate files
+        files = block["file"].tolist()
+        keep = np.ones(len(files), dtype=bool)
+        for i, f in enumerate(files):
+            if f in seen:
+                keep[i] = False
+                dup_counts[f] = dup_counts.get(f, 1) + 1
+            else:
+                seen.add(f)
+        if len(block) or header:
+            save_to_file(block[keep], outpath, header=header)
+            header = False
+        if not live:
+            break
+    return list(dup_counts.items())
+
+
+class _MergeInput:
+    """Buffered chunks of one SFL file for merge_files()"""
+
+    def __init__(self, file_path, chunksize):
+        self.file_path = file_path
+        self.chunks = read_file_chunks(file_path, chunksize=chunksize)
+        self.buffer = pd.DataFrame(columns=output_columns)
+        self.last_date = None
+        self.done = False
+
+    def load(self):
+        """Append the next chunk to the buffer, or mark input as done."""
+        try:
+            chunk = fix(next(self.chunks))
+        except StopIteration:
+            self.done = True
+            return
+        chunk = chunk[output_columns].assign(date=chunk["date"].fillna(""))
+        dates = chunk["date"]
+        if len(dates) and (
+            not dates.is_monotonic_increasing or
+            (self.last_date is not None and dates.iloc[0] < self.last_date)
+        ):
+            raise sfperrors.FileError("{} is not sorted by date".format(self.file_path))
+        if len(dates):
+            self.last_date = dates.iloc[-1]
+        self.buffer = pd.concat([self.buffer, chunk]) if len(self.buffer) else chunk
+
+    def take_before(self, bound):
+        """Remove and return buffered rows dated before bound."""
+        n = int(np.searchsorted(self.buffer["date"].values, bound, side="left"))
+        taken = self.buffer.iloc[:n]
+        self.buffer = self.buffer.iloc[n:]
+        return taken
+
+
+def new_rows(df, last_date):
+    """
+    Select rows of an SFL DataFrame added after last_date.
+
+    Returns the tail of df following the last row with a date <= last_date.
+    Dates are compared as parsed timestamps, so any UTC offset or fractional
+    second format accepted by pandas can be used in df and last_date. Rows in
+    the tail are kept even if their dates are invalid, so they can still be
+    validated. The index of df is preserved.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        SFL DataFrame with a date column of RFC3339 strings.
+    last_date: str or None
+        RFC3339 date of the last row already imported. If None all rows are
+        returned.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Slice of df.
+    """
+    if last_date is None:
+        return df
+    dates = pd.to_datetime(df["date"], utc=True, errors="coerce")
+    old = np.flatnonzero((dates <= pd.Timestamp(last_date)).values)
+    if len(old) == 0:
+        return df
+    return df.iloc[old[-1] + 1:]
+
+
 def parse_sfl_filename(fn):
     fn = os.path.basename(fn)
     m = re.match(r"^(?P<cruise>.+)_(?P<inst>[^_]+).sfl$", fn)
@@ -392,32 +620,46 @@ def parse_sfl_filename(fn):
     return ()
 
 
+def prepare_errors(errors, filename, print_all=True):
+    """
+    Prepare errors for printing.
+
+    Parameters
+    ----------
+    errors: pandas.DataFrame
+        Errors returned by check().
+    filename: str
+        SFL file name to add as a "file" column.
+    print_all: bool, default True
+        Keep every error. If False only keep the first error for each
+        column/message combination.
+
+    Returns
+    -------
+    list of dict
+        JSON serializable error dictionaries.
+    """
+    errors = pd.DataFrame(errors, columns=error_columns)
+    if not print_all:
+        errors = errors[~errors.duplicated(["column", "message"])]
+    errors = errors.assign(file=filename)
+    keys = list(errors.columns)
+    return [
+        {k: make_json_serializable(v) for k, v in zip(keys, row)}
+        for row in errors.itertuples(index=False, name=None)
+    ]
+
+
 @util.suppress_sigpipe
 def print_json_errors(errors, fh, filename, print_all=True):
-    errors_output = []
-    errors_seen = set()
-    for e in errors:
-        e["file"] = filename
-        error_key = e["column"] + e["message"]
-        if (not print_all) and (error_key in errors_seen):
-            continue
-        errors_seen.add(error_key)
-        errors_output.append(e)
+    errors_output = prepare_errors(errors, filename, print_all=print_all)
     fh.write(json.dumps(errors_output, sort_keys=True, indent=2, separators=(',', ':')))
     fh.write("\n")
 
 
 @util.suppress_sigpipe
 def print_tsv_errors(errors, fh, filename, print_all=True, header=True,):
-    errors_output = []
-    errors_seen = set()
-    for e in errors:
-        e["file"] = filename
-        error_key = e["column"] + e["message"]
-        if (not print_all) and (error_key in errors_seen):
-            continue
-        errors_seen.add(error_key)
-        errors_output.append(e)
+    errors_output = prepare_errors(errors, filename, print_all=print_all)
 
     # TSV output
     if header:
@@ -458,6 +700,32 @@ def read_file(
         df = pd.read_csv(file_path, **kwargs_defaults)
     except pd.errors.ParserError:
         raise sfperrors.FileError("could not parse {} as an sfl file".format(file_path))
+    return _convert_columns(df, convert_dates, convert_numerics, convert_colnames)
+
+
+def read_file_chunks(file_path, chunksize=100000, convert_numerics=True, convert_colnames=True):
+    """Parse SFL file into DataFrames of at most chunksize rows.
+
+    Chunks are converted as in read_file(). Row indexes continue across
+    chunks.
+    """
+    reader = pd.read_csv(
+        file_path,
+        sep=str(sfl_delim),
+        dtype=str,
+        na_filter=True,
+        encoding="utf-8",
+        chunksize=chunksize
+    )
+    try:
+        for chunk in reader:
+            yield _convert_columns(chunk, False, convert_numerics, convert_colnames)
+    except pd.errors.ParserError:
+        raise sfperrors.FileError("could not parse {} as an sfl file".format(file_path))
+
+
+def _convert_columns(df, convert_dates, convert_numerics, convert_colnames):
+    """Apply read_file column conversions to a DataFrame of SFL strings."""
     df = df.rename(columns=colname_mapping["file_to_table"])
 
     if convert_dates:
@@ -475,14 +743,190 @@ def read_file(
     return df
 
 
-def save_to_db(df, dbpath, cruise=None, serial=None):
+class SFLTailReader:
+    """
+    Incrementally parse lines appended to a growing SFL file.
+
+    Each call to read() parses only complete lines written since the previous
+    call, starting from the byte offset where the last call stopped. A
+    trailing line without a newline is left for the next call. Header lines
+    (lines with FILE as the first field) found after the first are used as the
+    header for following rows, which handles concatenated SFL files. If the
+    file shrinks, or the last line read is no longer found just before offset,
+    it's assumed to have been replaced and is read again from the beginning.
+    Progress can be saved with state() and restored with set_state(), e.g. to
+    continue in a later process.
+
+    Parameters
+    ----------
+    file_path: str
+        SFL file path.
+    convert_numerics: bool, default True
+        Cast numeric SQL columns as numbers.
+    convert_colnames: bool, default True
+        Remap file column names to match SFL SQL table column where
+        appropriate.
+    encoding: str, default "utf-8"
+        Text encoding of the SFL file.
+
+    Attributes
+    ----------
+    offset: int
+        Byte offset just past the last parsed line.
+    header: list of str or None
+        Column names from the current header line as found in the file.
+    rows: int
+        Number of data rows parsed so far. Rows in DataFrames returned by
+        read() are indexed by their position in the file, so errors from
+        check() have correct line numbers.
+    last_line: bytes or None
+        Last complete line read, including the newline.
+    """
+
+    def __init__(self, file_path, convert_numerics=True, convert_colnames=True, encoding="utf-8"):
+        self.file_path = file_path
+        self.convert_numerics = convert_numerics
+        self.convert_colnames = convert_colnames
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self):
+        """Forget all read progress and start again at the beginning of the file."""
+        self.offset = 0
+        self.header = None
+        self.rows = 0
+        self.last_line = None
+
+    def state(self):
+        """Return read progress as a dict for set_state()."""
+        return {
+            "offset": self.offset,
+            "rows": self.rows,
+            "header": None if self.header is None else list(self.header),
+            "last_line": self.last_line
+        }
+
+    def set_state(self, state):
+        """Continue from read progress returned by state()."""
+        self.offset = state["offset"]
+        self.rows = state["rows"]
+        self.header = None if state["header"] is None else list(state["header"])
+        self.last_line = state["last_line"]
+
+    def read(self):
+        """
+        Parse complete lines appended since the last call.
+
+        Returns
+        -------
+        pandas.DataFrame
+            New rows converted as in read_file(). Empty if there are no new
+            complete data lines.
+        """
+        with open(self.file_path, "rb") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell() < self.offset:
+                # File was truncated or replaced
+                self.reset()
+            elif self.offset and self.last_line:
+                fh.seek(self.offset - len(self.last_line))
+                if fh.read(len(self.last_line)) != self.last_line:
+                    # File was replaced with one at least as large
+                    self.reset()
+            fh.seek(self.offset)
+            data = fh.read()
+
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return self._parse([])
+        self.offset += end
+        self.last_line = data[data.rfind(b"\n", 0, end - 1) + 1:end]
+
+        # Split new lines into blocks of data lines under the same header
+        blocks = []
+        lines = []
+        for line in data[:end].decode(self.encoding).splitlines():
+            if not line.strip():
+                continue
+            fields = line.rstrip("\r").split(sfl_delim)
+            if fields[0] == colname_mapping["table_to_file"]["file"]:
+                if lines:
+                    blocks.append(self._parse(lines))
+                    lines = []
+                self.header = fields
+            elif self.header is not None:
+                lines.append(fields)
+        if lines or not blocks:
+            blocks.append(self._parse(lines))
+        return pd.concat(blocks)
+
+    def _parse(self, lines):
+        """
+        Parse data lines, as lists of fields, with the current header.
+
+        Lines are padded with empty fields or trimmed to the length of the
+        header, since SFL headers may have a trailing column with no data,
+        e.g. NULL.
+        """
+        if self.header is None:
+            return pd.DataFrame()
+        if lines:
+            width = len(self.header)
+            lines = [(fields + [""] * width)[:width] for fields in lines]
+            df = pd.read_csv(
+                io.StringIO("\n".join(sfl_delim.join(fields) for fields in lines)),
+                sep=str(sfl_delim),
+                names=self.header,
+                header=None,
+                dtype=str,
+                na_filter=True
+            )
+        else:
+            df = pd.DataFrame(columns=self.header, dtype=str)
+        df.index = pd.RangeIndex(self.rows, self.rows + len(df))
+        self.rows += len(df)
+        return _convert_columns(df, False, self.convert_numerics, self.convert_colnames)
+
+
+def follow_file(file_path, interval=5, **kwargs):
+    """
+    Poll a growing SFL file forever, yielding new rows as they are written.
+
+    Parameters
+    ----------
+    file_path: str
+        SFL file path.
+    interval: int or float, default 5
+        Seconds to wait between polls when no new rows are found.
+    **kwargs
+        Passed to SFLTailReader.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Non-empty DataFrames of new rows from SFLTailReader.read().
+    """
+    reader = SFLTailReader(file_path, **kwargs)
+    while True:
+        df = reader.read()
+        if len(df):
+            yield df
+        else:
+            sleep(interval)
+
+
+def save_to_db(df, dbpath, cruise=None, serial=None, incremental=False):
     """Write SFL dataframe to a SQLite3 database.
 
-    Any pre-existing SFL data will be erased.
+    Any pre-existing SFL data will be erased unless incremental is True.
 
     Arguments:
     df -- SFL DataFrame.
     dbpath -- Path to SQLite3 database file.
+
+    Keyword arguments:
+    incremental -- Keep existing SFL data and insert or replace rows in df
+        (default False).
     """
     db.create_db(dbpath)  # create or update db if needed
     if cruise is None:
@@ -492,11 +936,14 @@ def save_to_db(df, dbpath, cruise=None, serial=None):
     metadf = pd.DataFrame({'cruise': [cruise], 'inst': [serial]})
     db.save_metadata(dbpath, metadf.to_dict('index').values())
     # This assumes there are column names which match SQL SFL table
-    db.save_sfl(dbpath, df.to_dict('index').values())
+    if incremental:
+        db.upsert_sfl(dbpath, df)
+    else:
+        db.save_sfl(dbpath, df.to_dict('index').values())
 
 
 @util.suppress_sigpipe
-def save_to_file(df, outpath, convert_colnames=True, all_columns=False):
+def save_to_file(df, outpath, convert_colnames=True, all_columns=False, header=True):
     """Write SFL dataframe to a csv file.
 
     Arguments:
@@ -506,6 +953,7 @@ def save_to_file(df, outpath, convert_colnames=True, all_columns=False):
     Keyword Arguments:
     convert_colnames -- Remap SQL table column names to SFL file column names
         where appropriate. (default True).
+    header -- Write a header line (default True).
     """
     # Remove input file path and line number columns that may have been
     # added.
@@ -514,4 +962,4 @@ def save_to_file(df, outpath, convert_colnames=True, all_columns=False):
     if convert_colnames:
         df = df.rename(columns=colname_mapping["table_to_file"])
     df.to_csv(outpath, sep=str(sfl_delim), na_rep="NA", encoding="utf-8",
-        index=False, float_format="%.4f")
+        index=False, float_format="%.4f", header=header)
@@ -0,0 +1,282 @@
+"""
+Deterministic synthetic SeaFlow data for benchmarks and tests.
+
+Event data is drawn from a simple mixture of particle populations which
+resembles real EVT data closely enough to exercise every filtering code path:
+noise events below detection, events which saturate D1/D2, calibration beads,
+focused cells and unfocused particles. The same seed always produces the same
+files.
+"""
+import datetime
+import os
+import numpy as np
+import pandas as pd
+from . import db
+from . import fileio
+from . import particleops
+from . import seaflowfile
+from . import sfl
+from .time import seaflow_rfc3339
+
+
+# Filter parameters for synthetic data, one row per quantile. Based on the
+# parameters for the test cruise, with bead coordinates matching bead_center.
+filter_params = pd.DataFrame({
+    "quantile": [2.5, 50.0, 97.5],
+    "beads_fsc_small": [45000.0] * 3,
+    "beads_D1": [26000.0] * 3,
+    "beads_D2": [26000.0] * 3,
+    "width": [2500.0] * 3,
+    "notch_small_D1": [0.614, 0.656, 0.698],
+    "notch_small_D2": [0.651, 0.683, 0.714],
+    "notch_large_D1": [1.183, 1.635, 2.087],
+    "notch_large_D2": [1.208, 1.632, 2.056],
+    "offset_small_D1": [1418.0, 0.0, -1418.0],
+    "offset_small_D2": [1080.0, 0.0, -1047.0],
+    "offset_large_D1": [-17791.0, -33050.0, -48309.0],
+    "offset_large_D2": [-17724.0, -32038.0, -46352.0]
+})
+
+# Mean channel values for calibration beads
+bead_center = {"fsc_small": 45000.0, "D1": 26000.0, "D2": 26000.0, "pe": 55000.0, "chl_small": 30000.0}
+
+# Default fractions of events in each population. Remaining events are
+# unfocused particles.
+default_fractions = {"noise": 0.05, "saturated": 0.005, "beads": 0.01, "focused": 0.3}
+
+_max_value = 2**16 - 1
+
+
+def evt(n, seed=None, fractions=None):
+    """
+    Create synthetic EVT data.
+
+    Parameters
+    ----------
+    n: int
+        Number of events.
+    seed: int or sequence of int, optional
+        Seed for numpy.random.default_rng.
+    fractions: dict, optional
+        Fraction of events in the "noise", "saturated", "beads" and "focused"
+        populations. Missing keys use default_fractions. The remainder are
+        unfocused particles.
+
+    Returns
+    -------
+    pandas.DataFrame
+        SeaFlow raw event DataFrame as numpy.float64 integer values, the same
+        as fileio.read_evt_labview() would return.
+    """
+    rng = np.random.default_rng(seed)
+    fracs = dict(default_fractions, **(fractions or {}))
+    counts = {k: int(round(n * fracs[k])) for k in ["noise", "saturated", "beads", "focused"]}
+    counts["unfocused"] = n - sum(counts.values())
+    if counts["unfocused"] < 0:
+        raise ValueError("population fractions must sum to <= 1")
+
+    pops = []
+
+    # Noise, nothing above detection in fsc_small, D1, D2
+    k = counts["noise"]
+    pops.append({
+        "fsc_small": rng.integers(0, 2, k),
+        "D1": rng.integers(0, 2, k),
+        "D2": rng.integers(0, 2, k),
+        "pe": rng.exponential(500, k),
+        "chl_small": rng.exponential(2000, k)
+    })
+
+    # Saturated in D1 or D2
+    k = counts["saturated"]
+    d = rng.uniform(20000, _max_value, (2, k))
+    d[rng.integers(0, 2, k), np.arange(k)] = _max_value
+    pops.append({
+        "fsc_small": rng.uniform(0, 60000, k),
+        "D1": d[0],
+        "D2": d[1],
+        "pe": rng.exponential(3000, k),
+        "chl_small": rng.exponential(8000, k)
+    })
+
+    # Beads, tight cluster brighter in fsc than any other particle. D1/D2 are
+    # proportional to fsc so that beads.find_beads' rough filter, which keeps
+    # particles with fsc/D ratios at least as high as the brightest particle,
+    # keeps about half of them.
+    k = counts["beads"]
+    bead = {col: rng.normal(center, center * 0.02, k) for col, center in bead_center.items()}
+    for col in ["D1", "D2"]:
+        bead[col] = bead["fsc_small"] * bead_center[col] / bead_center["fsc_small"]
+    pops.append(bead)
+
+    # Focused cells, small D1/D2 relative to fsc and D1 ~= D2
+    k = counts["focused"]
+    fsc = _lognormal(rng, 3000, 1.0, k)
+    d1 = fsc * rng.uniform(0.1, 0.55, k) + rng.normal(0, 200, k)
+    # About a fifth are Synechococcus-like with high pe
+    syn = rng.random(k) < 0.2
+    pops.append({
+        "fsc_small": fsc,
+        "D1": d1,
+        "D2": d1 + rng.normal(0, 600, k),
+        "pe": np.where(syn, rng.lognormal(np.log(20000), 0.4, k), rng.exponential(1500, k)),
+        "chl_small": rng.lognormal(np.log(7000), 0.7, k)
+    })
+
+    # Unfocused particles, large D1/D2 relative to fsc or misaligned D1/D2
+    k = counts["unfocused"]
+    fsc = _lognormal(rng, 800, 1.2, k)
+    pops.append({
+        "fsc_small": fsc,
+        "D1": fsc * rng.uniform(1.0, 3.0, k) + rng.uniform(2000, 40000, k),
+        "D2": fsc * rng.uniform(1.0, 3.0, k) + rng.uniform(2000, 40000, k),
+        "pe": rng.exponential(3000, k),
+        "chl_small": rng.lognormal(np.log(6000), 0.6, k)
+    })
+
+    data = {col: np.concatenate([p[col] for p in pops]) for col in pops[0]}
+    # Remaining channels have little variation in real data
+    data["time"] = np.sort(rng.integers(0, 4, n))
+    data["pulse_width"] = rng.normal(9300, 680, n)
+    data["fsc_perp"] = rng.normal(33077, 6, n)
+    data["fsc_big"] = rng.normal(6350, 1150, n)
+    data["chl_big"] = rng.normal(32355, 5, n)
+
+    order = rng.permutation(n)
+    df = pd.DataFrame({
+        col: np.clip(np.round(data[col]), 0, _max_value)[order] if col != "time" else data[col]
+        for col in particleops.COLUMNS
+    }, dtype=np.float64)
+    return df
+
+
+def _lognormal(rng, median, sigma, size, maxval=30000):
+    """Log-normal values, with values above maxval redrawn uniformly below it"""
+    values = rng.lognormal(np.log(median), sigma, size)
+    high = values > maxval
+    values[high] = rng.uniform(0, maxval, high.sum())
+    return values
+
+
+def sfl_df(file_ids, dates, events, seed=None):
+    """
+    Create synthetic SFL data.
+
+    Parameters
+    ----------
+    file_ids: list of str
+        SeaFlow file IDs.
+    dates: list of datetime.datetime
+        Timestamps for each file.
+    events: list of int
+        Event counts for each file, used to calculate event rate.
+    seed: int or sequence of int, optional
+        Seed for numpy.random.default_rng.
+
+    Returns
+    -------
+    pandas.DataFrame
+        SFL DataFrame with SQL table column names.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(file_ids)
+    duration = 180.0
+    hours = np.array([d.hour + d.minute / 60 for d in dates])
+    # Ship steaming in a 5 degree radius circle, about 10 knots
+    angle = np.arange(n) * 0.001
+    return pd.DataFrame({
+        "file": file_ids,
+        "date": [seaflow_rfc3339(d) for d in dates],
+        "file_duration": rng.normal(duration, 0.05, n),
+        "lat": 21.0 + 5 * np.sin(angle),
+        "lon": -158.0 + 5 * np.cos(angle),
+        "conductivity": rng.normal(5.3, 0.01, n),
+        "salinity": rng.normal(34.8, 0.02, n),
+        "ocean_tmp": rng.normal(25.0, 0.1, n),
+        # Diurnal light cycle, night at 0
+        "par": np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None) * 2000,
+        "bulk_red": rng.normal(10.0, 1.0, n),
+        "stream_pressure": rng.normal(12.0, 0.1, n),
+        "event_rate": np.array(events) / duration
+    })
+
+
+def cruise(outdir, name="synthetic", file_count=10, events=40000, start=None,
+           gz="mixed", opp=True, seed=0):
+    """
+    Create a synthetic cruise.
+
+    Creates outdir/<name>_evt with EVT files in day of year subdirectories,
+    outdir/<name>_opp with matching OPP files, an SFL file outdir/<name>.sfl
+    and a popcycle database outdir/<name>.db with SFL data and filter
+    parameters. Files are 3 minutes apart.
+
+    Parameters
+    ----------
+    outdir: str
+        Output directory.
+    name: str, default "synthetic"
+        Cruise name.
+    file_count: int, default 10
+        Number of EVT files.
+    events: int, default 40000
+        Events per EVT file.
+    start: datetime.datetime, optional
+        Timestamp of the first file, default 2014-07-04 00:00:02 UTC.
+    gz: bool or "mixed", default "mixed"
+        Gzip compress EVT/OPP files. If "mixed" every other file is compressed.
+    opp: bool, default True
+        Create OPP files.
+    seed: int, default 0
+        Seed for all random data.
+
+    Returns
+    -------
+    dict
+        "evt_dir", "opp_dir" (None if opp is False), "sfl", "db", and
+        "evt_files", a chronological list of EVT file paths.
+    """
+    if start is None:
+        start = datetime.datetime(2014, 7, 4, 0, 0, 2, tzinfo=datetime.timezone.utc)
+    evt_dir = os.path.join(outdir, name + "_evt")
+    opp_dir = os.path.join(outdir, name + "_opp") if opp else None
+    params = filter_params.copy()
+    params["id"] = "synthetic"
+
+    file_ids, dates, evt_files = [], [], []
+    for i in range(file_count):
+        date = start + datetime.timedelta(minutes=3 * i)
+        file_id = "{}/{}".format(
+            seaflowfile.create_dayofyear_directory(date),
+            date.strftime("%Y-%m-%dT%H-%M-%S+00-00")
+        )
+        compress = (i % 2 == 0) if gz == "mixed" else bool(gz)
+        path = os.path.join(evt_dir, file_id + (".gz" if compress else ""))
+        df = evt(events, seed=[seed, i])
+        fileio.write_labview(df, path)
+        if opp:
+            opp_df = particleops.select_focused(particleops.mark_focused(df, params))
+            fileio.write_opp_labview(opp_df, file_id, opp_dir, gz=compress)
+        file_ids.append(file_id)
+        dates.append(date)
+        evt_files.append(path)
+
+    sfl_path = os.path.join(outdir, name + ".sfl")
+    dbpath = os.path.join(outdir, name + ".db")
+    sfl_data = sfl_df(
+        [seaflowfile.parse(f).file_id for f in file_ids],
+        dates,
+        [events] * file_count,
+        seed=[seed, file_count]
+    )
+    sfl.save_to_file(sfl_data, sfl_path)
+    sfl.save_to_db(sfl_data, dbpath, cruise=name, serial="740")
+    db.save_filter_params(dbpath, filter_params.to_dict("records"))
+
+    return {
+        "evt_dir": evt_dir,
+        "opp_dir": opp_dir,
+        "sfl": sfl_path,
+        "db": dbpath,
+        "evt_files": evt_files
+    }
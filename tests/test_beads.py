@@ -0,0 +1,312 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+
+def evt_window(hour, seed, n=30000):
+    """Synthetic EVT sample data for one hourly window"""
+    df = sfp.synthetic.evt(n, seed=seed)
+    start = pd.Timestamp("2014-07-04T00:00:00") + pd.Timedelta(hours=hour)
+    df["date"] = start + pd.to_timedelta(np.linspace(0, 3500, n).round(), unit="s")
+    df["file_id"] = "2014_185/" + start.strftime("%Y-%m-%dT%H-%M-%S+00-00")
+    return df
+
+
+@pytest.fixture()
+def particle_file(tmp_path):
+    path = str(tmp_path / "sample.parquet")
+    pd.concat([evt_window(h, [0, h]) for h in range(3)], ignore_index=True).to_parquet(path)
+    return path
+
+
+def run_beads(particle_file, out_dir, *args):
+    cmd = [
+        "evt", "beads", "-c", "test", "-o", out_dir, "--min-fsc", "40000",
+        "--min-pe", "45000", *args, particle_file
+    ]
+    result = CliRunner().invoke(cli, cmd)
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+    return result
+
+
+@pytest.fixture()
+def find_beads_calls(monkeypatch):
+    calls = []
+    find_beads = sfp.beads.find_beads
+
+    def spy(df, **kwargs):
+        calls.append(len(df))
+        return find_beads(df, **kwargs)
+
+    monkeypatch.setattr(sfp.beads, "find_beads", spy)
+    return calls
+
+
+def test_beads_incremental(particle_file, tmp_path, find_beads_calls):
+    out_dir = str(tmp_path / "out")
+    parquet_path = tmp_path / "out" / "test.beads-by-1H.parquet"
+    assert run_beads(particle_file, out_dir).exit_code == 0
+    first = pd.read_parquet(parquet_path)
+    assert len(first) == 3
+    assert len(find_beads_calls) == 3
+
+    # Unchanged input, nothing is clustered or written
+    mtime = parquet_path.stat().st_mtime_ns
+    assert run_beads(particle_file, out_dir, "--incremental").exit_code == 0
+    assert len(find_beads_calls) == 3
+    assert parquet_path.stat().st_mtime_ns == mtime
+
+    # Change the second window, only that window is clustered again
+    df = pd.read_parquet(particle_file)
+    df = pd.concat([df[df["date"] < "2014-07-04T01:00:00"], evt_window(1, [1, 1]), df[df["date"] >= "2014-07-04T02:00:00"]])
+    df.to_parquet(particle_file)
+    assert run_beads(particle_file, out_dir, "--incremental").exit_code == 0
+    assert len(find_beads_calls) == 4
+    second = pd.read_parquet(parquet_path)
+    assert second["date"].tolist() == first["date"].tolist()
+    changed = (second["input_hash"] != first["input_hash"]).tolist()
+    assert changed == [False, True, False]
+    pd.testing.assert_frame_equal(second.iloc[[0, 2]], first.iloc[[0, 2]])
+    # Temporary files were renamed over the output
+    assert list((tmp_path / "out").glob(".*.parquet")) == []
+
+
+def test_beads_incremental_write_error(particle_file, tmp_path, monkeypatch):
+    out_dir = str(tmp_path / "out")
+    parquet_path = tmp_path / "out" / "test.beads-by-1H.parquet"
+    assert run_beads(particle_file, out_dir).exit_code == 0
+    before = parquet_path.read_bytes()
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fail)
+    with pytest.raises(OSError):
+        run_beads(particle_file, out_dir, "--incremental", "--frac", "0.3")
+    # The existing file is untouched and the temporary file is removed
+    assert parquet_path.read_bytes() == before
+    assert list((tmp_path / "out").glob(".*.parquet")) == []
+
+
+def test_beads_incremental_no_results_left(particle_file, tmp_path, monkeypatch):
+    out_dir = str(tmp_path / "out")
+    parquet_path = tmp_path / "out" / "test.beads-by-1H.parquet"
+    assert run_beads(particle_file, out_dir).exit_code == 0
+    assert parquet_path.exists()
+
+    def fail(*args, **kwargs):
+        raise sfp.errors.ClusterError("no clusters")
+
+    # New parameters supersede every window and clustering fails for all
+    monkeypatch.setattr(sfp.beads, "find_beads", fail)
+    assert run_beads(particle_file, out_dir, "--incremental", "--frac", "0.3").exit_code == 0
+    assert not parquet_path.exists()
+    assert not (tmp_path / "out" / "test.summary.png").exists()
+
+
+def test_grid_aggregate_maps_rows_to_bins():
+    rng = np.random.default_rng(0)
+    values = np.column_stack([rng.normal(45000, 2000, 5000), rng.uniform(0, 65535, 5000)])
+    bin_idx, centers, weights = sfp.beads.grid_aggregate(values, 32, 1000)
+    assert len(bin_idx) == len(values)
+    # Every row is inside the grid cell of its bin center
+    width = (values.max(axis=0) - values.min(axis=0)) / 32
+    assert (np.abs(values - centers[bin_idx]) <= width / 2 + 1e-6).all()
+    # Weights are bin counts scaled to max_points
+    counts = np.bincount(bin_idx, minlength=len(centers))
+    np.testing.assert_array_equal(weights, np.rint(counts * 1000 / 5000))
+    assert abs(weights.sum() - 1000) < len(centers)
+
+
+def test_cluster_grid_indices():
+    df = sfp.synthetic.evt(50000, seed=0)
+    df = df[(df["fsc_small"] > 40000) & (df["pe"] > 45000)].reset_index(drop=True)
+    columns = ["fsc_small", "pe"]
+    result = sfp.beads.cluster(df, columns, 0.33, grid_bins=64, grid_points=2000)
+    # Clustered points are the original rows of df, not bin centers
+    np.testing.assert_array_equal(result["points"], df[columns].values[result["indices"]])
+    # All rows in a bin share the bin's cluster membership
+    bin_idx, _, _ = sfp.beads.grid_aggregate(df[columns].values, 64, 2000)
+    clustered_bins = np.unique(bin_idx[result["indices"]])
+    assert set(np.flatnonzero(np.isin(bin_idx, clustered_bins))) == set(result["indices"])
+
+
+def test_find_beads_grid_matches_raw():
+    df = sfp.synthetic.evt(50000, seed=0)
+    raw = sfp.beads.find_beads(df)["bead_coordinates"].iloc[0]
+    grid = sfp.beads.find_beads(df, grid_bins=64, grid_points=2000)["bead_coordinates"].iloc[0]
+    for col in ["fsc_small", "D1", "D2"]:
+        center = sfp.synthetic.bead_center[col]
+        assert abs(grid[col + "_2Q"] - raw[col + "_2Q"]) < center * 0.01
+        assert abs(grid[col + "_2Q"] - center) < center * 0.05
+
+
+@pytest.fixture(scope="module")
+def bead_results():
+    df = sfp.synthetic.evt(50000, seed=0)
+    return df, sfp.beads.find_beads(df)
+
+
+def test_cache_key():
+    df = sfp.synthetic.evt(1000, seed=0)
+    params = {"frac": 0.33, "min_fsc": 40000}
+    key = sfp.beads.cache_key(df, params)
+    assert key == sfp.beads.cache_key(df.copy(), dict(reversed(list(params.items()))))
+    assert key != sfp.beads.cache_key(df, dict(params, frac=0.3))
+    changed = df.copy()
+    changed.loc[0, "pe"] += 1
+    assert key != sfp.beads.cache_key(changed, params)
+
+
+def test_bead_cache_hit_and_miss(tmp_path, bead_results):
+    df, results = bead_results
+    cache = sfp.beads.BeadCache(str(tmp_path / "cache"))
+    params = {"frac": 0.33, "min_fsc": 40000}
+    key = sfp.beads.cache_key(df, params)
+    assert cache.get(key) is None
+    cache.put(key, results)
+    cached = cache.get(key)
+    pd.testing.assert_frame_equal(cached["bead_coordinates"], results["bead_coordinates"], check_dtype=False)
+    for name in ["fsc_pe", "fsc_D1", "fsc_D2"]:
+        np.testing.assert_array_equal(cached["hull_points"][name], results["cluster_results"][name]["hull_points"])
+    assert cached["message"] == results["message"]
+    # Cached results can be cached again, e.g. when copied between caches
+    other = sfp.beads.BeadCache(str(tmp_path / "other"))
+    other.put(key, cached)
+    assert other.get(key)["message"] == results["message"]
+    # A changed parameter is a different key
+    assert cache.get(sfp.beads.cache_key(df, dict(params, min_fsc=45000))) is None
+
+
+def test_bead_cache_eviction(tmp_path, bead_results):
+    df, results = bead_results
+    cache = sfp.beads.BeadCache(str(tmp_path / "cache"))
+    keys = [sfp.beads.cache_key(df, {"i": i}) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, results)
+        # Distinct access times, oldest first
+        os.utime(cache._path(key), (1000 + i, 1000 + i))  # pylint: disable=protected-access
+    entry_size = os.path.getsize(cache._path(keys[0]))  # pylint: disable=protected-access
+    # Reading an entry marks it as recently used
+    assert cache.get(keys[0]) is not None
+    cache.max_bytes = entry_size * 2
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+
+
+@pytest.mark.parametrize("content", [b"", b"not a zip file", None])
+def test_bead_cache_corrupt_entry(tmp_path, bead_results, content):
+    df, results = bead_results
+    cache = sfp.beads.BeadCache(str(tmp_path / "cache"))
+    key = sfp.beads.cache_key(df, {})
+    cache.put(key, results)
+    path = cache._path(key)  # pylint: disable=protected-access
+    if content is None:
+        # Truncated entry
+        with open(path, "rb") as fh:
+            content = fh.read()[:100]
+    with open(path, "wb") as fh:
+        fh.write(content)
+    assert cache.get(key) is None
+    # The corrupt entry is removed
+    assert not os.path.exists(path)
+    # The entry can be replaced
+    cache.put(key, results)
+    assert cache.get(key) is not None
+
+
+def hist2d_lookup(x, y, nbin):
+    """Per-point bin counts from numpy.histogram2d"""
+    xedges = np.linspace(x.min(), x.max(), nbin + 1)
+    yedges = np.linspace(y.min(), y.max(), nbin + 1)
+    counts, _, _ = np.histogram2d(x, y, bins=[xedges, yedges])
+    xbin = np.clip(np.searchsorted(xedges, x, side="right") - 1, 0, nbin - 1)
+    ybin = np.clip(np.searchsorted(yedges, y, side="right") - 1, 0, nbin - 1)
+    return counts, xbin, ybin
+
+
+def scale_log(counts):
+    logdens = np.log10(counts)
+    return (logdens - logdens.min()) / (logdens.max() - logdens.min())
+
+
+def test_hist_density_matches_histogram2d():
+    rng = np.random.default_rng(0)
+    x = rng.normal(30000, 3000, 20000)
+    y = rng.normal(20000, 1000, 20000)
+    counts, xbin, ybin = hist2d_lookup(x, y, 50)
+    dens = sfp.beads.hist_density(x, y, nbin=50, bandwidth=(0, 0))
+    np.testing.assert_allclose(dens, scale_log(counts[xbin, ybin]))
+
+    # Smoothing is a Gaussian filter of the same histogram, sigma in bins
+    from scipy.ndimage import gaussian_filter
+    bandwidth = (2 * (x.max() - x.min()) / 50, 3 * (y.max() - y.min()) / 50)
+    smoothed = gaussian_filter(counts, sigma=(2, 3), mode="constant")
+    dens = sfp.beads.hist_density(x, y, nbin=50, bandwidth=bandwidth)
+    np.testing.assert_allclose(dens, scale_log(smoothed[xbin, ybin]))
+    assert dens.min() == 0 and dens.max() == 1
+
+
+def test_hist_density_non_finite():
+    x = np.array([1.0, 2.0, np.nan, 4.0, 4.0])
+    y = np.array([1.0, np.inf, 3.0, 4.0, 4.0])
+    dens = sfp.beads.hist_density(x, y, nbin=4, bandwidth=(0, 0))
+    assert np.isnan(dens[[1, 2]]).all()
+    np.testing.assert_allclose(dens[[0, 3, 4]], [0, 1, 1])
+    assert np.isnan(sfp.beads.hist_density(np.array([np.nan]), np.array([1.0]))).all()
+
+
+@pytest.fixture()
+def windows_file(tmp_path):
+    """Sample data over 5 hours, in small row groups that split windows"""
+    df = pd.concat([evt_window(h, [2, h], n=3000) for h in range(5)], ignore_index=True)
+    path = str(tmp_path / "windows.parquet")
+    df.to_parquet(path, row_group_size=1000)
+    return path
+
+
+def expected_windows(df, resolution, min_date, max_date, columns):
+    df = df[(df["date"] >= min_date) & (df["date"] <= max_date)]
+    return [
+        (name, group.reset_index(drop=True))
+        for name, group in df[["date"] + columns].set_index("date").resample(resolution)
+        if len(group)
+    ]
+
+
+@pytest.mark.parametrize("resolution", ["1H", "45T", "1D"])
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_iter_evt_windows(windows_file, resolution, shuffle):
+    df = pd.read_parquet(windows_file)
+    if shuffle:
+        # Unsorted dates are read in one pass instead of streamed
+        df = df.sample(frac=1, random_state=0).reset_index(drop=True)
+        df.to_parquet(windows_file, row_group_size=1000)
+    min_date = pd.Timestamp("2014-07-04T00:40:00")
+    max_date = pd.Timestamp("2014-07-04T03:20:00")
+    columns = ["fsc_small", "pe"]
+    windows = list(sfp.beads.iter_evt_windows(
+        windows_file, resolution, min_date=min_date, max_date=max_date, columns=columns + ["not_a_column"]
+    ))
+    expected = expected_windows(df, resolution, min_date, max_date, columns)
+    assert [w[0] for w in windows] == [e[0] for e in expected]
+    for (_, got), (_, want) in zip(windows, expected):
+        # Only requested columns are read
+        assert list(got.columns) == columns
+        pd.testing.assert_frame_equal(got, want)
+
+
+def test_iter_evt_windows_empty_range(windows_file):
+    windows = sfp.beads.iter_evt_windows(windows_file, "1H", min_date=pd.Timestamp("2020-01-01"))
+    assert list(windows) == []
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        sfp.beads.iter_evt_windows(windows_file, "not a resolution")
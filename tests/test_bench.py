@@ -0,0 +1,81 @@
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+
+def results(medians, iqr=0.0):
+    return {
+        "meta": {},
+        "benchmarks": {
+            name: {"times": [m], "median": m, "iqr": iqr, "peak_memory": 1000}
+            for name, m in medians.items()
+        }
+    }
+
+
+@pytest.fixture()
+def baseline():
+    b = results({"a": 1.0, "b": 1.0})
+    b["benchmarks"]["b"]["threshold"] = 0.5
+    return b
+
+
+def test_run():
+    names = ["fileio.read_evt_labview", "particleops.mark_focused"]
+    res = sfp.bench.run(names=names, repeat=3, file_count=2, events=2000)
+    assert list(res["benchmarks"]) == names
+    assert res["meta"]["repeat"] == 3
+    for r in res["benchmarks"].values():
+        assert len(r["times"]) == 3
+        assert r["median"] > 0
+        assert r["iqr"] >= 0
+        assert r["loops"] >= 1
+        assert r["peak_memory"] > 0
+
+
+def test_run_unknown_benchmark():
+    with pytest.raises(ValueError):
+        sfp.bench.run(names=["not_a_benchmark"])
+
+
+def test_summarize():
+    s = sfp.bench.summarize([1.0, 2.0, 3.0, 4.0, 100.0])
+    assert s["median"] == 3.0
+    assert s["iqr"] == 2.0
+
+
+def test_compare(baseline):
+    df = sfp.bench.compare(results({"a": 1.3, "b": 1.3, "c": 1.0}), baseline)
+    assert list(df.columns) == sfp.bench.compare_columns
+    assert df["status"].tolist() == ["regression", "ok", "new"]
+    assert df["change"].iloc[0] == pytest.approx(0.3)
+    assert df["threshold"].tolist()[:2] == [sfp.bench.default_threshold, 0.5]
+    # Default threshold for benchmarks without a threshold in baseline
+    df = sfp.bench.compare(results({"a": 1.3}), baseline, threshold=0.4)
+    assert df["status"].tolist() == ["ok"]
+
+
+def test_compare_noise(baseline):
+    # Slowdowns within the spread of run times aren't regressions
+    df = sfp.bench.compare(results({"a": 1.3}, iqr=0.4), baseline)
+    assert df["status"].tolist() == ["ok"]
+
+
+def test_compare_cmd(baseline, tmp_path):
+    base_path = str(tmp_path / "baseline.json")
+    sfp.bench.save(baseline, base_path)
+    ok_path = str(tmp_path / "ok.json")
+    sfp.bench.save(results({"a": 1.1, "b": 1.4}), ok_path)
+    slow_path = str(tmp_path / "slow.json")
+    sfp.bench.save(results({"a": 1.5, "b": 1.4}), slow_path)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["bench", "compare", "-i", ok_path, base_path])
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 3
+    result = runner.invoke(cli, ["bench", "compare", "-i", slow_path, base_path])
+    assert result.exit_code == 1
+    assert "regression in a" in result.output
@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+
+def box(pop, x, y, x0, x1, y0, y1):
+    """poly table rows for a rectangle"""
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    return [{"pop": pop, x: cx, y: cy, "point_order": i + 1} for i, (cx, cy) in enumerate(corners)]
+
+
+gating = [
+    {"pop_order": 1, "pop": "beads", "method": "manual"},
+    {"pop_order": 2, "pop": "synecho", "method": "manual"},
+    {"pop_order": 3, "pop": "prochloro", "method": "manual"},
+]
+poly = (
+    box("beads", "fsc_small", "pe", 100, 1000, 300, 3000) +
+    box("synecho", "fsc_small", "pe", 0, 100, 5, 300) +
+    box("prochloro", "fsc_small", "chl_small", 0, 100, 0, 1e4)
+)
+
+
+@pytest.fixture()
+def mie():
+    scatter = np.logspace(-3, 2, 100)
+    return pd.DataFrame({
+        "scatter": scatter,
+        "diam_lwr": scatter**(1 / 3),
+        "Qc_lwr": scatter**0.5,
+        "diam_mid": 1.1 * scatter**(1 / 3),
+        "Qc_mid": 1.1 * scatter**0.5,
+        "diam_upr": 1.2 * scatter**(1 / 3),
+        "Qc_upr": 1.2 * scatter**0.5
+    })
+
+
+@pytest.fixture()
+def cruise(tmp_path):
+    c = sfp.synthetic.cruise(str(tmp_path), file_count=4, events=5000)
+    files_df = sfp.seaflowfile.date_evt_files(c["evt_files"], sfp.db.get_sfl_table(c["db"]))
+    c["opp_parquet_dir"] = str(tmp_path / "opp_parquet")
+    sfp.filterevt.filter_evt_files(files_df, c["db"], c["opp_parquet_dir"], every=100)
+    c["gating_id"] = sfp.db.save_gating_params(c["db"], gating, poly)
+    return c
+
+
+def test_points_in_polygon():
+    # Concave polygon, a square with a notch cut into the top
+    vertices = np.array([[0, 0], [4, 0], [4, 4], [3, 4], [2, 2], [1, 4], [0, 4]], dtype=float)
+    x = np.array([1, 2, 2, 3, 5, -1, 0.5, 2])
+    y = np.array([1, 1, 3, 3, 1, 1, 3.5, 3.9])
+    expected = [True, True, False, True, False, False, True, False]
+    assert sfp.classify.points_in_polygon(x, y, vertices).tolist() == expected
+
+
+def test_classify_df_order():
+    gates = [
+        {"pop": "a", "channels": ["fsc_small", "pe"], "vertices": np.array([[0, 0], [2, 0], [2, 2], [0, 2]], dtype=float)},
+        {"pop": "b", "channels": ["fsc_small", "pe"], "vertices": np.array([[1, 1], [3, 1], [3, 3], [1, 3]], dtype=float)},
+    ]
+    df = pd.DataFrame({"fsc_small": [0.5, 1.5, 2.5, 5.0], "pe": [0.5, 1.5, 2.5, 5.0]})
+    pops = sfp.classify.classify_df(df, gates)
+    # Overlapping particle goes to the first population
+    assert pops.tolist() == ["a", "a", "b", "unknown"]
+    assert pops.categories.tolist() == ["a", "b", "unknown"]
+
+
+def test_gating_params_round_trip(tmp_path):
+    dbpath = str(tmp_path / "test.db")
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        sfp.db.get_gating_params(dbpath)
+    old_id = sfp.db.save_gating_params(dbpath, gating[:1], poly[:4])
+    gating_id = sfp.db.save_gating_params(dbpath, gating, poly)
+    gating_df, poly_df = sfp.db.get_gating_params(dbpath, gating_id)
+    assert gating_df["pop"].tolist() == ["beads", "synecho", "prochloro"]
+    assert len(poly_df) == 12
+    gates = sfp.classify.get_gates(gating_df, poly_df)
+    assert [g["channels"] for g in gates] == [["fsc_small", "pe"], ["fsc_small", "pe"], ["fsc_small", "chl_small"]]
+    gating_df, _ = sfp.db.get_gating_params(dbpath, old_id)
+    assert gating_df["pop"].tolist() == ["beads"]
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        sfp.db.get_gating_params(dbpath, "not_an_id")
+
+
+def test_get_gates_unsupported_method():
+    gating_df = pd.DataFrame([dict(gating[0], method="auto")])
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        sfp.classify.get_gates(gating_df, pd.DataFrame(poly))
+
+
+def test_size_carbon(mie):
+    sizes = sfp.classify.size_carbon(np.array([0.5, 1.0, 1e6]), 1.0, mie)
+    assert list(sizes.columns) == sfp.fileio.MIE_COLUMNS[1:]
+    assert sizes["diam_lwr"].tolist() == pytest.approx([0.5**(1 / 3), 1.0, 100**(1 / 3)], rel=1e-3)
+
+
+def test_bead_scatter():
+    filter_df = pd.DataFrame({
+        "id": ["a", "a", "b"],
+        "quantile": [2.5, 50.0, 50.0],
+        "beads_fsc_small": [0, 2**15, 2**16]
+    })
+    beads_fsc = sfp.classify.bead_scatter(filter_df)
+    assert beads_fsc == pytest.approx({("a", 2.5): 1.0, ("a", 50.0): 10**1.75, ("b", 50.0): 10**3.5})
+    linear = sfp.particleops.linearize_particles(filter_df, ["beads_fsc_small"])
+    assert list(beads_fsc.values()) == linear["beads_fsc_small"].tolist()
+
+
+def test_vct_stats():
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({c: rng.lognormal(size=n) for c in ["chl_small", "pe", "fsc_small"]})
+    for i, c in enumerate(["lwr", "mid", "upr"]):
+        df["diam_" + c] = (1 + i) * df["fsc_small"]**(1 / 3)  # sorted with fsc
+        df["Qc_" + c] = rng.lognormal(size=n)  # not sorted with fsc
+    df["file_id"] = pd.Categorical(rng.choice(["2014_185/b", "2014_185/a"], n))
+    df["pop"] = pd.Categorical(rng.choice(["synecho", "beads"], n), categories=["synecho", "beads", "unknown"])
+    df["quantile"] = rng.choice([2.5, 50.0, 97.5], n)
+    df.loc[0, "pop"] = "unknown"  # single particle group
+    df["filter_id"] = "filter"
+    stats = sfp.classify.vct_stats(df, "gating")
+    assert list(stats.columns) == sfp.db.vct_field_order
+    assert len(stats) == len(df.groupby(["file_id", "pop", "quantile"], observed=True))
+    assert stats["count"].sum() == n
+    # Sorted by file, then population category order, then quantile
+    assert stats["file"].is_monotonic_increasing
+    assert stats[["file", "pop", "quantile"]].iloc[:3].values.tolist() == [
+        ["2014_185/a", "synecho", 2.5], ["2014_185/a", "synecho", 50.0], ["2014_185/a", "synecho", 97.5]
+    ]
+    for row in stats.itertuples():
+        group = df[(df["file_id"] == row.file) & (df["pop"] == row.pop) & (df["quantile"] == row.quantile)]
+        assert row.count == len(group)
+        for name, col in sfp.classify.stat_columns.items():
+            q = np.quantile(group[col], [0.25, 0.5, 0.75])
+            assert [getattr(row, name + s) for s in ["_1q", "_med", "_3q"]] == pytest.approx(q)
+        assert row.Qc_mid_mean == pytest.approx(group["Qc_mid"].mean())
+    assert (stats["gating_id"] == "gating").all()
+    assert (stats["filter_id"] == "filter").all()
+
+    no_filter = sfp.classify.vct_stats(df.drop(columns="filter_id"), "gating", filter_id="filter")
+    pd.testing.assert_frame_equal(no_filter, stats)
+    with pytest.raises(ValueError):
+        sfp.classify.vct_stats(df.drop(columns="filter_id"), "gating")
+    assert len(sfp.classify.vct_stats(df.iloc[:0], "gating")) == 0
+
+
+def test_classify_opp_files(cruise, mie, tmp_path):
+    vct_dir = str(tmp_path / "vct")
+    opp_files = sfp.classify.find_opp_parquet_files(cruise["opp_parquet_dir"])
+    summary = sfp.classify.classify_opp_files(opp_files, cruise["db"], mie, vct_dir=vct_dir, process_count=2)
+    assert summary["gating_id"] == cruise["gating_id"]
+    assert summary["files"] == 4
+
+    vct = sfp.db.get_vct_table(cruise["db"])
+    opp = sfp.db.get_opp_table(cruise["db"])
+    # Population counts add up to OPP counts for each file and quantile
+    counts = vct.groupby(["file", "quantile"])["count"].sum()
+    for row in opp.itertuples():
+        assert counts[(row.file, row.quantile)] == row.opp_count
+    assert set(vct["pop"]) == {"beads", "synecho", "prochloro"}
+    assert (vct["gating_id"] == cruise["gating_id"]).all()
+
+    # VCT files line up with OPP particles
+    opp_df = pd.read_parquet(opp_files[0])
+    file_id = opp_df["file_id"].iloc[0]
+    opp50 = opp_df[(opp_df["file_id"] == file_id) & opp_df["q50"]]
+    vct_df = sfp.fileio.read_vct_csv(os.path.join(vct_dir, "50", file_id + ".vct.gz"))
+    merged = sfp.particleops.merge_opp_vct(opp50, vct_df)
+    row = vct[(vct["file"] == file_id) & (vct["pop"] == "beads") & (vct["quantile"] == 50)].iloc[0]
+    beads = merged[merged["pop"] == "beads"]
+    assert row["count"] == len(beads)
+    assert row["fsc_med"] == pytest.approx(beads["fsc_small"].median())
+    assert row["Qc_mid_mean"] == pytest.approx(beads["Qc_mid"].mean())
+
+
+def test_classify_vct_parquet(cruise, mie, tmp_path):
+    opp_files = sfp.classify.find_opp_parquet_files(cruise["opp_parquet_dir"])
+    csv_dir, parquet_dir = str(tmp_path / "vct_csv"), str(tmp_path / "vct_parquet")
+    sfp.classify.classify_opp_files(opp_files, cruise["db"], mie, vct_dir=csv_dir)
+    sfp.classify.classify_opp_files(opp_files, cruise["db"], mie, vct_dir=parquet_dir, vct_format="parquet")
+    assert sorted(os.listdir(parquet_dir)) == [
+        os.path.basename(p).replace(".opp.parquet", ".vct.parquet") for p in opp_files
+    ]
+
+    # Same particles as VCT CSV files converted to parquet
+    converted_dir = str(tmp_path / "vct_converted")
+    sfp.fileio.convert_vct_csv_tree(csv_dir, converted_dir)
+    sort_cols = ["file_id", "quantile", "diam_mid", "Qc_lwr"]
+    parquet_df = sfp.fileio.read_vct_parquet(parquet_dir)
+    converted_df = sfp.fileio.read_vct_parquet(converted_dir)
+    assert parquet_df["pop"].cat.categories.tolist() == ["beads", "synecho", "prochloro", "unknown"]
+    parquet_df = parquet_df.astype({"file_id": str, "pop": str}).sort_values(sort_cols).reset_index(drop=True)
+    converted_df = converted_df.astype({"file_id": str, "pop": str}).sort_values(sort_cols).reset_index(drop=True)
+    pd.testing.assert_frame_equal(parquet_df, converted_df)
+
+    with pytest.raises(ValueError):
+        sfp.classify.classify_opp_files(opp_files, cruise["db"], mie, vct_dir=parquet_dir, vct_format="txt")
+
+
+def test_classify_cmd(cruise, mie, tmp_path):
+    mie_path = str(tmp_path / "mie.csv")
+    mie.to_csv(mie_path, index=False)
+    result = CliRunner().invoke(cli, [
+        "classify", "-d", cruise["db"], "-o", cruise["opp_parquet_dir"], "-m", mie_path
+    ])
+    assert result.exit_code == 0
+    assert '"files": 4' in result.output
+    assert len(sfp.db.get_vct_table(cruise["db"])) > 0
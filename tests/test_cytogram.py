@@ -0,0 +1,71 @@
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture()
+def evt_df():
+    df = sfp.synthetic.evt(20000, seed=1)
+    return sfp.particleops.mark_focused(df, sfp.synthetic.filter_params.assign(id="synthetic"))
+
+
+def test_file_histograms(evt_df):
+    layers, counts = sfp.cytogram.file_histograms(evt_df, bins=64)
+    assert layers == ["evt", "q2.5", "q50", "q97.5"]
+    assert counts.shape == (4, 3, 64, 64)
+    assert counts.dtype == np.uint32
+    edges = np.linspace(0, 2**16, 65)
+    for p, (x, y) in enumerate(sfp.cytogram.pairs):
+        expected, _, _ = np.histogram2d(evt_df[x], evt_df[y], bins=[edges, edges])
+        npt.assert_array_equal(counts[0, p], expected)
+        q50 = evt_df[evt_df["q50"]]
+        expected, _, _ = np.histogram2d(q50[x], q50[y], bins=[edges, edges])
+        npt.assert_array_equal(counts[2, p], expected)
+
+
+def test_write_window_mismatch(evt_df, tmp_path):
+    layers, counts = sfp.cytogram.file_histograms(evt_df, bins=8)
+    date = pd.Timestamp("2014-07-04")
+    hists = [
+        {"file_id": "a", "date": date, "layers": layers, "counts": counts},
+        {"file_id": "b", "date": date, "layers": layers[:2], "counts": counts[:2]}
+    ]
+    with pytest.raises(ValueError):
+        sfp.cytogram.write_window(hists, date, "1H", str(tmp_path))
+
+
+def test_filter_cytograms(tmp_path):
+    cruise = sfp.synthetic.cruise(str(tmp_path / "cruise"), file_count=25, events=5000, opp=False)
+    files_df = sfp.seaflowfile.date_evt_files(cruise["evt_files"], sfp.db.get_sfl_table(cruise["db"]))
+    cytogram_dir = str(tmp_path / "cytogram")
+    sfp.filterevt.filter_evt_files(
+        files_df, cruise["db"], str(tmp_path / "opp"), every=100.0, cytogram_dir=cytogram_dir
+    )
+    # 25 files 3 minutes apart span two hourly windows
+    paths = sfp.cytogram.find_window_files(cytogram_dir)
+    assert len(paths) == 2
+
+    h = sfp.cytogram.read_window(paths[0])
+    assert h["pairs"] == sfp.cytogram.pairs
+    assert h["layers"] == ["evt", "q2.5", "q50", "q97.5"]
+    assert h["counts"].shape == (20, 4, 3, 256, 256)
+    assert h["file_ids"] == files_df["file_id"].tolist()[:20]
+
+    opp = sfp.db.get_opp_table(cruise["db"])
+    opp50 = opp[opp["quantile"] == 50].set_index("file")
+    total = sfp.cytogram.sum_histograms(cytogram_dir)
+    assert total["files"] == 25
+    assert total["counts"][0, 0].sum() == 25 * 5000
+    assert total["counts"][2, 0].sum() == opp50["opp_count"].sum()
+
+    # Time range across both windows
+    start, end = files_df["date"].iloc[18], files_df["date"].iloc[21]
+    part = sfp.cytogram.sum_histograms(cytogram_dir, start=start, end=end)
+    assert part["files"] == 4
+    assert part["counts"][2, 0].sum() == opp50.loc[files_df["file_id"].iloc[18:22], "opp_count"].sum()
+    with pytest.raises(ValueError):
+        sfp.cytogram.sum_histograms(cytogram_dir, start="2020-01-01")
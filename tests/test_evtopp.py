@@ -144,6 +144,52 @@ class TestVCT:
             [1.802998, 0.707794, 1.012014, 2.229999]
         )
 
+    def test_vct_parquet_round_trip(self, tmpdir):
+        vct = sfp.fileio.read_vct_csv("tests/testcruise_vct/50/2014_185/2014-07-04T00-00-02+00-00.vct.gz")
+        vct["date"] = pd.Timestamp("2014-07-04T00:00:02Z")
+        vct["file_id"] = "2014_185/2014-07-04T00-00-02+00-00"
+        vct["quantile"] = 50.0
+        vct2 = vct.copy()
+        vct2["quantile"] = 2.5
+        path = str(tmpdir.join("vct", "2014-07-04T00-00-00+00-00.1H.vct.parquet"))
+        sfp.fileio.write_vct_parquet(pd.concat([vct, vct2], ignore_index=True), path)
+
+        df = sfp.fileio.read_vct_parquet(path)
+        assert list(df.columns) == sfp.fileio.VCT_PARQUET_COLUMNS
+        assert len(df) == 2 * len(vct)
+        assert df["pop"].dtype.name == "category"
+        assert df["file_id"].dtype.name == "category"
+        assert (df[sfp.fileio.VCT_COLUMNS[:-1]].dtypes == np.float32).all()
+        npt.assert_array_equal(df["diam_mid"].values[:len(vct)], vct["diam_mid"].values.astype(np.float32))
+
+        # Filter while reading and on categorical columns
+        df = sfp.fileio.read_vct_parquet(
+            str(tmpdir.join("vct")),
+            columns=["diam_mid"],
+            filters=[("quantile", "==", 50), ("pop", "in", ["synecho", "beads"])]
+        )
+        assert list(df.columns) == ["diam_mid"]
+        expected = vct.loc[vct["pop"].isin(["synecho", "beads"]), "diam_mid"]
+        npt.assert_array_equal(df["diam_mid"].values, expected.values.astype(np.float32))
+        df = sfp.fileio.read_vct_parquet(path, filters=[("file_id", "!=", "2014_185/2014-07-04T00-00-02+00-00")])
+        assert len(df) == 0
+        with pytest.raises(ValueError):
+            sfp.fileio.read_vct_parquet(path, filters=[("pop", "<", "beads")])
+
+    def test_convert_vct_csv_tree(self, tmpdir):
+        outdir = str(tmpdir.join("vct_parquet"))
+        results = sfp.fileio.convert_vct_csv_tree("tests/testcruise_vct", outdir)
+        assert results["path"].tolist() == [os.path.join(outdir, "2014-07-04T00-00-00+00-00.1H.vct.parquet")]
+        vct = sfp.fileio.read_vct_csv("tests/testcruise_vct/50/2014_185/2014-07-04T00-00-02+00-00.vct.gz")
+        assert results["files"].tolist() == [1]
+        assert results["particles"].tolist() == [len(vct)]
+        df = sfp.fileio.read_vct_parquet(outdir)
+        assert (df["file_id"] == "2014_185/2014-07-04T00-00-02+00-00").all()
+        assert (df["quantile"] == 50).all()
+        assert (df["date"] == pd.Timestamp("2014-07-04T00:00:02")).all()
+        assert df["pop"].tolist() == vct["pop"].tolist()
+        npt.assert_array_equal(df["Qc_upr"].values, vct["Qc_upr"].values.astype(np.float32))
+
 class TestFilter:
     def test_mark_focused_no_params(self, evt_df):
         with pytest.raises(ValueError):
@@ -1,3 +1,5 @@
+import numpy as np
+import pandas as pd
 import pytest
 import seaflowpy as sfp
 
@@ -111,3 +113,37 @@ class TestGGA:
         ]
         for (i, lon) in enumerate(gga_lons):
             assert sfp.geo.is_gga_lon(lon) == answers[i]
+
+
+class TestGGAMany:
+    def test_gga2dd_many(self):
+        gga_lats = ["1536.43", "-0058", None, "9220.43", "NA"]
+        dd, bad = sfp.geo.ggalat2dd_many(gga_lats)
+        assert ["{:.4f}".format(x) for x in dd[:2]] == ["15.6072", "-0.9667"]
+        assert dd[2:].isna().all()
+        assert bad.tolist() == [False, False, False, True, True]
+
+        gga_lons = pd.Series(["15816.43", "-01536", np.nan, "19020.43", "1111"], index=[5, 6, 7, 8, 9])
+        dd, bad = sfp.geo.ggalon2dd_many(gga_lons)
+        assert dd.index.tolist() == [5, 6, 7, 8, 9]
+        assert ["{:.4f}".format(x) for x in dd.iloc[:2]] == ["158.2738", "-15.6000"]
+        assert dd.iloc[2:].isna().all()
+        assert bad.tolist() == [False, False, False, True, True]
+
+    def test_gga2dd_many_matches_scalar(self):
+        lats = ["1536.43", "-1536.43", "0158.43", "0058", "-0058", "9000", "5870.43", "111.45", ""]
+        dd, bad = sfp.geo.ggalat2dd_many(lats)
+        for lat, x, b in zip(lats, dd, bad):
+            try:
+                expected = sfp.geo.ggalat2dd(lat)
+            except ValueError:
+                assert b
+            else:
+                assert not b
+                assert "{:.4f}".format(x) == expected
+
+    def test_is_gga_many(self):
+        lats = ["1536.43", "-1536.43", "90.50", np.nan]
+        assert sfp.geo.is_gga_lat_many(lats).tolist() == [True, True, False, False]
+        lons = ["15816.43", "-15816.43", "23.57", None]
+        assert sfp.geo.is_gga_lon_many(lons).tolist() == [True, True, False, False]
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+heavy_modules = ["hdbscan", "matplotlib", "boto3", "botocore", "fabric"]
+
+
+def loaded_modules(code):
+    """Run code in a fresh interpreter and return the set of loaded modules"""
+    code += "\nimport sys\nprint('\\n'.join(sys.modules))"
+    out = subprocess.check_output([sys.executable, "-c", code], universal_newlines=True)
+    return set(out.splitlines())
+
+
+@pytest.mark.parametrize("code", [
+    "import seaflowpy",
+    "import seaflowpy.sfl, seaflowpy.fileio, seaflowpy.filterevt",
+    "from seaflowpy.cli.cli import cli",
+    "from seaflowpy.cli.commands import bench_cmd, classify_cmd, evt_cmd, filter_cmd, psd_cmd, serve_cmd, sfl_cmd, vct_cmd, version_cmd",
+])
+def test_import_skips_heavy_modules(code):
+    modules = loaded_modules(code)
+    assert [m for m in heavy_modules if m in modules] == []
+
+
+def test_cli_import_skips_command_modules():
+    modules = loaded_modules("from seaflowpy.cli.cli import cli")
+    assert [m for m in modules if m.startswith("seaflowpy.cli.commands.")] == []
+
+
+def test_lazy_submodule_attributes():
+    for name in ["beads", "bench", "classify", "clouds", "conf", "cytogram", "db", "errors", "fileio", "filterevt",
+                 "geo", "particleops", "psd", "sample", "seaflowfile", "service",
+                 "service_client", "sfl", "sketch", "synthetic", "time", "util"]:
+        assert getattr(sfp, name).__name__ == "seaflowpy." + name
+        assert name in dir(sfp)
+    assert isinstance(sfp.__version__, str)
+    with pytest.raises(AttributeError):
+        sfp.not_a_submodule  # pylint: disable=pointless-statement
+
+
+def test_cli_lists_all_commands():
+    result = CliRunner().invoke(cli, ["--help"])
+    assert result.exit_code == 0
+    for name in ["bench", "classify", "dayofyear", "db", "evt", "filter", "psd", "sds2sfl", "serve", "sfl", "vct", "version"]:
+        assert f"\n  {name} " in result.output
+
+
+def test_cli_version():
+    result = CliRunner().invoke(cli, ["version"])
+    assert result.exit_code == 0
+    assert result.output == sfp.__version__ + "\n"
@@ -0,0 +1,149 @@
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+pops = ["beads", "synecho", "prochloro", "unknown"]
+
+
+@pytest.fixture()
+def vct_dir(tmp_path):
+    """Two hourly VCT parquet windows with two files each"""
+    rng = np.random.default_rng(0)
+    outdir = str(tmp_path / "vct")
+    for hour in range(2):
+        window_start = pd.Timestamp("2014-07-04") + pd.Timedelta(hours=hour)
+        dfs = []
+        for i, minutes in enumerate([3, 33]):
+            n = 2000
+            diam = rng.lognormal(0, 1, n)
+            dfs.append(pd.DataFrame({
+                "date": window_start + pd.Timedelta(minutes=minutes),
+                "file_id": f"2014_185/{hour}-{i}",
+                "quantile": rng.choice([2.5, 50.0], n),
+                "diam_lwr": diam * 0.9,
+                "Qc_lwr": diam**3 * 0.1,
+                "diam_mid": diam,
+                "Qc_mid": diam**3 * 0.2,
+                "diam_upr": diam * 1.1,
+                "Qc_upr": diam**3 * 0.3,
+                # No beads in these files
+                "pop": pd.Categorical(rng.choice(pops[1:], n), categories=pops)
+            }))
+        path = sfp.fileio.window_parquet_path(outdir, window_start, "1H", "vct")
+        sfp.fileio.write_vct_parquet(pd.concat(dfs, ignore_index=True), path)
+    return outdir
+
+
+def test_log_bins():
+    edges = sfp.psd.log_bins("diam_mid", 4, start=0.1, stop=1000)
+    npt.assert_allclose(edges, [0.1, 1, 10, 100, 1000])
+    assert len(sfp.psd.log_bins("Qc_upr")) == 65
+    with pytest.raises(ValueError):
+        sfp.psd.log_bins("fsc_small")
+    with pytest.raises(ValueError):
+        sfp.psd.log_bins("diam_mid", start=1, stop=0.5)
+
+
+@pytest.mark.parametrize("process_count", [1, 2])
+def test_psd(vct_dir, process_count):
+    files = sfp.psd.find_vct_parquet_files(vct_dir)
+    assert len(files) == 2
+    edges = sfp.psd.log_bins("diam_mid", 20, start=0.1, stop=10)
+    result = sfp.psd.psd(files, edges, process_count=process_count)
+    assert result["counts"].shape == (4, 2, 4, 20)
+    assert result["pops"] == pops
+    npt.assert_array_equal(result["quantiles"], [2.5, 50.0])
+
+    vct = sfp.fileio.read_vct_parquet(vct_dir)
+    for t, date in enumerate(result["dates"]):
+        for q, quantile in enumerate(result["quantiles"]):
+            for p, pop in enumerate(pops):
+                df = vct[(vct["date"] == date) & (vct["quantile"] == quantile) & (vct["pop"] == pop)]
+                counts, _ = np.histogram(df["diam_mid"], bins=edges)
+                biomass, _ = np.histogram(df["diam_mid"], bins=edges, weights=df["Qc_mid"].astype(np.float64))
+                npt.assert_array_equal(result["counts"][t, q, p], counts)
+                npt.assert_allclose(result["biomass"][t, q, p], biomass)
+    in_range = (vct["diam_mid"] >= edges[0]) & (vct["diam_mid"] <= edges[-1])
+    assert result["out_of_range"] == (~in_range).sum()
+    assert result["counts"].sum() == in_range.sum()
+
+
+def test_psd_freq_and_quantiles(vct_dir):
+    files = sfp.psd.find_vct_parquet_files(vct_dir)
+    edges = sfp.psd.log_bins("Qc_mid", 10)
+    by_file = sfp.psd.psd(files, edges, column="Qc_mid", quantiles=[50])
+    by_day = sfp.psd.psd(files, edges, column="Qc_mid", quantiles=[50], freq="1D")
+    npt.assert_array_equal(by_file["quantiles"], [50.0])
+    assert len(by_day["dates"]) == 1
+    npt.assert_array_equal(by_day["counts"][0], by_file["counts"].sum(axis=0))
+    npt.assert_allclose(by_day["biomass"][0], by_file["biomass"].sum(axis=0))
+
+
+def test_merge_different_bins(vct_dir):
+    files = sfp.psd.find_vct_parquet_files(vct_dir)
+    a = sfp.psd.bin_window(files[0], sfp.psd.log_bins("diam_mid", 10))
+    b = sfp.psd.bin_window(files[1], sfp.psd.log_bins("diam_mid", 20))
+    with pytest.raises(ValueError):
+        sfp.psd.merge([a, b])
+
+
+def test_merge_unordered(vct_dir):
+    files = sfp.psd.find_vct_parquet_files(vct_dir)
+    edges = sfp.psd.log_bins("diam_mid", 16)
+    expected = sfp.psd.psd(files, edges)
+    # Later time first, a quantile and population not in the first part, and
+    # more times than first expected
+    parts = [
+        sfp.psd.bin_window(files[1], edges, quantiles=[50]),
+        sfp.psd.bin_window(files[0], edges, freq="1H")
+    ]
+    parts[0]["pops"] = parts[0]["pops"][1:] + parts[0]["pops"][:1]
+    parts[0]["counts"] = np.roll(parts[0]["counts"], -1, axis=2)
+    parts[0]["biomass"] = np.roll(parts[0]["biomass"], -1, axis=2)
+    parts.append(sfp.psd.bin_window(files[1], edges, quantiles=[2.5]))
+    parts.append(sfp.psd.bin_window(files[0], edges, freq="1H"))
+    parts[-1]["counts"] = parts[-1]["counts"] * 0
+    parts[-1]["biomass"] = parts[-1]["biomass"] * 0
+    result = sfp.psd.merge(parts)
+
+    assert result["pops"] == parts[0]["pops"]
+    order = [result["pops"].index(pop) for pop in pops]
+    npt.assert_array_equal(result["quantiles"], [2.5, 50.0])
+    # files[0] counts are all in the first hour
+    npt.assert_array_equal(result["dates"][0], np.datetime64("2014-07-04T00:00:00"))
+    npt.assert_array_equal(result["dates"][1:], expected["dates"][2:])
+    npt.assert_array_equal(result["counts"][0][:, order], expected["counts"][:2].sum(axis=0))
+    npt.assert_array_equal(result["counts"][1:][:, :, order], expected["counts"][2:])
+    npt.assert_allclose(result["biomass"][1:][:, :, order], expected["biomass"][2:])
+    assert result["out_of_range"] == sum(p["out_of_range"] for p in parts)
+
+
+@pytest.mark.parametrize("ext", [".npz", ".parquet"])
+def test_save_load(vct_dir, tmp_path, ext):
+    files = sfp.psd.find_vct_parquet_files(vct_dir)
+    result = sfp.psd.psd(files, sfp.psd.log_bins("diam_mid", 16))
+    path = str(tmp_path / ("psd" + ext))
+    sfp.psd.save(result, path)
+    loaded = sfp.psd.load(path)
+    for key in ["dates", "quantiles", "edges", "counts", "biomass"]:
+        npt.assert_array_equal(loaded[key], result[key])
+    assert loaded["pops"] == result["pops"]
+    assert loaded["column"] == "diam_mid"
+    assert loaded["counts"].dtype == np.uint32
+
+
+def test_psd_cmd(vct_dir, tmp_path):
+    outfile = str(tmp_path / "psd.parquet")
+    result = CliRunner().invoke(cli, ["psd", "-b", "8", "-q", "50", "-f", "1H", vct_dir, outfile])
+    assert result.exit_code == 0
+    loaded = sfp.psd.load(outfile)
+    assert loaded["counts"].shape == (2, 1, 4, 8)
+    df = pd.read_parquet(outfile)
+    assert list(df.columns) == sfp.psd.parquet_columns
+    assert (df["count"] > 0).all()
@@ -0,0 +1,103 @@
+import pytest
+from click.testing import CliRunner
+from seaflowpy import errors
+from seaflowpy.cli.cli import cli
+from seaflowpy.cli.commands import sds2sfl_cmd
+
+# pylint: disable=redefined-outer-name
+
+
+# SDS files with day/file/time columns
+time_sds = """cruise\tfile\tday\ttime\tlat\tlon\tLAT\tLON\tCONDUCTIVITY\tSALINITY\tOCEAN.TEMP\tPAR\tBULK.RED\tSTREAM.PRESSURE\tEVENT.RATE
+tokyo_3\t2014-07-04T00-00-02+00-00\t2014_185\t2014-07-04 00:00:02\t21.3\t-158.1\t21.3\t-158.1\t5.2\t35.1\t25.9\t1500.5\t12.0\t12.5\t9100
+tokyo_3\t2014-07-04T00-03-02+00-00\t2014_185\t2014-07-04 00:03:02\t21.4\t-158.2\t21.4\t-158.2\t5.3\t35.2\t26.0\t1501.5\t12.1\t12.6\t9200
+"""
+
+# Legacy SDS files with sds_ file names and computerUTC dates, and without
+# some SFL columns
+computerutc_sds = """FILE\tcomputerUTC\tLAT\tLON\tOCEAN.TEMP\tSALINITY\tPAR\tEVENT.RATE
+sds_2009_001_42\t09001000002\t47.6\t-122.3\t10.1\t30.5\t0\t8000
+sds_2012_060_7\t12060235959\t47.7\t-122.4\t10.2\t30.6\t2.5\t8100
+"""
+
+
+@pytest.fixture()
+def sds_files(tmp_path):
+    paths = {}
+    for name, text in [("time", time_sds), ("computerUTC", computerutc_sds)]:
+        paths[name] = tmp_path / "{}.sds".format(name)
+        paths[name].write_text(text)
+    return paths
+
+
+def test_read_sds(sds_files):
+    df = sds2sfl_cmd.read_sds(str(sds_files["time"]))
+    assert len(df) == 2
+    assert "OCEAN TEMP" in df.columns
+    assert df.loc[0, "EVENT RATE"] == "9100"
+    assert (df.dtypes == object).all()
+
+
+def test_sds2sfl_time(sds_files):
+    df, missing = sds2sfl_cmd.sds2sfl(sds2sfl_cmd.read_sds(str(sds_files["time"])))
+    assert missing == []
+    assert df["file"].tolist() == [
+        "2014_185/2014-07-04T00-00-02+00-00.evt",
+        "2014_185/2014-07-04T00-03-02+00-00.evt"
+    ]
+    assert df["date"].tolist() == ["2014-07-04T00:00:02+00:00", "2014-07-04T00:03:02+00:00"]
+    assert (df["file_duration"] == "180").all()
+    assert df["ocean_tmp"].tolist() == ["25.9", "26.0"]
+
+
+def test_sds2sfl_computerutc(sds_files):
+    df, missing = sds2sfl_cmd.sds2sfl(sds2sfl_cmd.read_sds(str(sds_files["computerUTC"])))
+    assert missing == ["CONDUCTIVITY", "BULK RED", "STREAM PRESSURE"]
+    assert df["file"].tolist() == ["2009_001/42.evt", "2012_060/7.evt"]
+    # Day of year 60 is February 29 in a leap year
+    assert df["date"].tolist() == ["2009-01-01T00:00:02+00:00", "2012-02-29T23:59:59+00:00"]
+    assert df["conductivity"].isna().all()
+
+
+def test_sds2sfl_cmd(sds_files, tmp_path):
+    header = "\t".join(sds2sfl_cmd.FILE_COLUMNS)
+    expected = {
+        "time": [
+            header,
+            "2014_185/2014-07-04T00-00-02+00-00.evt\t2014-07-04T00:00:02+00:00\t180\t21.3\t-158.1\t5.2\t35.1\t25.9\t1500.5\t12.0\t12.5\t9100",
+            "2014_185/2014-07-04T00-03-02+00-00.evt\t2014-07-04T00:03:02+00:00\t180\t21.4\t-158.2\t5.3\t35.2\t26.0\t1501.5\t12.1\t12.6\t9200",
+        ],
+        "computerUTC": [
+            header,
+            "2009_001/42.evt\t2009-01-01T00:00:02+00:00\t180\t47.6\t-122.3\tNA\t30.5\t10.1\t0\tNA\tNA\t8000",
+            "2012_060/7.evt\t2012-02-29T23:59:59+00:00\t180\t47.7\t-122.4\tNA\t30.6\t10.2\t2.5\tNA\tNA\t8100",
+        ]
+    }
+    runner = CliRunner()
+    for name, path in sds_files.items():
+        out = tmp_path / "{}.sfl".format(name)
+        result = runner.invoke(cli, ["sds2sfl", str(path), str(out)])
+        assert result.exit_code == 0, result.output
+        assert out.read_text().splitlines() == expected[name]
+    assert "Some fields were missing from input file: 'CONDUCTIVITY' 'BULK RED' 'STREAM PRESSURE'" in result.output
+
+
+@pytest.mark.parametrize("column,value,message", [
+    ("FILE", "2009_001_42", "Could not create file name from line"),
+    ("computerUTC", "0900100000", "could not create date from line"),
+    ("computerUTC", "", "could not create date from line"),
+])
+def test_sds2sfl_bad_line(sds_files, tmp_path, column, value, message):
+    df = sds2sfl_cmd.read_sds(str(sds_files["computerUTC"]))
+    df.loc[1, column] = value
+    with pytest.raises(errors.FileError) as excinfo:
+        sds2sfl_cmd.sds2sfl(df)
+    assert str(excinfo.value).startswith(message)
+    # The bad line is reported
+    assert str(excinfo.value).splitlines()[1] == "\t".join(df.loc[1])
+
+    path = tmp_path / "bad.sds"
+    df.to_csv(path, sep="\t", index=False)
+    result = CliRunner().invoke(cli, ["sds2sfl", str(path), str(tmp_path / "bad.sfl")])
+    assert result.exit_code != 0
+    assert message in result.output
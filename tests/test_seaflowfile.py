@@ -426,6 +426,94 @@ def test_keep_evt_files():
     parsed = sfp.seaflowfile.keep_evt_files(files)
     assert parsed == (files[:2] + files[3:])
 
+def test_parse_many():
+    files = [
+        "2014-07-04T00-00-02+00-00",
+        "2014_185/2014-07-04T00-00-02+00-00",
+        "foo/2014_001/2014-07-04T00-00-02-07-00.gz",
+        "foo/bar/2014-07-04T00-00-02+00-00.opp.gz",
+        "42.evt",
+        "testcruise/2014_185/100.evt.gz",
+        "testcruise/2014_185/200.evt.opp",
+        "foobar",
+        "2014-07-32T00-00-02+00-00",
+        "2014_185/42.evtx"
+    ]
+    df = sfp.seaflowfile.parse_many(pd.Series(files, index=range(10, 20)))
+    assert df.index.tolist() == list(range(10, 20))
+    assert df["valid"].tolist() == [True] * 7 + [False] * 3
+    for i, f in zip(df.index[:7], files[:7]):
+        s = sfp.seaflowfile.SeaFlowFile(f)
+        row = df.loc[i]
+        assert row["path"] == s.path
+        assert row["file"] == s.filename
+        assert row["file_id"] == s.file_id
+        assert row["path_file_id"] == s.path_file_id
+        assert row["dayofyear"] == s.dayofyear
+        assert row["path_dayofyear"] == s.path_dayofyear
+        assert row["rfc3339"] == s.rfc3339
+        assert row["style"] == ("new" if s.is_new_style else "old")
+        assert row["type"] == ("evt" if s.is_evt else "opp")
+        if s.date is None:
+            assert pd.isna(row["date"])
+        else:
+            assert row["date"] == s.date
+    for col in ["file_id", "style", "type"]:
+        assert df.loc[17:, col].isna().all()
+
+
+def test_parse_many_sort():
+    unsorted_files = [
+        "2014_186/100.evt",
+        "2014_185/10.evt",
+        "9.evt",
+        "2014_185/1.evt",
+        "2015_186/1.evt",
+        "2014_350/2014-12-08T22-51-34+00-00",
+        "2014-12-08T22-56-34+00-00",
+        "2014_342/2014-12-08T22-53-34+00-00"
+    ]
+    df = sfp.seaflowfile.sort_parsed(sfp.seaflowfile.parse_many(unsorted_files))
+    assert df["path"].tolist() == sorted(
+        unsorted_files, key=lambda f: sfp.seaflowfile.SeaFlowFile(f).sort_key
+    )
+
+
+def test_parse_many_empty():
+    df = sfp.seaflowfile.parse_many([])
+    assert len(df) == 0
+    assert "file_id" in df.columns
+
+
+def test_sorted_files_invalid():
+    with pytest.raises(sfp.errors.FileError):
+        _ = sfp.seaflowfile.sorted_files(["2014_185/1.evt", "foobar"])
+
+def test_parse_cached():
+    sfp.seaflowfile.parse.cache_clear()
+    path = "foo/2014_185/2014-07-04T00-00-02+00-00.gz"
+    f = sfp.seaflowfile.parse(path)
+    s = sfp.seaflowfile.SeaFlowFile(path)
+    for attr in sfp.seaflowfile.ParsedFile.__slots__:
+        assert getattr(f, attr) == getattr(s, attr)
+    assert sfp.seaflowfile.parse(path) is f
+    info = sfp.seaflowfile.parse.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+    assert info.maxsize == sfp.seaflowfile.parse_cache_size
+
+
+def test_parse_immutable():
+    f = sfp.seaflowfile.parse("2014_185/2014-07-04T00-00-02+00-00")
+    with pytest.raises(AttributeError):
+        f.file_id = "foo"
+    with pytest.raises(AttributeError):
+        f.foo = "bar"
+
+
+def test_parse_invalid():
+    with pytest.raises(sfp.errors.FileError):
+        _ = sfp.seaflowfile.parse("foobar")
+
 def test_find_evt_files():
     files = sfp.seaflowfile.find_evt_files("tests/testcruise_evt")
     answer = [
@@ -441,6 +529,37 @@ def test_find_evt_files():
     ]
     assert files == answer
 
+def test_scan_evt_files():
+    files = sfp.seaflowfile.scan_evt_files("tests/testcruise_evt")
+    assert files["path"].tolist() == sfp.seaflowfile.find_evt_files("tests/testcruise_evt")
+    assert files["valid"].all()
+    day_files = sfp.seaflowfile.scan_evt_files("tests/testcruise_evt/2014_185")
+    assert day_files["file_id"].tolist() == files["file_id"].tolist()
+
+def test_scan_evt_files_tree(tmp_path):
+    paths = [
+        "2014_186/2014-07-05T00-00-02+00-00.gz",
+        "2014_185/2014-07-04T00-03-02+00-00",
+        "2014_185/2014-07-04T00-00-02+00-00",
+        "2014_185/2014-07-04T00-00-02+00-00.opp.gz",
+        "2014_185/README.md",
+        "other/2014_185/2014-07-04T00-06-02+00-00",
+        "2014_185/nested/2014-07-04T00-09-02+00-00",
+    ]
+    for p in paths:
+        (tmp_path / p).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / p).touch()
+    files = sfp.seaflowfile.scan_evt_files(str(tmp_path), max_workers=2)
+    assert files["path"].tolist() == [str(tmp_path / p) for p in [paths[2], paths[1], paths[0]]]
+    opp_files = sfp.seaflowfile.scan_evt_files(str(tmp_path), opp=True)
+    assert opp_files["path"].tolist() == [str(tmp_path / paths[3])]
+
+    (tmp_path / "2014_185/2014-07-04T00-03-02+00-00.gz").touch()
+    with pytest.raises(sfp.errors.FileError):
+        _ = sfp.seaflowfile.scan_evt_files(str(tmp_path))
+    files = sfp.seaflowfile.scan_evt_files(str(tmp_path), check_duplicates=False)
+    assert len(files) == 4
+
 def test_timeselect_evt_files():
     raw_files = [
         "tests/testcruise_evt/2014_185/2014-07-04T00-00-02+00-00",
@@ -0,0 +1,117 @@
+import os
+import shutil
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+import seaflowpy as sfp
+
+# pylint: disable=redefined-outer-name
+
+evt_dir = "tests/testcruise_evt"
+
+
+@pytest.fixture()
+def service():
+    s = sfp.service.Service(process_count=2)
+    yield s
+    s.close()
+
+
+@pytest.fixture()
+def server(service):
+    # Bind to any free port instead of the default
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), sfp.service._RequestHandler)  # pylint: disable=protected-access
+    httpd.service = service
+    httpd.verbose = False
+    t = threading.Thread(target=httpd.serve_forever)
+    t.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    t.join()
+    httpd.server_close()
+
+
+def test_count_matches_fileio(service):
+    # Directories are expanded to absolute paths
+    files = sfp.seaflowfile.find_evt_files(os.path.abspath(evt_dir))
+    assert service.count([evt_dir]) == [sfp.fileio.count_file(f) for f in files]
+
+
+def test_validate_matches_fileio(service):
+    files = sfp.seaflowfile.find_evt_files(evt_dir)
+    assert service.validate(files) == [sfp.fileio.validate_file(f) for f in files]
+
+
+def test_catalog_rescans_changed_dirs(tmp_path):
+    root = tmp_path / "evt"
+    shutil.copytree(evt_dir, str(root))
+    catalog = sfp.service.Catalog()
+    first = catalog.get(str(root))
+    assert catalog.get(str(root)) is first  # unchanged, reuse listing
+    (root / "2014_185" / "2014-07-04T00-00-02+00-00").unlink()
+    second = catalog.get(str(root))
+    assert len(second) == len(first) - 1
+
+
+def test_unknown_operation(service):
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        service.handle("not_an_op", {})
+
+
+def test_request_round_trip(server):
+    host, port = server
+    status = sfp.service_client.request("status", host=host, port=port)
+    assert status["process_count"] == 2
+    counts = sfp.service_client.request("count", {"paths": [evt_dir]}, host=host, port=port)
+    assert sum(c["events"] for c in counts) == sum(
+        sfp.fileio.count_file(f)["events"] for f in sfp.seaflowfile.find_evt_files(evt_dir)
+    )
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        sfp.service_client.request("count", {"bad_param": 1}, host=host, port=port)
+
+
+def test_request_no_service():
+    with pytest.raises(sfp.errors.SeaFlowpyError):
+        sfp.service_client.request("status", port=1)
+
+
+def test_filter_in_warm_pool(service, tmp_path):
+    cruise = sfp.synthetic.cruise(str(tmp_path / "cruise"), file_count=25, events=2000, opp=False)
+    pool_pids = {p.pid for p in service._pool._pool}  # pylint: disable=protected-access
+    params = service.filter_params(cruise["db"])
+    result = service.filter(cruise["db"], cruise["evt_dir"], str(tmp_path / "opp"), every=100.0, sketches=True)
+    assert result["filtered"] == 25
+    # Filtering ran in the existing pool, no new worker processes
+    assert {p.pid for p in service._pool._pool} == pool_pids  # pylint: disable=protected-access
+    opp = sfp.db.get_opp_table(cruise["db"])
+    assert len(opp) == 25 * 3
+    assert len(sfp.db.get_sketch_table(cruise["db"])) > 0
+    assert len(list((tmp_path / "opp").glob("*.opp.parquet"))) == 2
+
+    # Filtering writes to the db but filter parameters are still cached
+    assert service.filter_params(cruise["db"]) is params
+    result = service.filter(cruise["db"], cruise["evt_dir"], str(tmp_path / "opp"), delta=True)
+    assert result["filtered"] == 0
+
+
+def test_filter_params_cache_follows_filter_table(service, tmp_path):
+    dbpath = sfp.synthetic.cruise(str(tmp_path / "cruise"), file_count=1, events=100, opp=False)["db"]
+    # Make sure new parameters saved below have a later date
+    with sqlite3.connect(dbpath) as con:
+        con.execute("UPDATE filter SET date = '2000-01-01T00:00:00+00:00'")
+    params = service.filter_params(dbpath)
+    assert service.filter_params(dbpath) is params
+    new_params = params.copy()
+    new_params["width"] = 1.0
+    sfp.db.save_filter_params(dbpath, new_params.to_dict("records"))
+    assert service.filter_params(dbpath)["width"].tolist() == [1.0] * 3
+
+
+def test_request_counter_threads(service):
+    threads = [threading.Thread(target=lambda: [service.handle("status", {}) for _ in range(200)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert service.requests == 1600
@@ -0,0 +1,434 @@
+import io
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+sfl_path = "tests/testcruise_evt/2014_185/2014-07-04T00-00-00+00-00.sfl"
+
+
+@pytest.fixture()
+def sfl_lines():
+    with open(sfl_path, "rb") as fh:
+        return fh.read().splitlines(keepends=True)
+
+
+def test_tail_reader_matches_read_file(tmp_path, sfl_lines):
+    path = tmp_path / "live.sfl"
+    path.write_bytes(b"".join(sfl_lines))
+    reader = sfp.sfl.SFLTailReader(str(path))
+    df = reader.read()
+    expected = sfp.sfl.read_file(sfl_path)
+    pd.testing.assert_frame_equal(df, expected)
+    assert reader.offset == path.stat().st_size
+    assert len(reader.read()) == 0
+
+
+def test_tail_reader_appends(tmp_path, sfl_lines):
+    path = tmp_path / "live.sfl"
+    # Header only, then header plus a partial line
+    path.write_bytes(sfl_lines[0])
+    reader = sfp.sfl.SFLTailReader(str(path))
+    assert len(reader.read()) == 0
+    partial = sfl_lines[1][:20]
+    with open(path, "ab") as fh:
+        fh.write(partial)
+    assert len(reader.read()) == 0
+    # Finish the partial line and add another
+    with open(path, "ab") as fh:
+        fh.write(sfl_lines[1][20:] + sfl_lines[2])
+    df = reader.read()
+    expected = sfp.sfl.read_file(sfl_path)
+    assert list(df.index) == [0, 1]
+    assert df["file"].tolist() == expected["file"].iloc[:2].tolist()
+    assert df["file_duration"].dtype == np.float64
+    # Repeated header lines are skipped
+    with open(path, "ab") as fh:
+        fh.write(sfl_lines[0] + sfl_lines[3])
+    df = reader.read()
+    assert list(df.index) == [2]
+    assert df["file"].tolist() == expected["file"].iloc[2:3].tolist()
+    assert reader.rows == 3
+
+
+def test_tail_reader_short_lines(tmp_path, sfl_lines):
+    # The header has a trailing NULL column missing from data lines
+    assert len(sfl_lines[0].split(b"\t")) == len(sfl_lines[1].split(b"\t")) + 1
+    path = tmp_path / "live.sfl"
+    path.write_bytes(sfl_lines[0])
+    reader = sfp.sfl.SFLTailReader(str(path))
+    reader.read()
+    expected = sfp.sfl.read_file(sfl_path)
+    for i in range(1, 3):
+        with open(path, "ab") as fh:
+            fh.write(sfl_lines[i])
+        df = reader.read()
+        pd.testing.assert_frame_equal(df, expected.iloc[i - 1:i])
+    # Fields past the header are dropped
+    with open(path, "ab") as fh:
+        fh.write(sfl_lines[3].rstrip(b"\r\n") + b"\tx\ty\r\n")
+    df = reader.read()
+    assert df["NULL"].tolist() == ["x"]
+    pd.testing.assert_frame_equal(df.drop(columns="NULL"), expected.iloc[2:3].drop(columns="NULL"))
+
+
+def test_tail_reader_truncated(tmp_path, sfl_lines):
+    path = tmp_path / "live.sfl"
+    path.write_bytes(b"".join(sfl_lines[:4]))
+    reader = sfp.sfl.SFLTailReader(str(path))
+    assert len(reader.read()) == 3
+    path.write_bytes(b"".join(sfl_lines[:2]))
+    df = reader.read()
+    assert list(df.index) == [0]
+    assert reader.rows == 1
+
+
+def test_merge_files(tmp_path):
+    src = sfp.sfl.fix(sfp.sfl.read_file(sfl_path))
+    # Two shards with interleaved dates and one shared file
+    a = src.iloc[[0, 2, 4]]
+    b = src.iloc[[1, 2, 3, 5]]
+    paths = [str(tmp_path / "a.sfl"), str(tmp_path / "b.sfl")]
+    sfp.sfl.save_to_file(a, paths[0])
+    sfp.sfl.save_to_file(b, paths[1])
+    out = str(tmp_path / "merged.sfl")
+    dups = sfp.sfl.merge_files(paths, out, chunksize=2)
+    merged = sfp.sfl.read_file(out)
+    assert merged["file"].tolist() == src["file"].iloc[:6].tolist()
+    assert dups == [(src["file"].iloc[2], 2)]
+
+
+def test_merge_files_unsorted(tmp_path):
+    src = sfp.sfl.fix(sfp.sfl.read_file(sfl_path))
+    path = str(tmp_path / "a.sfl")
+    sfp.sfl.save_to_file(src.iloc[[2, 1, 0]], path)
+    with pytest.raises(sfp.errors.FileError):
+        sfp.sfl.merge_files([path], str(tmp_path / "merged.sfl"))
+
+
+def test_tail_reader_state_replaced_file(tmp_path, sfl_lines):
+    path = tmp_path / "live.sfl"
+    path.write_bytes(b"".join(sfl_lines[:4]))
+    reader = sfp.sfl.SFLTailReader(str(path))
+    reader.read()
+    state = reader.state()
+    assert state["last_line"] == sfl_lines[3]
+    # Continue in a new reader
+    path.write_bytes(b"".join(sfl_lines[:6]))
+    reader = sfp.sfl.SFLTailReader(str(path))
+    reader.set_state(state)
+    df = reader.read()
+    assert list(df.index) == [3, 4]
+    # Same size file with different content is read from the start
+    path.write_bytes(b"".join(sfl_lines[:1] + sfl_lines[2:7]))
+    df = reader.read()
+    assert list(df.index) == [0, 1, 2, 3, 4]
+
+
+def test_new_rows_parses_dates():
+    df = pd.DataFrame({
+        "file": ["a", "b", "c", "d"],
+        "date": [
+            "2014-07-04T00:00:02.000+00:00",
+            "2014-07-04T00:03:02.000+00:00",
+            "bad date",
+            "2014-07-04T00:09:02.000+00:00"
+        ]
+    })
+    assert sfp.sfl.new_rows(df, "2014-07-04T00:03:02+00:00")["file"].tolist() == ["c", "d"]
+    assert sfp.sfl.new_rows(df, "2014-07-04T01:03:02+01:00")["file"].tolist() == ["c", "d"]
+    assert len(sfp.sfl.new_rows(df, None)) == 4
+
+
+def test_import_sfl_incremental(tmp_path, sfl_lines, monkeypatch):
+    path = tmp_path / "testcruise_740.sfl"
+    dbpath = str(tmp_path / "test.db")
+    runner = CliRunner()
+
+    path.write_bytes(b"".join(sfl_lines[:4]))
+    result = runner.invoke(cli, ["db", "import-sfl", "--incremental", str(path), dbpath])
+    assert result.exit_code == 0
+    assert len(sfp.db.get_sfl_table(dbpath)) == 3
+
+    # Only appended lines are parsed
+    parsed = []
+    parse = sfp.sfl.SFLTailReader._parse  # pylint: disable=protected-access
+
+    def spy(self, lines):
+        parsed.extend(lines)
+        return parse(self, lines)
+
+    monkeypatch.setattr(sfp.sfl.SFLTailReader, "_parse", spy)
+    with open(path, "ab") as fh:
+        fh.write(b"".join(sfl_lines[4:6]))
+    result = runner.invoke(cli, ["db", "import-sfl", "--incremental", str(path), dbpath])
+    assert result.exit_code == 0
+    assert len(parsed) == 2
+    expected = sfp.sfl.fix(sfp.sfl.read_file(sfl_path))
+    assert sfp.db.get_sfl_table(dbpath)["file"].tolist() == expected["file"].iloc[:5].tolist()
+    state = sfp.db.get_sfl_import_state(dbpath, str(path))
+    assert state["offset"] == path.stat().st_size
+    assert state["rows"] == 5
+
+    # Rows duplicating files or dates already in the db are errors
+    with open(path, "ab") as fh:
+        fh.write(sfl_lines[2] + sfl_lines[6])
+    result = runner.invoke(cli, ["db", "import-sfl", "--incremental", str(path), dbpath])
+    assert result.exit_code == 1
+    assert "Duplicate file already in database" in result.output
+    assert "Date not after latest date in database" in result.output
+    assert len(sfp.db.get_sfl_table(dbpath)) == 5
+    # Import progress is only saved after a successful import
+    assert sfp.db.get_sfl_import_state(dbpath, str(path)) == state
+
+
+def test_import_sfl_incremental_single_line(tmp_path, sfl_lines):
+    # Usual case of one 20 field line appended under a 21 field header
+    path = tmp_path / "testcruise_740.sfl"
+    dbpath = str(tmp_path / "test.db")
+    runner = CliRunner()
+    path.write_bytes(sfl_lines[0])
+    result = runner.invoke(cli, ["db", "import-sfl", "--incremental", str(path), dbpath])
+    assert result.exit_code == 0, result.output
+    expected = sfp.sfl.fix(sfp.sfl.read_file(sfl_path))
+    for i in range(1, 4):
+        assert len(sfl_lines[i].split(b"\t")) == len(sfl_lines[0].split(b"\t")) - 1
+        with open(path, "ab") as fh:
+            fh.write(sfl_lines[i])
+        result = runner.invoke(cli, ["db", "import-sfl", "--incremental", str(path), dbpath])
+        assert result.exit_code == 0, result.output
+        assert sfp.db.get_sfl_table(dbpath)["file"].tolist() == expected["file"].iloc[:i].tolist()
+    assert sfp.db.get_sfl_import_state(dbpath, str(path))["rows"] == 3
+
+
+def test_import_sfl_incremental_after_full_import(tmp_path, sfl_lines):
+    path = tmp_path / "testcruise_740.sfl"
+    dbpath = str(tmp_path / "test.db")
+    runner = CliRunner()
+    path.write_bytes(b"".join(sfl_lines[:4]))
+    result = runner.invoke(cli, ["db", "import-sfl", str(path), dbpath])
+    assert result.exit_code == 0
+    assert sfp.db.get_sfl_import_state(dbpath, str(path)) is None
+    # No saved progress, rows after the latest db date are imported
+    with open(path, "ab") as fh:
+        fh.write(b"".join(sfl_lines[4:6]))
+    result = runner.invoke(cli, ["db", "import-sfl", "--incremental", str(path), dbpath])
+    assert result.exit_code == 0
+    assert len(sfp.db.get_sfl_table(dbpath)) == 5
+    assert sfp.db.get_sfl_import_state(dbpath, str(path))["rows"] == 5
+
+
+@pytest.fixture()
+def sfl_df():
+    df = sfp.sfl.fix(sfp.sfl.read_file(sfl_path))
+    df["conductivity"] = 5.0
+    assert len(sfp.sfl.check(df)) == 0
+    return df
+
+
+def error_tuples(errors):
+    """Errors as tuples of error_columns values, with NaN values as None"""
+    return [
+        tuple(None if isinstance(v, float) and np.isnan(v) else v for v in e)
+        for e in errors[sfp.sfl.error_columns].itertuples(index=False, name=None)
+    ]
+
+
+def test_check_bad_file_ids(sfl_df):
+    sfl_df.loc[1, "file"] = "not_a_file"
+    sfl_df.loc[2, "file"] = "2014-07-04T00-06-02+00-00"  # no day of year directory
+    errors = sfp.sfl.check(sfl_df)
+    assert error_tuples(errors) == [
+        ("file", "Invalid file name", 3, "not_a_file", "error"),
+        ("file", "Invalid file name", 4, "2014-07-04T00-06-02+00-00", "error"),
+    ]
+
+
+def test_check_bad_dates(sfl_df):
+    sfl_df.loc[1, "date"] = "2014-07-04T00:03:02Z"
+    sfl_df.loc[2, "date"] = "2014-02-30T00:06:02+00:00"
+    sfl_df.loc[3, "date"] = np.nan
+    errors = sfp.sfl.check(sfl_df)
+    files = sfl_df["file"]
+    assert error_tuples(errors) == [
+        ("file/date", "File and date don't match", 3, files[1] + " 2014-07-04T00:03:02Z", "error"),
+        ("file/date", "File and date don't match", 4, files[2] + " 2014-02-30T00:06:02+00:00", "error"),
+        ("file/date", "File and date don't match", 5, files[3] + " nan", "error"),
+        ("date", "Invalid date format", 3, "2014-07-04T00:03:02Z", "error"),
+        ("date", "Invalid date format", 4, "2014-02-30T00:06:02+00:00", "error"),
+        ("date", "Invalid date format", 5, None, "error"),
+    ]
+
+
+def test_check_out_of_order(sfl_df):
+    sfl_df = sfl_df.iloc[[0, 1, 3, 2, 4, 5]].reset_index(drop=True)
+    errors = sfp.sfl.check(sfl_df)
+    assert error_tuples(errors) == [
+        ("file", "Files out of order", 4, "First out of order file " + sfl_df.loc[2, "file"], "error"),
+    ]
+
+
+def test_check_duplicates(sfl_df):
+    sfl_df = sfl_df.iloc[[0, 1, 2, 2, 3]].reset_index(drop=True)
+    errors = sfp.sfl.check(sfl_df)
+    dup = sfl_df.loc[2, "file"]
+    assert error_tuples(errors) == [
+        ("file", "Duplicate file", 4, dup, "error"),
+        ("file", "Duplicate file", 5, dup, "error"),
+    ]
+
+
+def test_check_na_and_range(sfl_df):
+    sfl_df.loc[1, "lat"] = np.nan
+    sfl_df.loc[2, "file_duration"] = np.nan
+    sfl_df.loc[3, "event_rate"] = -1.0
+    sfl_df.loc[4, "lon"] = 200.0
+    sfl_df["par"] = np.nan
+    errors = sfp.sfl.check(sfl_df)
+    assert error_tuples(errors) == [
+        ("file_duration", "Missing required data", 4, None, "error"),
+        ("lat", "Missing data", 3, None, "warning"),
+        ("lon", "Invalid lon", 6, 200.0, "error"),
+        ("par", "par column has no data", None, None, "warning"),
+        ("event_rate", "Invalid event_rate", 5, -1.0, "error"),
+    ]
+    # Missing required columns
+    errors = sfp.sfl.check(sfl_df.drop(columns=["stream_pressure"]))
+    assert ("stream_pressure", "stream_pressure column is missing", None, None, "error") in error_tuples(errors)
+
+
+def test_print_errors(sfl_df):
+    sfl_df.loc[1, "event_rate"] = -1.0
+    sfl_df.loc[2, "event_rate"] = -2.0
+    sfl_df.loc[3, "lat"] = np.nan
+    errors = sfp.sfl.check(sfl_df)
+
+    fh = io.StringIO()
+    sfp.sfl.print_json_errors(errors, fh, "test.sfl")
+    output = json.loads(fh.getvalue())
+    # Missing values are written as NaN
+    assert np.isnan(output[0].pop("value"))
+    assert output == [
+        {"column": "lat", "file": "test.sfl", "level": "warning", "line (1-based)": 5, "message": "Missing data"},
+        {"column": "event_rate", "file": "test.sfl", "level": "error", "line (1-based)": 3, "message": "Invalid event_rate", "value": -1.0},
+        {"column": "event_rate", "file": "test.sfl", "level": "error", "line (1-based)": 4, "message": "Invalid event_rate", "value": -2.0},
+    ]
+    # Only the first error for each column and message
+    fh = io.StringIO()
+    sfp.sfl.print_json_errors(errors, fh, "test.sfl", print_all=False)
+    assert [e["line (1-based)"] for e in json.loads(fh.getvalue())] == [5, 3]
+
+    fh = io.StringIO()
+    sfp.sfl.print_tsv_errors(errors, fh, "test.sfl", print_all=False)
+    assert fh.getvalue().splitlines() == [
+        "column\tfile\tlevel\tline (1-based)\tmessage\tvalue",
+        "lat\ttest.sfl\twarning\t5\tMissing data\tnan",
+        "event_rate\ttest.sfl\terror\t3\tInvalid event_rate\t-1.0",
+    ]
+    fh = io.StringIO()
+    sfp.sfl.print_tsv_errors(errors, fh, "test.sfl", header=False)
+    assert len(fh.getvalue().splitlines()) == 3
+
+
+def test_fix_event_rate_inputs(sfl_df):
+    files = sfl_df["file"]
+    counts = {files[0]: 18006, files[1]: 36010, files[2]: 0}
+    expected = sfl_df["event_rate"].copy()
+    expected[:3] = [18006 / 180.062, 36010 / 180.052, 0.0]
+
+    by_dict = sfp.sfl.fix_event_rate(sfl_df, counts)
+    by_series = sfp.sfl.fix_event_rate(sfl_df, pd.Series(counts))
+    # opp table style input, with all_count repeated for each quantile
+    opp = pd.DataFrame({
+        "file": [f for f in counts for _ in range(3)],
+        "all_count": [c for c in counts.values() for _ in range(3)],
+        "quantile": [2.5, 50, 97.5] * len(counts)
+    })
+    by_opp = sfp.sfl.fix_event_rate(sfl_df, opp)
+    for df in [by_dict, by_series, by_opp]:
+        assert df["event_rate"].tolist() == pytest.approx(expected.tolist())
+        assert df.drop(columns=["event_rate"]).equals(sfl_df.drop(columns=["event_rate"]))
+    # Input is not modified
+    assert (sfl_df["event_rate"] == 0).all()
+
+
+def test_fix_event_rate_first_count_used(sfl_df):
+    files = sfl_df["file"]
+    opp = pd.DataFrame({"file": [files[0], files[0]], "all_count": [1000, 2000]})
+    df = sfp.sfl.fix_event_rate(sfl_df, opp)
+    assert df.loc[0, "event_rate"] == pytest.approx(1000 / 180.062)
+
+
+def test_fix_event_rate_na(sfl_df):
+    files = sfl_df["file"]
+    sfl_df["event_rate"] = 100.0
+    sfl_df.loc[1, "file_duration"] = 0
+    sfl_df.loc[2, "file_duration"] = -1
+    sfl_df.loc[3, "file_duration"] = np.nan
+    counts = {
+        files[0]: None,  # NA count keeps existing event rate
+        files[1]: 1000,
+        files[2]: 1000,
+        files[3]: 1000,
+        files[4]: "not a number",
+        files[5]: 1800,
+    }
+    df = sfp.sfl.fix_event_rate(sfl_df, counts)
+    rates = df["event_rate"].tolist()
+    assert rates[0] == 100.0
+    assert rates[1] == 0.0  # zero duration
+    assert np.isnan(rates[2])  # negative duration
+    assert np.isnan(rates[3])  # NA duration
+    assert rates[4] == 100.0
+    assert rates[5] == pytest.approx(1800 / 180.021)
+    # Files without a count are unchanged
+    assert rates[6:] == [100.0, 100.0]
+
+
+def test_get_event_counts(tmp_path, sfl_df):
+    dbpath = str(tmp_path / "test.db")
+    shutil.copy("tests/testcruise_paramsonly.db", dbpath)
+    old_id = sfp.db.get_latest_filter(dbpath).loc[0, "id"]
+    params = sfp.db.get_filter_table(dbpath).drop(columns=["id", "date"])
+    sfp.db.save_filter_params(dbpath, params.to_dict("records"))
+    new_id = sfp.db.get_latest_filter(dbpath).loc[0, "id"]
+    assert new_id != old_id
+
+    files = sfl_df["file"]
+    vals = []
+    for filter_id, all_count in [(old_id, 9999), (new_id, 1000)]:
+        for i, q in enumerate([2.5, 50, 97.5]):
+            for f in files[:3]:
+                vals.append({
+                    "file": f, "all_count": all_count + i, "opp_count": 10,
+                    "evt_count": 100, "opp_evt_ratio": 0.1,
+                    "filter_id": filter_id, "quantile": q
+                })
+    # A file with results only for old filter parameters
+    vals.append({
+        "file": files[3], "all_count": 9999, "opp_count": 10, "evt_count": 100,
+        "opp_evt_ratio": 0.1, "filter_id": old_id, "quantile": 50
+    })
+    sfp.db.save_opp_to_db(vals, dbpath)
+
+    counts = sfp.db.get_event_counts(dbpath)
+    assert counts == {f: 1000 for f in files[:3]}
+
+    sfl_path_ = tmp_path / "test.sfl"
+    sfp.sfl.save_to_file(sfl_df, str(sfl_path_))
+    result = CliRunner().invoke(cli, ["sfl", "fix-event-rate", str(sfl_path_), dbpath])
+    assert result.exit_code == 0, result.output
+    out_path = tmp_path / "out.sfl"
+    out_path.write_text(result.output)
+    df = sfp.sfl.fix(sfp.sfl.read_file(str(out_path)))
+    # Event rates are written with 4 decimal places
+    assert df["event_rate"].tolist() == pytest.approx(
+        [1000 / d for d in sfl_df["file_duration"][:3]] + [0.0] * (len(sfl_df) - 3),
+        abs=1e-4
+    )
@@ -0,0 +1,88 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+import seaflowpy as sfp
+from click.testing import CliRunner
+from seaflowpy.cli.cli import cli
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture()
+def evt_df():
+    df = sfp.synthetic.evt(20000, seed=1)
+    return sfp.particleops.mark_focused(df, sfp.synthetic.filter_params.assign(id="synthetic"))
+
+
+def test_file_sketches(evt_df):
+    layers, counts = sfp.sketch.file_sketches(evt_df, bins=64)
+    assert layers == ["evt", "q2.5", "q50", "q97.5"]
+    assert counts.shape == (4, len(sfp.sketch.channels), 64)
+    assert counts.dtype == np.uint32
+    edges = np.linspace(0, 2**16, 65)
+    signal = evt_df[~evt_df["noise"]]
+    q50 = evt_df[evt_df["q50"]]
+    for c, channel in enumerate(sfp.sketch.channels):
+        npt.assert_array_equal(counts[0, c], np.histogram(signal[channel], bins=edges)[0])
+        npt.assert_array_equal(counts[2, c], np.histogram(q50[channel], bins=edges)[0])
+
+
+def test_percentile_values(evt_df):
+    _, counts = sfp.sketch.file_sketches(evt_df)
+    pvals = sfp.sketch.percentile_values(counts)
+    assert pvals.shape == (4, len(sfp.sketch.channels), len(sfp.sketch.percentiles))
+    width = 2**16 / sfp.sketch.default_bins
+    signal = evt_df[~evt_df["noise"]]
+    for c, channel in enumerate(sfp.sketch.channels):
+        expected = np.percentile(signal[channel], sfp.sketch.percentiles)
+        npt.assert_allclose(pvals[0, c], expected, atol=width)
+    empty = sfp.sketch.percentile_values(np.zeros((2, 16)), [50])
+    assert np.isnan(empty).all()
+
+
+def test_merge_is_additive(evt_df):
+    a = evt_df.iloc[:10000]
+    b = evt_df.iloc[10000:]
+    _, counts_all = sfp.sketch.file_sketches(evt_df)
+    _, counts_a = sfp.sketch.file_sketches(a)
+    _, counts_b = sfp.sketch.file_sketches(b)
+    npt.assert_array_equal(counts_a + counts_b, counts_all)
+    blob = sfp.sketch.to_blob(counts_a[2, 0])
+    npt.assert_array_equal(sfp.sketch.from_blob(blob), counts_a[2, 0])
+
+
+def test_filter_sketches(tmp_path):
+    cruise = sfp.synthetic.cruise(str(tmp_path / "cruise"), file_count=25, events=5000, opp=False)
+    files_df = sfp.seaflowfile.date_evt_files(cruise["evt_files"], sfp.db.get_sfl_table(cruise["db"]))
+    sfp.filterevt.filter_evt_files(files_df, cruise["db"], str(tmp_path / "opp"), every=100.0, sketches=True)
+
+    df = sfp.db.get_sketch_table(cruise["db"])
+    # 25 files 3 minutes apart span two hourly windows
+    assert df["window_start"].nunique() == 2
+    assert len(df) == 2 * 4 * len(sfp.sketch.channels)
+    assert (df["filter_id"] == sfp.db.get_latest_filter(cruise["db"])["id"][0]).all()
+
+    opp = sfp.db.get_opp_table(cruise["db"])
+    opp50 = opp[opp["quantile"] == 50]
+    merged = sfp.sketch.merge_table(df).set_index(["layer", "channel"])
+    assert merged.loc[("evt", "fsc_small"), "count"] == opp50["evt_count"].sum()
+    assert merged.loc[("q50", "pe"), "count"] == opp50["opp_count"].sum()
+    assert merged.loc[("q50", "pe"), "counts"].dtype == np.uint64
+
+    q50 = sfp.db.get_sketch_table(cruise["db"], layer="q50", channel="pe")
+    assert len(q50) == 2
+    assert q50["count"].sum() == opp50["opp_count"].sum()
+    assert (q50["p25"] <= q50["p50"]).all() and (q50["p50"] <= q50["p75"]).all()
+
+
+def test_filter_cmd_sketches_opt_in(tmp_path):
+    cruise = sfp.synthetic.cruise(str(tmp_path / "cruise"), file_count=5, events=2000, opp=False)
+    args = ["filter", "local", "-d", cruise["db"], "-e", cruise["evt_dir"], "-o", str(tmp_path / "opp")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert len(sfp.db.get_opp_table(cruise["db"])) == 5 * 3
+    assert len(sfp.db.get_sketch_table(cruise["db"])) == 0
+
+    result = CliRunner().invoke(cli, args + ["--sketches"])
+    assert result.exit_code == 0, result.output
+    assert len(sfp.db.get_sketch_table(cruise["db"])) == 4 * len(sfp.sketch.channels)
@@ -0,0 +1,44 @@
+import pandas as pd
+import seaflowpy as sfp
+
+
+def test_evt_deterministic():
+    df = sfp.synthetic.evt(5000, seed=1)
+    assert len(df) == 5000
+    assert list(df.columns) == sfp.particleops.COLUMNS
+    pd.testing.assert_frame_equal(df, sfp.synthetic.evt(5000, seed=1))
+    assert not df.equals(sfp.synthetic.evt(5000, seed=2))
+
+
+def test_evt_populations():
+    df = sfp.synthetic.evt(20000, seed=0)
+    params = sfp.synthetic.filter_params.copy()
+    params["id"] = "synthetic"
+    df = sfp.particleops.mark_focused(df, params)
+    assert 0 < df["noise"].sum() < len(df)
+    assert 0 < df["saturated"].sum() < len(df)
+    for q in ["q2.5", "q50", "q97.5"]:
+        assert 0 < df[q].sum() < len(df)
+
+
+def test_evt_beads_found():
+    df = sfp.synthetic.evt(50000, seed=0)
+    results = sfp.beads.find_beads(df)
+    coords = results["bead_coordinates"].iloc[0]
+    for col in ["fsc_small", "D1", "D2"]:
+        expected = sfp.synthetic.bead_center[col]
+        assert abs(coords[col + "_2Q"] - expected) < expected * 0.05
+
+
+def test_cruise(tmp_path):
+    c = sfp.synthetic.cruise(str(tmp_path), file_count=4, events=1000)
+    evt_files = sfp.seaflowfile.find_evt_files(c["evt_dir"])
+    assert evt_files == c["evt_files"]
+    assert [f.endswith(".gz") for f in evt_files] == [True, False, True, False]
+    for f in evt_files:
+        assert sfp.fileio.validate_file(f)["status"] == "OK"
+    assert len(sfp.seaflowfile.find_evt_files(c["opp_dir"], opp=True)) == 4
+    assert len(sfp.sfl.check(sfp.sfl.read_file(c["sfl"]))) == 0
+    assert sfp.db.get_cruise(c["db"]) == "synthetic"
+    assert len(sfp.db.get_sfl_table(c["db"])) == 4
+    assert len(sfp.db.get_latest_filter(c["db"])) == 3